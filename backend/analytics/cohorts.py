@@ -0,0 +1,177 @@
+# Cohort retention analytics.
+# Every video's retention curve (see RetentionProfile) is resampled onto the
+# same COHORT_POSITIONS relative positions and stacked into one NumPy matrix,
+# so each cohort (source, duration bucket) is summarized with a handful of
+# vectorized calls: percentile bands and median per position, and outliers by
+# average retention. The result is cached and keyed by the sum of every
+# video's engagement_version, so any new engagement invalidates it.
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import RetentionProfile, Video
+
+DEFAULT_POSITIONS = 100
+DEFAULT_DURATION_BUCKETS = [60, 300, 1200, 3600]  # Upper bounds in seconds; the last bucket is open-ended
+DEFAULT_CACHE_SECONDS = 3600
+
+BAND_PERCENTILES = [10, 25, 50, 75, 90]
+
+# Tukey fences: outliers sit more than this many IQRs outside the middle half
+OUTLIER_IQR = 1.5
+
+
+def positions():
+    return getattr(settings, 'COHORT_POSITIONS', DEFAULT_POSITIONS)
+
+
+def duration_bucket_labels():
+    bounds = getattr(settings, 'COHORT_DURATION_BUCKETS', DEFAULT_DURATION_BUCKETS)
+    edges = [0] + list(bounds)
+    return [f"{lo}-{hi}s" for lo, hi in zip(edges, edges[1:])] + [f"{edges[-1]}s+"]
+
+
+def resample(curve, size):
+    """Linearly resamples a curve onto `size` evenly spaced relative positions."""
+    curve = np.asarray(curve, dtype=np.float32)
+    if len(curve) == size:
+        return curve
+    # Sample at bucket centres so short and long curves line up
+    old = (np.arange(len(curve)) + 0.5) / len(curve)
+    new = (np.arange(size) + 0.5) / size
+    return np.interp(new, old, curve).astype(np.float32)
+
+
+def percentile_rank(matrix, values):
+    """Per column, the percentage of rows below `values` (ties count half)."""
+    below = (matrix < values).sum(axis=0)
+    equal = (matrix == values).sum(axis=0)
+    return (below + 0.5 * equal) * 100.0 / len(matrix)
+
+
+def cache_key():
+    """Changes whenever any video's engagement changes or videos are added or removed."""
+    totals = Video.objects.aggregate(versions=Sum('engagement_version'), videos=Count('video_id'))
+    return f"cohorts:{positions()}:{totals['videos']}:{totals['versions'] or 0}"
+
+
+def load_matrix():
+    """
+    Returns:
+        tuple: (video_ids, sources, durations, matrix) where matrix has one
+               resampled retention curve per row.
+    """
+    size = positions()
+    rows = RetentionProfile.objects.exclude(curve=[]).values_list('video_id', 'video__source', 'duration', 'curve')
+    video_ids, sources, durations, curves = [], [], [], []
+    for video_id, source, duration, curve in rows.iterator():
+        video_ids.append(video_id)
+        sources.append(source)
+        durations.append(duration)
+        curves.append(resample(curve, size))
+    matrix = np.vstack(curves) if curves else np.empty((0, size), dtype=np.float32)
+    return video_ids, sources, np.asarray(durations, dtype=np.float64), matrix
+
+
+def summarize(matrix, video_ids):
+    """Percentile bands, median and average-retention outliers for one cohort's rows."""
+    bands = np.percentile(matrix, BAND_PERCENTILES, axis=0)
+    average = matrix.mean(axis=1)
+    q1, q3 = np.percentile(average, [25, 75])
+    spread = OUTLIER_IQR * (q3 - q1)
+    flagged = np.flatnonzero((average < q1 - spread) | (average > q3 + spread))
+    return {
+        'videos': len(video_ids),
+        'median': np.round(bands[BAND_PERCENTILES.index(50)], 4).tolist(),
+        'bands': {f"p{p}": np.round(band, 4).tolist() for p, band in zip(BAND_PERCENTILES, bands)},
+        'outliers': [
+            {
+                'video_id': video_ids[index],
+                'average_retention': round(float(average[index]), 4),
+                'direction': 'above' if average[index] > q3 else 'below',
+            }
+            for index in flagged
+        ],
+    }
+
+
+def build():
+    """Computes every cohort from scratch."""
+    video_ids, sources, durations, matrix = load_matrix()
+    labels = duration_bucket_labels()
+    bounds = getattr(settings, 'COHORT_DURATION_BUCKETS', DEFAULT_DURATION_BUCKETS)
+    duration_index = np.digitize(durations, bounds, right=True)
+
+    cohort_of = [f"{source}:{labels[index]}" for source, index in zip(sources, duration_index)]
+    members = {}
+    for row, key in enumerate(cohort_of):
+        members.setdefault(key, []).append(row)
+    members = {key: np.asarray(rows) for key, rows in members.items()}
+
+    cohorts = {}
+    for key, rows in sorted(members.items()):
+        source, bucket = key.split(':', 1)
+        cohorts[key] = {
+            'source': source,
+            'duration_bucket': bucket,
+            **summarize(matrix[rows], [video_ids[row] for row in rows]),
+        }
+    return {
+        'positions': matrix.shape[1],
+        'cohorts': cohorts,
+        # Kept for per-video rankings
+        'rows': {video_id: row for row, video_id in enumerate(video_ids)},
+        'cohort_of': cohort_of,
+        'members': members,
+        'durations': durations,
+        'matrix': matrix,
+    }
+
+
+def get_cohorts():
+    """The cohort analysis for the current engagement version, cached."""
+    key = cache_key()
+    result = cache.get(key)
+    if result is None:
+        result = build()
+        cache.set(key, result, getattr(settings, 'COHORT_CACHE_SECONDS', DEFAULT_CACHE_SECONDS))
+    return result
+
+
+def video_ranking(video_id, second=None):
+    """
+    Where a video's retention sits within its cohort, position by position,
+    plus the details at one point of the video if `second` is given.
+
+    Returns:
+        dict: cohort key and size, the video's curve, its percentile ranks and
+              the cohort median, or None if the video has no retention curve yet.
+    """
+    result = get_cohorts()
+    row = result['rows'].get(video_id)
+    if row is None:
+        return None
+    key = result['cohort_of'][row]
+    curve = result['matrix'][row]
+    percentiles = percentile_rank(result['matrix'][result['members'][key]], curve)
+    median = result['cohorts'][key]['median']
+    ranking = {
+        'cohort': key,
+        'cohort_videos': len(result['members'][key]),
+        'curve': np.round(curve, 4).tolist(),
+        'percentile': np.round(percentiles, 1).tolist(),
+        'median': median,
+    }
+    if second is not None:
+        duration = result['durations'][row]
+        position = min(max(int(second / duration * len(curve)), 0), len(curve) - 1)
+        ranking['at_second'] = {
+            'second': second,
+            'position': position,
+            'retention': round(float(curve[position]), 4),
+            'percentile': round(float(percentiles[position]), 1),
+            'cohort_median': median[position],
+        }
+    return ranking
@@ -1,132 +1,278 @@
 import json
 import asyncio
+import math
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Video
+from django.conf import settings
 from .ml_model import predict_revenue # Import our new ML model
-import math
+from .engagement import apply_engagement_batch, record_viewers
+from .live_cache import live_cache
+from .counters import add_play
+from .event_log import EVENT_TYPES, write_async
+from .profiling import profile
+
+
+def finite_float(value):
+    """A player-reported time as a finite float, or None if it isn't one (null, "abc", NaN)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
 
 class EngagementConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.video_id = self.scope['url_route']['kwargs']['video_id']
-        self.video_group_name = f'video_{self.video_id}'
-
-        await self.channel_layer.group_add(
-            self.video_group_name,
-            self.channel_name
-        )
         await self.accept()
         print(f"WebSocket connected for video: {self.video_id}")
 
         # Increment play_count when a new connection is made
         await self.increment_play_count()
 
+        # Timeupdates and new viewer sessions waiting for the next flush, plus
+        # every accepted raw event for the append-only event log. The connect
+        # record waits for the first message, which carries the client's session ID.
+        self.pending_events = []
+        self.pending_sessions = set()
+        self.pending_log = []
+        self.connected_at = time.time()
+        self.session_id = None
+
+        # Heatmap deltas are tracked per connection: each live_update carries the
+        # seconds that changed since this socket's previous update plus a sequence
+        # number, and a heatmap_snapshot (sent now and on "resync") resets the baseline.
+        # heatmap_version is the live cache version this socket has already seen.
+        self.heatmap_seq = 0
+        self.heatmap_version = 0
+        self.heatmap_lock = asyncio.Lock()  # Keeps snapshots and deltas from interleaving
+        await self.send_heatmap_snapshot()
+
         # Start a background task to periodically send updates
         self.updater_task = asyncio.create_task(self.send_live_updates())
 
     async def disconnect(self, close_code):
         # Stop the background task when the user disconnects
         self.updater_task.cancel()
-        await self.channel_layer.group_discard(
-            self.video_group_name,
-            self.channel_name
-        )
+        self.log_connect()
+        await self.flush_engagement()
         print(f"WebSocket disconnected for video: {self.video_id}")
 
     async def receive(self, text_data):
+        with profile('EngagementConsumer.receive', self.video_id):
+            await self.handle_event(text_data)
+
+    async def handle_event(self, text_data):
         event = json.loads(text_data)
         event_type = event.get("event")
 
+        # Clients identify themselves with a stable session ID so reconnects
+        # don't count as new viewers; each ID is recorded once per connection
+        session_id = str(event.get("sessionId") or '')[:100]
+        if session_id and session_id != self.session_id:
+            self.session_id = session_id
+            self.pending_sessions.add(session_id)
+
+        current_time = finite_float(event.get("currentTime", 0))
+        duration = finite_float(event.get("duration", 0))
+        if event_type == "timeupdate" and (current_time is None or duration is None):
+            # Dropped here, on its own: once buffered it would fail the whole batch
+            # (and it is left out of the event log, so replay agrees with the live path)
+            print(f"Dropping timeupdate with invalid times for video {self.video_id}")
+            return
+
+        self.log_connect()
+        if event_type in EVENT_TYPES and event_type != "connect":
+            # Other events are kept; a time the player didn't know yet (duration is
+            # NaN until metadata loads) is logged as 0
+            self.pending_log.append((time.time(), event_type, current_time or 0.0, duration or 0.0, self.session_id))
+
         if event_type == "timeupdate":
-            current_time = event.get("currentTime", 0)
-            # Add this line to get duration from the event
-            duration = event.get("duration", 0)
-            # Pass duration to the update function
-            await self.update_engagement_data(current_time, duration)
-            
+            # Buffered and written once per tick, so a busy socket costs one transaction every 2 seconds
+            self.pending_events.append((current_time, duration))
+        elif event_type == "resync":
+            # The client missed a delta (or lost its state) and wants the full heatmap
+            await self.send_heatmap_snapshot()
+
     # --- New Methods for Broadcasting ---
 
     async def send_live_updates(self):
-        """Periodically fetches data and sends it to the group."""
+        """Periodically sends stats plus heatmap deltas to this socket."""
         while True:
             await asyncio.sleep(2) # Send updates every 2 seconds
-            
-            # Get the latest data from the database
-            video_data = await self.get_video_data()
-            
-            # Get an ML prediction
-            prediction = predict_revenue({
-                'total_watch_time': video_data.get('total_watch_time', 0),
-                'heatmap': video_data.get('engagement_data', {}).get('heatmap', {})
-            })
-
-            payload = {
-                'type': 'live_update', # This is a custom event type for our handler
-                'total_watch_time': round(video_data.get('total_watch_time', 0), 2),
-                'predicted_revenue': prediction,
-                # In a real app, you could add more (e.g., live viewer count)
-            }
-            
-            # Send the payload to the entire group
-            await self.channel_layer.group_send(
-                self.video_group_name,
-                {
-                    'type': 'broadcast_stats',
-                    'payload': payload
+
+            await self.flush_engagement()
+
+            async with self.heatmap_lock:
+                # Served from the per-process live cache, which the write path keeps current
+                stats = await self.get_live_stats(self.heatmap_version)
+                if stats is None:
+                    continue
+                if stats['heatmap_delta'] is None:
+                    # The cache entry was reloaded since our baseline
+                    await self._send_snapshot()
+                    continue
+
+                # Get an ML prediction
+                prediction = predict_revenue(stats['revenue_inputs'])
+
+                self.heatmap_seq += 1
+                self.heatmap_version = stats['version']
+                payload = {
+                    'type': 'live_update', # This is a custom event type for our handler
+                    'seq': self.heatmap_seq,
+                    'total_watch_time': round(stats['total_watch_time'], 2),
+                    'predicted_revenue': prediction,
+                    'heatmap_delta': stats['heatmap_delta'],
                 }
-            )
 
-    async def broadcast_stats(self, event):
-        """Handler for the group_send call. Sends a message to the WebSocket."""
-        await self.send(text_data=json.dumps(event['payload']))
-        
-    # --- Database Methods ---
+                # Deltas are relative to what this socket has already seen
+                await self.send(text_data=json.dumps(payload))
 
-    @database_sync_to_async
-    def get_video_data(self):
-        """Fetches the latest video data from the DB."""
-        try:
-            video = Video.objects.get(video_id=self.video_id)
-            return {
-                'total_watch_time': video.total_watch_time,
-                'engagement_data': video.engagement_data
-            }
-        except Video.DoesNotExist:
-            return None
+    async def get_live_stats(self, since_version=None):
+        """
+        Live stats from the cache: a full snapshot when since_version is None,
+        otherwise the changes after it. Only a cache miss touches the DB.
+        """
+        for _ in range(2):
+            if since_version is None:
+                stats = live_cache.snapshot(self.video_id)
+            else:
+                stats = live_cache.changes(self.video_id, since_version)
+            if stats is not None:
+                return stats
+            if not await database_sync_to_async(live_cache.load)(self.video_id):
+                return None
+        return None
+
+    async def send_heatmap_snapshot(self):
+        """Sends the full heatmap and makes it the baseline for the next delta."""
+        async with self.heatmap_lock:
+            await self._send_snapshot()
+
+    async def _send_snapshot(self):
+        stats = await self.get_live_stats()
+        heatmap = stats['heatmap'] if stats else {}
+        self.heatmap_version = stats['version'] if stats else 0
+        await self.send(text_data=json.dumps({
+            'type': 'heatmap_snapshot',
+            'seq': self.heatmap_seq,
+            'heatmap': heatmap,
+            'resolution': stats['resolution'] if stats else 1,
+        }))
+
+    # --- Database Methods ---
 
     @database_sync_to_async
     def increment_play_count(self):
         try:
-            video, _ = Video.objects.get_or_create(video_id=self.video_id)
-            video.play_count = (video.play_count or 0) + 1
-            video.save()
+            add_play(self.video_id)
         except Exception as e:
             print(f"Error incrementing play count: {e}")
 
+    def log_connect(self):
+        """Buffers the connect record once, tagged with the session known by now (if any)."""
+        if self.connected_at is not None:
+            self.pending_log.append((self.connected_at, 'connect', 0, 0, self.session_id))
+            self.connected_at = None
+
     @database_sync_to_async
-    def update_engagement_data(self, current_time, duration): # Add duration to the signature
-        """Updates watch time and the engagement heatmap in the DB."""
+    def apply_engagement(self, events, session_ids):
+        """Applies buffered timeupdates (watch time, heatmap, retention) and viewer sessions."""
         try:
-            # Use get_or_create to handle new videos gracefully
-            video, created = Video.objects.get_or_create(video_id=self.video_id)
-            
-            # --- NEW: Update duration if it's not set and is valid ---
-            if video.duration is None and duration > 0:
-                video.duration = duration
-
-            # Increment watch time (assuming 1-second interval updates)
-            video.total_watch_time = (video.total_watch_time or 0) + 1
-
-            # Increment engagement event count
-            video.engagement_event_count = (video.engagement_event_count or 0) + 1
-
-            # Update heatmap
-            time_key = str(math.floor(current_time))
-            heatmap = video.engagement_data.get('heatmap', {})
-            heatmap[time_key] = heatmap.get(time_key, 0) + 1
-            video.engagement_data['heatmap'] = heatmap
-            
-            video.save()
-
+            apply_engagement_batch(self.video_id, events)
+        except Exception as e:
+            print(f"Error updating engagement data: {e}")
+        try:
+            record_viewers(self.video_id, session_ids)
         except Exception as e:
-            print(f"Error updating engagement data: {e}")
\ No newline at end of file
+            print(f"Error recording viewers: {e}")
+
+    async def flush_engagement(self):
+        """Writes out the events buffered since the last flush."""
+        events, self.pending_events = self.pending_events, []
+        session_ids, self.pending_sessions = self.pending_sessions, set()
+        raw_events, self.pending_log = self.pending_log, []
+        if raw_events:
+            # The event log has its own writer thread, so it never queues behind DB work
+            try:
+                await write_async(self.video_id, raw_events)
+            except Exception as e:
+                print(f"Error writing event log: {e}")
+        if events or session_ids:
+            await self.apply_engagement(events, session_ids)
+
+
+class DashboardConsumer(AsyncWebsocketConsumer):
+    """
+    Read-only live stats for many videos over one socket. Clients send
+    {"action": "subscribe" | "unsubscribe", "video_ids": [...]} and receive one
+    coalesced live_update frame per tick with the videos that changed. Unlike
+    EngagementConsumer it never counts plays or records engagement.
+    """
+    async def connect(self):
+        self.subscriptions = {}  # video_id -> live cache version last sent
+        await self.accept()
+        self.updater_task = asyncio.create_task(self.send_live_updates())
+
+    async def disconnect(self, close_code):
+        self.updater_task.cancel()
+
+    async def receive(self, text_data):
+        try:
+            message = json.loads(text_data)
+        except ValueError:
+            message = None
+        # A string would otherwise be walked one character at a time
+        if not isinstance(message, dict) or not isinstance(message.get("video_ids", []), list):
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Malformed message'}))
+            return
+        video_ids = [str(video_id) for video_id in message.get("video_ids", [])]
+        action = message.get("action")
+
+        if action == "subscribe":
+            limit = getattr(settings, 'DASHBOARD_MAX_SUBSCRIPTIONS', 500)
+            new_ids = [video_id for video_id in dict.fromkeys(video_ids) if video_id not in self.subscriptions]
+            accepted = new_ids[:max(limit - len(self.subscriptions), 0)]
+            found = await database_sync_to_async(live_cache.load_many)(accepted) if accepted else set()
+            for video_id in accepted:
+                if video_id in found:
+                    self.subscriptions[video_id] = 0  # Sent in full on the next tick
+            await self.send(text_data=json.dumps({
+                'type': 'subscribed',
+                'video_ids': [video_id for video_id in accepted if video_id in found],
+                'not_found': [video_id for video_id in accepted if video_id not in found],
+                'over_limit': new_ids[len(accepted):],
+            }))
+        elif action == "unsubscribe":
+            for video_id in video_ids:
+                self.subscriptions.pop(video_id, None)
+            await self.send(text_data=json.dumps({'type': 'unsubscribed', 'video_ids': video_ids}))
+
+    async def send_live_updates(self):
+        """Every tick, sends one frame with the subscribed videos whose stats changed."""
+        while True:
+            await asyncio.sleep(2) # Same cadence as EngagementConsumer
+
+            video_ids = list(self.subscriptions)
+            evicted = [video_id for video_id in video_ids if live_cache.stats(video_id) is None]
+            if evicted:
+                # One query for everything that fell out of the cache since the last tick
+                await database_sync_to_async(live_cache.load_many)(evicted)
+
+            videos = {}
+            for video_id in video_ids:
+                stats = live_cache.stats(video_id)
+                if stats is None or stats['version'] == self.subscriptions.get(video_id):
+                    continue
+                if video_id not in self.subscriptions:
+                    continue  # Unsubscribed while we were loading
+                self.subscriptions[video_id] = stats['version']
+                videos[video_id] = {
+                    'total_watch_time': round(stats['total_watch_time'], 2),
+                    'predicted_revenue': predict_revenue(stats['revenue_inputs']),
+                }
+
+            if videos:
+                await self.send(text_data=json.dumps({'type': 'live_update', 'videos': videos}))
@@ -0,0 +1,167 @@
+# Sharded play / watch-time / event counters for hot videos.
+# Normally a video's counters live on its own row. Once a process sees more
+# than COUNTER_SHARD_THRESHOLD counter writes per second for one video, the
+# video is promoted: COUNTER_SHARDS VideoCounterShard rows are created and
+# later increments are F() updates on a random shard, so concurrent writers
+# stop queueing on the Video row lock. Reads add the shards to the row's
+# values, which remain the base (history from before promotion).
+# Engagement batches for a sharded video also leave their heatmap views on
+# the shard they pick (add_engagement); engagement.fold_shards moves them onto
+# the Video row every COUNTER_FOLD_SECONDS, so the row is locked once per fold
+# rather than once per batch.
+
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Video, VideoCounterShard
+
+DEFAULT_SHARDS = 8
+DEFAULT_THRESHOLD = 20  # Writes per second per video
+DEFAULT_RATE_WINDOW = 10  # Seconds
+
+COUNTER_FIELDS = ('play_count', 'total_watch_time', 'engagement_event_count')
+
+
+class WriteRateTracker:
+    """Per-process counter writes per video over fixed windows; memory is bounded by one window."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.counts = Counter()
+
+    def record(self, video_id):
+        """Counts one write and returns the video's rate in the current window (writes/s)."""
+        window = getattr(settings, 'COUNTER_RATE_WINDOW', DEFAULT_RATE_WINDOW)
+        now = time.monotonic()
+        with self.lock:
+            if now - self.window_start >= window:
+                self.window_start = now
+                self.counts.clear()
+            self.counts[video_id] += 1
+            return self.counts[video_id] / window
+
+
+tracker = WriteRateTracker()
+
+
+def promote(video_id, shards=None):
+    """Gives a video counter shards; its existing counters stay on the Video row."""
+    shards = shards or getattr(settings, 'COUNTER_SHARDS', DEFAULT_SHARDS)
+    with transaction.atomic():
+        VideoCounterShard.objects.bulk_create(
+            [VideoCounterShard(video_id=video_id, shard=shard) for shard in range(shards)],
+            ignore_conflicts=True,
+        )
+        Video.objects.filter(video_id=video_id, counter_shards__lt=shards).update(counter_shards=shards)
+    print(f"Promoted video {video_id} to {shards} counter shards")
+
+
+def record_write(video_id, counter_shards):
+    """Tracks a counter write and promotes the video once it runs hot."""
+    rate = tracker.record(video_id)
+    if not counter_shards and rate > getattr(settings, 'COUNTER_SHARD_THRESHOLD', DEFAULT_THRESHOLD):
+        promote(video_id)
+
+
+def increment(video_id, counter_shards, **amounts):
+    """Adds to a video's counters: on a random shard if it has them, else on its row."""
+    updates = {field: F(field) + amount for field, amount in amounts.items()}
+    if counter_shards:
+        shard = random.randrange(counter_shards)
+        if not VideoCounterShard.objects.filter(video_id=video_id, shard=shard).update(**updates):
+            VideoCounterShard.objects.get_or_create(video_id=video_id, shard=shard)
+            VideoCounterShard.objects.filter(video_id=video_id, shard=shard).update(**updates)
+    else:
+        Video.objects.filter(video_id=video_id).update(**updates)
+    record_write(video_id, counter_shards)
+
+
+def add_engagement(video_id, counter_shards, seconds, **amounts):
+    """
+    Adds to a random shard's counters and pending heatmap in one short
+    transaction that only locks that shard.
+
+    Args:
+        seconds (dict): second -> views to add to the heatmap.
+    """
+    number = random.randrange(counter_shards)
+    with transaction.atomic():
+        shard, _ = VideoCounterShard.objects.select_for_update().get_or_create(video_id=video_id, shard=number)
+        for field, amount in amounts.items():
+            setattr(shard, field, getattr(shard, field) + amount)
+        for second, views in seconds.items():
+            shard.heatmap[str(second)] = shard.heatmap.get(str(second), 0) + views
+        shard.save(update_fields=[*amounts, 'heatmap'])
+    record_write(video_id, counter_shards)
+
+
+def add_play(video_id):
+    """Counts a play, creating the video if it's new."""
+    video, _ = Video.objects.only('video_id', 'counter_shards').get_or_create(video_id=video_id)
+    increment(video_id, video.counter_shards, play_count=1)
+
+
+def shard_totals(video_ids):
+    """
+    Summed shard counters for the given videos (one query).
+
+    Returns:
+        dict: video_id -> {'play_count', 'total_watch_time', 'engagement_event_count'}
+    """
+    if not video_ids:
+        return {}
+    rows = (
+        VideoCounterShard.objects.filter(video_id__in=video_ids)
+        .values('video_id')
+        .annotate(**{f'{field}_sum': Sum(field) for field in COUNTER_FIELDS})
+    )
+    return {row['video_id']: {field: row[f'{field}_sum'] for field in COUNTER_FIELDS} for row in rows}
+
+
+def shard_heatmaps(videos):
+    """
+    Heatmap views of the given videos still waiting on their shards (one
+    query), keyed at each video's heatmap_resolution.
+
+    Returns:
+        dict: video_id -> {key: views}
+    """
+    resolutions = {video.video_id: video.heatmap_resolution or 1 for video in videos if video.counter_shards}
+    if not resolutions:
+        return {}
+    result = {}
+    for video_id, heatmap in VideoCounterShard.objects.filter(video_id__in=resolutions).values_list('video_id', 'heatmap'):
+        pending = result.setdefault(video_id, {})
+        for second, views in heatmap.items():
+            second = int(second)
+            key = str(second - second % resolutions[video_id])
+            pending[key] = pending.get(key, 0) + views
+    return result
+
+
+def combined_totals(video, totals=None, fields=COUNTER_FIELDS):
+    """
+    A video's exact counters: its row plus its shards. Pass `totals` from
+    shard_totals() when handling many videos, to avoid a query per video.
+    """
+    result = {field: getattr(video, field) or 0 for field in fields}
+    if video.counter_shards:
+        if totals is None:
+            totals = shard_totals([video.video_id])
+        for field in fields:
+            result[field] += totals.get(video.video_id, {}).get(field) or 0
+    return result
+
+
+def reset_shards(video_id):
+    """Zeroes a video's shards, for callers that rewrite its row counters and heatmap absolutely."""
+    VideoCounterShard.objects.filter(video_id=video_id).update(
+        play_count=0, total_watch_time=0, engagement_event_count=0, heatmap={},
+    )
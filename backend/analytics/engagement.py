@@ -0,0 +1,310 @@
+# Write path for engagement events.
+# The WebSocket consumer buffers timeupdate events and applies them here in
+# batches, one transaction per batch. Counters and heatmap views of hot videos
+# go to shard rows and are folded into the Video row every
+# COUNTER_FOLD_SECONDS (see counters.py). Everything derived from engagement
+# (heatmap, counters, retention profile, trending scores, live stats cache)
+# is updated in the same place so reads never have to rescan the raw heatmap.
+
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import hll
+from .counters import add_engagement, increment, record_write
+from .models import RetentionProfile, Video, VideoCounterShard, ViewerSketch
+from .trending import leaderboard
+from .live_cache import live_cache
+
+DEFAULT_RETENTION_BUCKETS = 100
+DEFAULT_RETENTION_TOP_SEGMENTS = 5
+DEFAULT_FOLD_SECONDS = 5
+
+
+def apply_engagement_batch(video_id, events):
+    """
+    Applies a batch of timeupdate events to a video's aggregates.
+
+    Args:
+        video_id (str): The video the events belong to.
+        events (list): (current_time, duration) pairs, one per timeupdate.
+                       Each counts as one second of watch time.
+    """
+    if not events:
+        return
+
+    seconds = Counter(math.floor(current_time) for current_time, _ in events)
+    duration = max(duration or 0 for _, duration in events)
+    # A plain read: sharded videos are written without touching their row
+    video = Video.objects.only(
+        'video_id', 'duration', 'engagement_version', 'heatmap_resolution', 'counter_shards'
+    ).filter(video_id=video_id).first()
+    if video is not None and video.counter_shards:
+        apply_sharded_batch(video, events, seconds, duration)
+        return video
+
+    with transaction.atomic():
+        # Use get_or_create to handle new videos gracefully
+        video, _ = Video.objects.select_for_update().get_or_create(video_id=video_id)
+        read_version = video.engagement_version
+
+        # Update duration if it's not set and the player reported a valid one
+        if video.duration is None and duration > 0:
+            video.duration = duration
+
+        fields = ['duration', 'engagement_data', 'engagement_version', 'last_engaged_at']
+        if not video.counter_shards:
+            video.total_watch_time = (video.total_watch_time or 0) + len(events)
+            video.engagement_event_count = (video.engagement_event_count or 0) + len(events)
+            fields += ['total_watch_time', 'engagement_event_count']
+
+        # Compacted videos (see the maintain command) keep one key per heatmap_resolution seconds
+        resolution = video.heatmap_resolution or 1
+        heatmap = video.engagement_data.get('heatmap', {})
+        added = Counter()
+        for second, views in seconds.items():
+            time_key = str(second - second % resolution)
+            heatmap[time_key] = heatmap.get(time_key, 0) + views
+            added[time_key] += views
+        video.engagement_data['heatmap'] = heatmap
+        video.engagement_version += 1
+        video.last_engaged_at = timezone.now()
+        # Only the fields written here, so concurrent add_play increments, promotion
+        # and HLS status updates to the same row are kept
+        video.save(update_fields=fields)
+        if video.counter_shards:
+            # Promoted since the read above: counters go to a shard row
+            increment(video_id, video.counter_shards, total_watch_time=len(events), engagement_event_count=len(events))
+        else:
+            record_write(video_id, video.counter_shards)
+
+        update_retention_profile(video, seconds)
+
+    live_cache.apply(video_id, len(events), added, read_version, video.engagement_version, resolution)
+    leaderboard.record(video_id, len(events))
+    return video
+
+
+def apply_sharded_batch(video, events, seconds, duration):
+    """
+    Writes a batch for a video with counter shards: counters and heatmap views
+    go to one shard, and the Video row is neither locked nor rewritten. The
+    views reach the row's heatmap, its engagement_version and its retention
+    profile when the shards are next folded.
+    """
+    if video.duration is None and duration > 0:
+        # Once per video, and only if no one else got there first
+        Video.objects.filter(video_id=video.video_id, duration__isnull=True).update(duration=duration)
+    add_engagement(
+        video.video_id, video.counter_shards, seconds,
+        total_watch_time=len(events), engagement_event_count=len(events),
+    )
+
+    resolution = video.heatmap_resolution or 1
+    added = Counter()
+    for second, views in seconds.items():
+        added[str(second - second % resolution)] += views
+    # Sharded writes leave engagement_version alone, so it is both the version read and the one left
+    live_cache.apply(
+        video.video_id, len(events), added, video.engagement_version, video.engagement_version, resolution
+    )
+    leaderboard.record(video.video_id, len(events))
+    if fold_timer.due(video.video_id):
+        fold_shards(video.video_id)
+
+
+# --- Folding shard heatmaps ---
+
+class FoldTimer:
+    """When this process last folded each sharded video, so folds happen at most every COUNTER_FOLD_SECONDS."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.folded_at = {}
+
+    def due(self, video_id):
+        interval = getattr(settings, 'COUNTER_FOLD_SECONDS', DEFAULT_FOLD_SECONDS)
+        now = time.monotonic()
+        with self.lock:
+            if now - self.folded_at.get(video_id, -math.inf) < interval:
+                return False
+            if len(self.folded_at) > 10_000:
+                # Forget videos that haven't been folded for a while, keeping memory bounded
+                self.folded_at = {key: at for key, at in self.folded_at.items() if now - at < interval}
+            self.folded_at[video_id] = now
+            return True
+
+
+fold_timer = FoldTimer()
+
+
+def fold_shards(video_id):
+    """
+    Moves the heatmap views waiting on a video's shards onto its row, bumps
+    engagement_version and updates the retention profile, all in one
+    transaction. Combined totals don't change.
+
+    Returns:
+        int: Views folded.
+    """
+    with transaction.atomic():
+        video = Video.objects.select_for_update().filter(video_id=video_id).first()
+        if video is None:
+            return 0
+        shards = list(VideoCounterShard.objects.select_for_update().filter(video_id=video_id).exclude(heatmap={}))
+        seconds = Counter()
+        for shard in shards:
+            for second, views in shard.heatmap.items():
+                seconds[int(second)] += views
+        if not seconds:
+            return 0
+
+        read_version = video.engagement_version
+        resolution = video.heatmap_resolution or 1
+        heatmap = video.engagement_data.get('heatmap', {})
+        for second, views in seconds.items():
+            time_key = str(second - second % resolution)
+            heatmap[time_key] = heatmap.get(time_key, 0) + views
+        video.engagement_data['heatmap'] = heatmap
+        video.engagement_version += 1
+        video.last_engaged_at = timezone.now()
+        video.save(update_fields=['engagement_data', 'engagement_version', 'last_engaged_at'])
+        VideoCounterShard.objects.filter(pk__in=[shard.pk for shard in shards]).update(heatmap={})
+        update_retention_profile(video, seconds)
+
+    # This process's entry already has the views; only its version moves on
+    live_cache.apply(video_id, 0, {}, read_version, video.engagement_version, resolution)
+    return sum(seconds.values())
+
+
+# --- Retention ---
+
+def bucket_count(duration):
+    """Number of retention buckets: fixed, but never narrower than one second."""
+    buckets = getattr(settings, 'RETENTION_BUCKETS', DEFAULT_RETENTION_BUCKETS)
+    return max(1, min(buckets, math.ceil(duration)))
+
+
+def bucket_views(duration, seconds):
+    """Sums per-second view counts into relative-position buckets."""
+    buckets = [0] * bucket_count(duration)
+    bucket_seconds = duration / len(buckets)
+    for second, views in seconds.items():
+        index = min(int(int(second) / bucket_seconds), len(buckets) - 1)
+        buckets[max(index, 0)] += views
+    return buckets
+
+
+def retention_curve(buckets):
+    """
+    Audience at each bucket relative to the audience at the start. Values can
+    exceed 1.0 where viewers rewatch a section.
+    """
+    baseline = buckets[0] or max(buckets)
+    if not baseline:
+        return [0.0] * len(buckets)
+    return [round(views / baseline, 4) for views in buckets]
+
+
+def top_segments(curve, bucket_seconds, rising):
+    """The largest falls (drop-offs) or rises (rewatches) between neighbouring buckets."""
+    changes = []
+    for index in range(1, len(curve)):
+        change = curve[index] - curve[index - 1]
+        if (change > 0) if rising else (change < 0):
+            changes.append((abs(change), index))
+    changes.sort(reverse=True)
+    limit = getattr(settings, 'RETENTION_TOP_SEGMENTS', DEFAULT_RETENTION_TOP_SEGMENTS)
+    return [
+        {
+            'start': round(index * bucket_seconds, 2),
+            'end': round((index + 1) * bucket_seconds, 2),
+            'change': round(change, 4),
+        }
+        for change, index in changes[:limit]
+    ]
+
+
+def update_retention_profile(video, seconds, rebuild=False):
+    """
+    Folds new per-second views into the video's retention profile.
+
+    The profile is only rebuilt from the full heatmap when asked to or when the
+    duration it was laid out against changes; otherwise the cost is
+    proportional to the batch.
+    """
+    if not video.duration:
+        return None
+
+    profile = RetentionProfile.objects.filter(video=video).first()
+    if rebuild or profile is None or profile.duration != video.duration:
+        profile = profile or RetentionProfile(video=video)
+        profile.duration = video.duration
+        profile.buckets = bucket_views(video.duration, video.engagement_data.get('heatmap', {}))
+    else:
+        for index, views in enumerate(bucket_views(video.duration, seconds)):
+            profile.buckets[index] += views
+
+    bucket_seconds = profile.duration / len(profile.buckets)
+    profile.curve = retention_curve(profile.buckets)
+    profile.drop_offs = top_segments(profile.curve, bucket_seconds, rising=False)
+    profile.rewatches = top_segments(profile.curve, bucket_seconds, rising=True)
+    profile.save()
+    return profile
+
+
+# --- Unique viewers ---
+
+def record_viewers(video_id, session_ids, day=None):
+    """Adds client session IDs to the video's HyperLogLog sketch for the day."""
+    if not session_ids:
+        return
+    day = day or timezone.localdate()
+    with transaction.atomic():
+        sketch, _ = ViewerSketch.objects.select_for_update().get_or_create(
+            video_id=video_id, day=day, defaults={'registers': hll.empty()}
+        )
+        registers = bytearray(sketch.registers)
+        changed = False
+        for session_id in session_ids:
+            changed = hll.add(registers, session_id) or changed
+        if changed:
+            sketch.registers = bytes(registers)
+            sketch.save(update_fields=['registers'])
+
+
+def unique_viewers(video_ids=None, start=None, end=None, daily=False):
+    """
+    Estimates distinct viewers by merging sketches for the given videos and
+    inclusive date range (all of them when omitted). Memory stays at one
+    sketch, or one per day when a daily breakdown is requested.
+
+    Returns:
+        dict: {'unique_viewers': int} plus 'daily' ({date: int}) if requested.
+    """
+    sketches = ViewerSketch.objects.all()
+    if video_ids:
+        sketches = sketches.filter(video_id__in=video_ids)
+    if start:
+        sketches = sketches.filter(day__gte=start)
+    if end:
+        sketches = sketches.filter(day__lte=end)
+
+    merged = bytearray(hll.empty())
+    per_day = {}
+    for day, registers in sketches.values_list('day', 'registers').iterator():
+        hll.merge_into(merged, registers)
+        if daily:
+            if day not in per_day:
+                per_day[day] = bytearray(hll.empty())
+            hll.merge_into(per_day[day], registers)
+
+    result = {'unique_viewers': hll.estimate(merged)}
+    if daily:
+        result['daily'] = {day.isoformat(): hll.estimate(per_day[day]) for day in sorted(per_day)}
+    return result
@@ -0,0 +1,264 @@
+# Append-only log of raw engagement events.
+# Every accepted WebSocket event is written to segmented binary files under
+# EVENT_LOG_DIR, rotated by size and age, so aggregates can be rebuilt from
+# scratch (see the replay_events command) when metric definitions change.
+#
+# Segment layout: MAGIC, then a stream of records whose first byte is a type.
+#   event:  <B type><d timestamp><d current_time><d duration><I video ref><I session ref>
+#   string: <B 0xFF><I ref><H length><utf-8 bytes>
+# Video and session IDs are interned per segment: a string record defines a
+# ref the first time an ID appears, and events carry the 4-byte ref (0 = none).
+# Player times are kept as doubles so replay floors them to the same second as
+# the live write path. Version 1 segments (float32 times) can still be read.
+# Writes go through one dedicated thread (see write_async), never the thread
+# database_sync_to_async uses.
+# This module deliberately avoids importing models so replay workers stay light.
+
+import asyncio
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from . import hll
+
+MAGIC = b'VAEL\x02'
+EVENT = struct.Struct('<BdddII')
+# Earlier segments stored player times as float32
+EVENT_FORMATS = {MAGIC: EVENT, b'VAEL\x01': struct.Struct('<BdffII')}
+STRING = struct.Struct('<BIH')
+STRING_RECORD = 0xFF
+
+EVENT_TYPES = {'connect': 0, 'timeupdate': 1, 'play': 2, 'pause': 3, 'seeked': 4}
+EVENT_NAMES = {code: name for name, code in EVENT_TYPES.items()}
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_SEGMENT_SECONDS = 3600
+
+
+class EventLogWriter:
+    """Appends event batches to the current segment of this process, rotating as needed."""
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, segment_seconds=DEFAULT_SEGMENT_SECONDS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.lock = threading.Lock()
+        self.file = None
+        self.opened_at = 0
+        self.sequence = 0
+        self.refs = {}
+
+    def _open_segment(self, now):
+        if self.file is not None:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.sequence += 1
+        stamp = datetime.fromtimestamp(now, dt_timezone.utc).strftime('%Y%m%dT%H%M%S')
+        # The pid keeps concurrent server processes from sharing a segment
+        name = f"events-{stamp}-{os.getpid()}-{self.sequence:04d}.log"
+        self.file = open(os.path.join(self.directory, name), 'ab')
+        self.file.write(MAGIC)
+        self.opened_at = now
+        self.refs = {}
+
+    def _ref(self, value, chunks):
+        if not value:
+            return 0
+        ref = self.refs.get(value)
+        if ref is None:
+            # Encoded first, so a value that can't be is never given a ref
+            encoded = value.encode('utf-8')[:65535]
+            ref = self.refs[value] = len(self.refs) + 1
+            chunks.append(STRING.pack(STRING_RECORD, ref, len(encoded)))
+            chunks.append(encoded)
+        return ref
+
+    def append(self, video_id, events):
+        """
+        Malformed records (an unknown name, non-numeric times) are skipped, so
+        they can't cost the valid events written with them.
+
+        Args:
+            video_id (str): The video the events belong to.
+            events (list): (timestamp, event name, current_time, duration, session_id)
+                           tuples; session_id is None until the client has sent one.
+
+        Returns:
+            int: Records skipped.
+        """
+        if not events:
+            return 0
+        with self.lock:
+            now = time.time()
+            if (self.file is None or self.file.tell() >= self.segment_bytes
+                    or now - self.opened_at >= self.segment_seconds):
+                self._open_segment(now)
+            chunks = []
+            video_ref = self._ref(video_id, chunks)
+            skipped = 0
+            for timestamp, name, current_time, duration, session_id in events:
+                try:
+                    record = EVENT.pack(
+                        EVENT_TYPES[name], timestamp, current_time or 0.0, duration or 0.0,
+                        video_ref, self._ref(session_id, chunks),
+                    )
+                except (KeyError, TypeError, ValueError, AttributeError, struct.error):
+                    skipped += 1
+                    continue
+                chunks.append(record)
+            self.file.write(b''.join(chunks))
+            self.file.flush()
+        if skipped:
+            print(f"Skipped {skipped} malformed event log records for video {video_id}")
+        return skipped
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """The process-wide writer, configured from settings on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            from django.conf import settings
+            _writer = EventLogWriter(
+                settings.EVENT_LOG_DIR,
+                getattr(settings, 'EVENT_LOG_SEGMENT_BYTES', DEFAULT_SEGMENT_BYTES),
+                getattr(settings, 'EVENT_LOG_SEGMENT_SECONDS', DEFAULT_SEGMENT_SECONDS),
+            )
+        return _writer
+
+
+def log_events(video_id, events):
+    get_writer().append(video_id, events)
+
+
+# One thread keeps appends in order and off the shared DB thread
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='event-log')
+
+
+async def write_async(video_id, events):
+    """log_events() from async code, on the event log's own thread."""
+    await asyncio.get_running_loop().run_in_executor(_executor, log_events, video_id, events)
+
+
+# --- Reading ---
+
+def list_segments(directory):
+    """Segment paths in write order (name starts with the UTC open time)."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith('events-') and name.endswith('.log')
+    )
+
+
+def read_segment(path):
+    """
+    Yields (event name, timestamp, current_time, duration, video_id, session_id)
+    from one segment using a memory-mapped sequential scan. A truncated record
+    at the end (a segment still being written) ends the scan.
+    """
+    if os.path.getsize(path) <= len(MAGIC):
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        event_format = EVENT_FORMATS.get(data[:len(MAGIC)])
+        if event_format is None:
+            raise ValueError(f"{path} is not an event log segment")
+        strings = {0: None}
+        offset = len(MAGIC)
+        size = len(data)
+        unpack_event = event_format.unpack_from
+        while offset < size:
+            if data[offset] == STRING_RECORD:
+                if offset + STRING.size > size:
+                    return
+                _, ref, length = STRING.unpack_from(data, offset)
+                offset += STRING.size
+                if offset + length > size:
+                    return
+                strings[ref] = data[offset:offset + length].decode('utf-8')
+                offset += length
+            else:
+                if offset + event_format.size > size:
+                    return
+                code, timestamp, current_time, duration, video_ref, session_ref = unpack_event(data, offset)
+                offset += event_format.size
+                yield EVENT_NAMES.get(code), timestamp, current_time, duration, strings[video_ref], strings[session_ref]
+
+
+def aggregate_segment(path, tz_offset_seconds=0):
+    """
+    Rebuilds the aggregates one segment contributes, mirroring the live write
+    path: a connect is a play, each timeupdate one second of watch time and
+    one heatmap view, and sessions feed per-day HyperLogLog sketches.
+
+    Returns:
+        dict: video_id -> {'plays', 'watch_time', 'events', 'duration',
+              'heatmap' (Counter), 'sketches' ({date: bytes}), 'event_counts' (Counter)}
+    """
+    videos = {}
+    for name, timestamp, current_time, duration, video_id, session_id in read_segment(path):
+        stats = videos.get(video_id)
+        if stats is None:
+            stats = videos[video_id] = {
+                'plays': 0, 'watch_time': 0, 'events': 0, 'duration': 0.0,
+                'heatmap': Counter(), 'sessions': defaultdict(set), 'event_counts': Counter(),
+            }
+        stats['event_counts'][name] += 1
+        if name == 'connect':
+            stats['plays'] += 1
+        elif name == 'timeupdate':
+            stats['watch_time'] += 1
+            stats['events'] += 1
+            stats['heatmap'][math.floor(current_time)] += 1
+            if duration > stats['duration']:
+                stats['duration'] = duration
+        if session_id:
+            stats['sessions'][int((timestamp + tz_offset_seconds) // 86400)].add(session_id)
+
+    # Sessions repeat on every event, so they are deduplicated before hashing
+    for stats in videos.values():
+        sketches = {}
+        for day, sessions in stats.pop('sessions').items():
+            registers = bytearray(hll.empty())
+            for session_id in sessions:
+                hll.add(registers, session_id)
+            sketches[datetime.fromtimestamp(day * 86400, dt_timezone.utc).date()] = bytes(registers)
+        stats['sketches'] = sketches
+    return videos
+
+
+def merge_aggregates(total, part):
+    """Folds one segment's aggregates into a running total (in place)."""
+    for video_id, stats in part.items():
+        current = total.get(video_id)
+        if current is None:
+            total[video_id] = stats
+            continue
+        current['plays'] += stats['plays']
+        current['watch_time'] += stats['watch_time']
+        current['events'] += stats['events']
+        current['duration'] = max(current['duration'], stats['duration'])
+        current['heatmap'].update(stats['heatmap'])
+        current['event_counts'].update(stats['event_counts'])
+        for day, registers in stats['sketches'].items():
+            existing = current['sketches'].get(day)
+            current['sketches'][day] = hll.merge(existing, registers) if existing else registers
+    return total
@@ -0,0 +1,78 @@
+# HyperLogLog sketches for approximate unique-viewer counts.
+# A sketch is a fixed-size byte string with one register per bucket, so it
+# can be stored as a small blob and merged across days and videos by taking
+# the register-wise maximum. Merging and estimating use numpy, so folding in
+# a sketch costs microseconds rather than a Python loop over 4096 registers.
+
+import hashlib
+import math
+
+import numpy as np
+
+# 2**12 one-byte registers: a 4 KB sketch with ~1.6% standard error.
+# Changing this makes existing sketches unmergeable with new ones.
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+_HASH_BITS = 64
+_REMAINDER_BITS = _HASH_BITS - PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+
+def empty():
+    """A sketch that has seen nothing."""
+    return bytes(REGISTERS)
+
+
+def add(registers, item):
+    """
+    Adds an item (e.g. a client session ID) to a sketch in place.
+
+    Args:
+        registers (bytearray): The sketch to update.
+        item (str): The value to count.
+
+    Returns:
+        bool: True if the sketch changed.
+    """
+    digest = hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest()
+    value = int.from_bytes(digest, 'big')
+    index = value >> _REMAINDER_BITS
+    remainder = value & ((1 << _REMAINDER_BITS) - 1)
+    rank = _REMAINDER_BITS - remainder.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+        return True
+    return False
+
+
+def _view(registers):
+    return np.frombuffer(registers, dtype=np.uint8)
+
+
+def merge(a, b):
+    """Union of two sketches."""
+    return np.maximum(_view(a), _view(b)).tobytes()
+
+
+def merge_into(target, registers):
+    """
+    Merges a sketch into `target` in place, for unions of many sketches.
+
+    Args:
+        target (bytearray): The accumulated sketch, e.g. bytearray(empty()).
+        registers (bytes): The sketch to fold in (bytes or memoryview).
+    """
+    view = _view(target)
+    np.maximum(view, _view(registers), out=view)
+
+
+def estimate(registers):
+    """Estimated number of distinct items added to the sketch."""
+    view = _view(registers)
+    total = float(np.exp2(-view.astype(np.float64)).sum())
+    raw = _ALPHA * REGISTERS * REGISTERS / total
+    zeros = int(np.count_nonzero(view == 0))
+    if raw <= 2.5 * REGISTERS and zeros:
+        # Small-range correction (linear counting)
+        return round(REGISTERS * math.log(REGISTERS / zeros))
+    return round(raw)
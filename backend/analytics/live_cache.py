@@ -0,0 +1,282 @@
+# Per-process cache of the live stats WebSocket consumers push every tick.
+# Entries are loaded from the DB once and then kept current by the engagement
+# write path (engagement.apply_engagement_batch), so steady-state live updates
+# need no DB reads. Each entry remembers the engagement_version and
+# heatmap_resolution it reflects; a write from this process that finds either
+# changed by someone else (another server process, a shard fold, or the
+# maintain command compacting the heatmap) drops the entry so it is reloaded.
+# Other processes' writes are therefore not seen until this process next
+# writes to the video, or the entry is evicted. Heatmap views of sharded
+# videos that are still waiting on their shards are included.
+
+import itertools
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .counters import combined_totals, shard_heatmaps, shard_totals
+from .models import Video
+
+DEFAULT_MAX_VIDEOS = 1000
+DEFAULT_MAX_SECONDS = 2_000_000
+
+# predict_revenue only looks at the first ten seconds of the heatmap
+REVENUE_SECONDS = 10
+
+# Reads repeated when a write lands while a video is being loaded
+LOAD_ATTEMPTS = 3
+
+# A snapshot's change log is trimmed once it is this many times longer than
+# its heatmap (and at least MIN_CHANGE_LOG long); past that a full snapshot
+# is cheaper to send than the delta anyway
+CHANGE_LOG_FACTOR = 2
+MIN_CHANGE_LOG = 64
+
+# Versions are unique across all snapshots in the process, so a baseline taken
+# from an entry that was since evicted and reloaded is detectably stale
+_versions = itertools.count(1)
+
+
+class VideoSnapshot:
+    """Derived live stats of one video, with a log of heatmap changes ordered by version for deltas."""
+
+    __slots__ = (
+        'total_watch_time', 'heatmap', 'resolution', 'engagement_version',
+        'base_version', 'version', 'log_versions', 'log_seconds',
+    )
+
+    def __init__(self, total_watch_time, heatmap, resolution=1, engagement_version=0):
+        self.total_watch_time = total_watch_time or 0
+        self.heatmap = dict(heatmap)
+        self.resolution = resolution or 1  # Seconds per heatmap key
+        self.engagement_version = engagement_version  # Video.engagement_version this reflects
+        # base_version: deltas are only known for changes after it (load time, then trimming)
+        self.base_version = self.version = next(_versions)
+        # Parallel lists: the second that changed, and the version it changed in (ascending)
+        self.log_versions = []
+        self.log_seconds = []
+
+    def record_change(self, second):
+        self.log_versions.append(self.version)
+        self.log_seconds.append(second)
+        limit = max(len(self.heatmap), MIN_CHANGE_LOG)
+        if len(self.log_versions) > CHANGE_LOG_FACTOR * limit:
+            # Keep the newest `limit` changes; older baselines get a full snapshot
+            cut = len(self.log_versions) - limit
+            self.base_version = self.log_versions[cut - 1]
+            del self.log_versions[:cut]
+            del self.log_seconds[:cut]
+
+    def changed_since(self, version):
+        """Seconds changed after `version`, in time proportional to their number."""
+        start = bisect_right(self.log_versions, version)
+        return set(self.log_seconds[start:])
+
+    def revenue_inputs(self):
+        return {
+            'total_watch_time': self.total_watch_time,
+            'heatmap': {str(i): self.heatmap[str(i)] for i in range(REVENUE_SECONDS) if str(i) in self.heatmap},
+        }
+
+
+class LiveStatsCache:
+    """LRU of VideoSnapshots bounded by video count and total heatmap seconds."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_seconds = 0
+        self.loading = {}  # video_id -> loads in flight
+        self.missed = set()  # Videos written to while being loaded
+
+    def _evict(self):
+        max_videos = getattr(settings, 'LIVE_CACHE_MAX_VIDEOS', DEFAULT_MAX_VIDEOS)
+        max_seconds = getattr(settings, 'LIVE_CACHE_MAX_SECONDS', DEFAULT_MAX_SECONDS)
+        while len(self.entries) > 1 and (len(self.entries) > max_videos or self.total_seconds > max_seconds):
+            _, evicted = self.entries.popitem(last=False)
+            self.total_seconds -= len(evicted.heatmap)
+
+    def load(self, video_id):
+        """
+        Ensures the video is cached, reading it from the DB on a miss. Sync,
+        so consumers call it through database_sync_to_async.
+
+        Returns:
+            bool: False if the video does not exist.
+        """
+        return video_id in self.load_many([video_id])
+
+    def load_many(self, video_ids):
+        """
+        Caches every missing video with one query. A video written to while
+        it was being read (the write found no entry to update) is read again
+        rather than cached without that write.
+
+        Returns:
+            set: The IDs that exist (cached or loaded).
+        """
+        found = set()
+        missing = list(dict.fromkeys(video_ids))
+        for _ in range(LOAD_ATTEMPTS):
+            with self.lock:
+                found.update(video_id for video_id in missing if video_id in self.entries)
+                missing = [video_id for video_id in missing if video_id not in self.entries]
+                if not missing:
+                    break
+                for video_id in missing:
+                    self.loading[video_id] = self.loading.get(video_id, 0) + 1
+
+            snapshots = {}
+            refolded = set()
+            retry = []
+            try:
+                videos = list(Video.objects.filter(video_id__in=missing).only(
+                    'video_id', 'total_watch_time', 'engagement_data', 'engagement_version',
+                    'heatmap_resolution', 'counter_shards',
+                ))
+                sharded = [video for video in videos if video.counter_shards]
+                totals = shard_totals([video.video_id for video in sharded])
+                pending = shard_heatmaps(sharded)
+                snapshots = {video.video_id: self._snapshot_of(video, totals, pending) for video in videos}
+                if sharded:
+                    # A fold between reading the row and the shards would count views twice or not at all
+                    versions = dict(Video.objects.filter(video_id__in=[video.video_id for video in sharded])
+                                    .values_list('video_id', 'engagement_version'))
+                    refolded = {video.video_id for video in sharded if versions.get(video.video_id) != video.engagement_version}
+            finally:
+                with self.lock:
+                    for video_id in missing:
+                        stale = video_id in self.missed or video_id in refolded
+                        self.loading[video_id] -= 1
+                        if not self.loading[video_id]:
+                            del self.loading[video_id]
+                            self.missed.discard(video_id)
+                        snapshot = snapshots.get(video_id)
+                        if snapshot is None:
+                            continue
+                        found.add(video_id)
+                        if stale:
+                            retry.append(video_id)
+                        elif video_id not in self.entries:
+                            self.entries[video_id] = snapshot
+                            self.total_seconds += len(snapshot.heatmap)
+                    self._evict()
+            missing = retry
+        return found
+
+    def _snapshot_of(self, video, totals=None, pending=None):
+        total_watch_time = combined_totals(video, totals, fields=['total_watch_time'])['total_watch_time']
+        heatmap = dict((video.engagement_data or {}).get('heatmap', {}))
+        for key, views in (pending or {}).get(video.video_id, {}).items():
+            heatmap[key] = heatmap.get(key, 0) + views
+        return VideoSnapshot(total_watch_time, heatmap, video.heatmap_resolution, video.engagement_version)
+
+    def apply(self, video_id, watch_time, heatmap_views, read_version, engagement_version, resolution):
+        """
+        Records a committed write of `watch_time` seconds and `heatmap_views`
+        (key -> views added). read_version is the engagement_version the write
+        found, engagement_version and resolution are what it left on the Video
+        row. Videos that aren't cached are left to be loaded on next use, and
+        so are entries that missed a write made elsewhere (their version isn't
+        read_version) or are keyed at another resolution.
+        """
+        with self.lock:
+            snapshot = self.entries.get(video_id)
+            if snapshot is None:
+                if video_id in self.loading:
+                    # The read in flight may predate this write
+                    self.missed.add(video_id)
+                return
+            if snapshot.engagement_version != read_version or snapshot.resolution != resolution:
+                self._drop(video_id)
+                return
+            snapshot.engagement_version = engagement_version
+            if not (watch_time or heatmap_views):
+                return
+            snapshot.version = next(_versions)
+            snapshot.total_watch_time += watch_time
+            for second, views in heatmap_views.items():
+                if second not in snapshot.heatmap:
+                    self.total_seconds += 1
+                snapshot.heatmap[second] = snapshot.heatmap.get(second, 0) + views
+                snapshot.record_change(second)
+            self._evict()
+
+    def invalidate(self, video_id):
+        """Drops a video so its next read comes from the DB (e.g. after an out-of-band rewrite)."""
+        with self.lock:
+            self._drop(video_id)
+
+    def _drop(self, video_id):
+        snapshot = self.entries.pop(video_id, None)
+        if snapshot is not None:
+            self.total_seconds -= len(snapshot.heatmap)
+
+    def snapshot(self, video_id):
+        """
+        Full heatmap copy plus the version it reflects, or None if not cached.
+
+        Returns:
+            dict: {'version', 'heatmap', 'resolution', 'total_watch_time', 'revenue_inputs'}
+        """
+        with self.lock:
+            snapshot = self.entries.get(video_id)
+            if snapshot is None:
+                return None
+            self.entries.move_to_end(video_id)
+            return {
+                'version': snapshot.version,
+                'heatmap': dict(snapshot.heatmap),
+                'resolution': snapshot.resolution,
+                'total_watch_time': snapshot.total_watch_time,
+                'revenue_inputs': snapshot.revenue_inputs(),
+            }
+
+    def stats(self, video_id):
+        """
+        Version and totals without any heatmap data, or None if not cached.
+
+        Returns:
+            dict: {'version', 'total_watch_time', 'revenue_inputs'}
+        """
+        with self.lock:
+            snapshot = self.entries.get(video_id)
+            if snapshot is None:
+                return None
+            self.entries.move_to_end(video_id)
+            return {
+                'version': snapshot.version,
+                'total_watch_time': snapshot.total_watch_time,
+                'revenue_inputs': snapshot.revenue_inputs(),
+            }
+
+    def changes(self, video_id, since_version):
+        """
+        Stats plus the heatmap seconds that changed after `since_version`, or
+        None if not cached. heatmap_delta is None when the baseline predates
+        the cached entry and the client needs a full snapshot.
+
+        Returns:
+            dict: {'version', 'heatmap_delta', 'total_watch_time', 'revenue_inputs'}
+        """
+        with self.lock:
+            snapshot = self.entries.get(video_id)
+            if snapshot is None:
+                return None
+            self.entries.move_to_end(video_id)
+            delta = {}
+            if since_version < snapshot.base_version:
+                delta = None
+            elif snapshot.version > since_version:
+                delta = {second: snapshot.heatmap[second] for second in snapshot.changed_since(since_version)}
+            return {
+                'version': snapshot.version,
+                'heatmap_delta': delta,
+                'total_watch_time': snapshot.total_watch_time,
+                'revenue_inputs': snapshot.revenue_inputs(),
+            }
+
+
+live_cache = LiveStatsCache()
@@ -0,0 +1,136 @@
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.test import Client, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from backend.analytics.middleware import brotli
+from backend.analytics.models import Video
+from backend.analytics.renderers import FastJSONRenderer, engagement_json_key, orjson
+from backend.analytics.views import VideoDetailView, VideoListView
+
+
+@contextmanager
+def renderer(renderer_class):
+    """Temporarily renders the video views with `renderer_class` (views bind their renderers at import)."""
+    views = (VideoDetailView, VideoListView)
+    previous = [view.renderer_classes for view in views]
+    for view in views:
+        view.renderer_classes = [renderer_class]
+    try:
+        yield
+    finally:
+        for view, classes in zip(views, previous):
+            view.renderer_classes = classes
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures latency and response size of the video detail and list endpoints with DRF's "
+        "JSONRenderer, FastJSONRenderer, the pre-encoded engagement data cache, and gzip/brotli "
+        "compression. Uses the videos with the largest heatmaps, or synthetic videos (created in "
+        "a transaction that is rolled back) with --synthetic. Times are measured in-process, so "
+        "they include compression but not the transfer time it saves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--video-id', action='append', help="Benchmark specific videos (repeatable)")
+        parser.add_argument('--videos', type=int, default=5, help="Videos benchmarked when none are given")
+        parser.add_argument('--synthetic', type=int, default=None, help="Create videos with heatmaps of this many seconds")
+        parser.add_argument('--requests', type=int, default=30, help="Timed requests per endpoint and configuration")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            video_ids = options['video_id'] or []
+            self.synthetic_prefix = None
+            if options['synthetic'] or not (video_ids or Video.objects.exists()):
+                video_ids = self.create_synthetic(options['videos'], options['synthetic'] or 3600)
+            elif not video_ids:
+                # Longest videos first, which is where heatmap rendering cost shows
+                video_ids = list(
+                    Video.objects.order_by(F('duration').desc(nulls_last=True))
+                    .values_list('video_id', flat=True)[:options['videos']]
+                )
+            self.run(video_ids, options['requests'])
+            # Synthetic videos, and anything a request wrote, are discarded
+            transaction.set_rollback(True)
+
+    def create_synthetic(self, count, seconds):
+        # One prefix per run, so the list benchmark can search for exactly these videos
+        self.synthetic_prefix = f"benchmark-{uuid.uuid4().hex[:12]}-"
+        video_ids = []
+        for number in range(count):
+            video = Video.objects.create(
+                video_id=f"{self.synthetic_prefix}{number}",
+                title="Benchmark video",
+                duration=seconds,
+                engagement_data={'heatmap': {str(second): random.randint(1, 5000) for second in range(seconds)}},
+                engagement_version=1,
+            )
+            video_ids.append(video.video_id)
+        self.stdout.write(f"Created {count} synthetic videos with {seconds:,}s heatmaps (rolled back afterwards)")
+        return video_ids
+
+    def run(self, video_ids, requests):
+        if not video_ids:
+            self.stdout.write("No videos to benchmark.")
+            return
+        endpoints = [(f"detail {video_id}", f"/api/video/{video_id}/") for video_id in video_ids]
+        if self.synthetic_prefix:
+            endpoints.append((
+                f"list of the {len(video_ids)} synthetic videos",
+                f"/api/videos/?search={self.synthetic_prefix}&page_size={len(video_ids)}",
+            ))
+        else:
+            # The list can't be narrowed to given IDs, so this is whatever sorts first
+            endpoints.append((f"list, first page of {len(video_ids)}", f"/api/videos/?page_size={len(video_ids)}"))
+
+        configurations = [
+            ("DRF JSONRenderer", JSONRenderer, 0, ''),
+            ("FastJSONRenderer" + ("" if orjson else " (orjson missing)"), FastJSONRenderer, 0, ''),
+            ("+ pre-encoded engagement", FastJSONRenderer, 3600, ''),
+            ("+ gzip", FastJSONRenderer, 3600, 'gzip'),
+        ]
+        if brotli:
+            configurations.append(("+ brotli", FastJSONRenderer, 3600, 'br'))
+        else:
+            self.stdout.write("brotli is not installed; skipping it")
+
+        client = Client()
+        for name, url in endpoints:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({url})"))
+            baseline = None
+            for label, renderer_class, cache_seconds, encoding in configurations:
+                with renderer(renderer_class), override_settings(
+                    ALLOWED_HOSTS=['testserver'], ENGAGEMENT_JSON_CACHE_SECONDS=cache_seconds
+                ):
+                    self.clear_engagement_json(video_ids)
+                    client.get(url, HTTP_ACCEPT_ENCODING=encoding)  # Warm-up; fills the engagement cache
+                    timings = []
+                    for _ in range(requests):
+                        started = time.perf_counter()
+                        response = client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+                        timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    self.stderr.write(f"  {label}: HTTP {response.status_code}")
+                    break
+                median = statistics.median(timings)
+                p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+                size = len(response.content)
+                baseline = baseline or (median, size)
+                self.stdout.write(
+                    f"  {label:<36} median {median:8.2f} ms  p95 {p95:8.2f} ms  {size:>11,} bytes"
+                    f"  ({baseline[0] / max(median, 1e-9):4.1f}x baseline speed, {100 - size * 100 / baseline[1]:5.1f}% fewer bytes)"
+                )
+
+    def clear_engagement_json(self, video_ids):
+        """Drops the benchmarked videos' pre-encoded engagement data, leaving the rest of the cache alone."""
+        versions = Video.objects.filter(video_id__in=video_ids).values_list('video_id', 'engagement_version')
+        cache.delete_many([engagement_json_key(video_id, version) for video_id, version in versions])
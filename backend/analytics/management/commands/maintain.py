@@ -0,0 +1,278 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.analytics import hll
+from backend.analytics.engagement import fold_shards
+from backend.analytics.models import UploadSession, Video, VideoCounterShard, ViewerSketch
+from backend.analytics.streaming import local_media_path
+
+DEFAULT_COMPACT_AFTER_DAYS = 30
+DEFAULT_HEATMAP_RESOLUTION = 5
+DEFAULT_SKETCH_DAYS = 90
+DEFAULT_FILE_GRACE_SECONDS = 3600
+DEFAULT_UPLOAD_SESSION_TTL = 86400
+
+
+def compact_heatmap(heatmap, resolution):
+    """Sums per-second heatmap views into one key per `resolution` seconds (totals are kept)."""
+    compacted = {}
+    for second, views in heatmap.items():
+        second = int(second)
+        key = str(second - second % resolution)
+        compacted[key] = compacted.get(key, 0) + views
+    return compacted
+
+
+class Command(BaseCommand):
+    help = (
+        "Periodic maintenance: folds heatmap views waiting on counter shards into their videos, "
+        "compacts the heatmaps of videos nobody has watched for a while into coarser buckets, "
+        "folds old daily unique-viewer sketches into monthly ones, deletes orphaned thumbnails, HLS renditions, upload files and abandoned chunked uploads, then "
+        "runs incremental VACUUM and ANALYZE. Work is done in short transactions so it can run "
+        "next to the live server. SQLite databases need --enable-incremental-vacuum once before free "
+        "pages are reclaimed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200, help="Rows handled per transaction")
+        parser.add_argument('--pause', type=float, default=0.05, help="Seconds to sleep between chunks")
+        parser.add_argument('--vacuum-pages', type=int, default=1000, help="Pages freed per incremental_vacuum step")
+        parser.add_argument('--interval', type=float, default=None, help="Repeat every N seconds instead of running once")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without changing it")
+        parser.add_argument(
+            '--enable-incremental-vacuum', action='store_true',
+            help="Switch SQLite to auto_vacuum = INCREMENTAL with one full VACUUM (locks the database while it "
+                 "runs; do it during a quiet period). Only needed once per database",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            self.fold_shards(options)
+            self.compact_heatmaps(options)
+            self.compact_sketches(options)
+            self.prune_files(options)
+            self.prune_uploads(options)
+            self.vacuum(options)
+            self.stdout.write(self.style.SUCCESS(f"Maintenance finished in {time.monotonic() - started:.1f}s"))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def chunks(self, items, options):
+        size = max(1, options['chunk_size'])
+        for start in range(0, len(items), size):
+            if start:
+                time.sleep(options['pause'])
+            yield items[start:start + size]
+
+    # --- Engagement data ---
+
+    def fold_shards(self, options):
+        """Folds shard heatmaps, including those of videos that went quiet before a server process folded them."""
+        video_ids = list(VideoCounterShard.objects.exclude(heatmap={}).values_list('video_id', flat=True).distinct())
+        views = 0
+        if not options['dry_run']:
+            for chunk in self.chunks(video_ids, options):
+                for video_id in chunk:
+                    views += fold_shards(video_id)
+        self.stdout.write(f"Counter shards: folded {views:,} heatmap views into {len(video_ids)} videos")
+
+    def compact_heatmaps(self, options):
+        resolution = getattr(settings, 'MAINTENANCE_HEATMAP_RESOLUTION', DEFAULT_HEATMAP_RESOLUTION)
+        days = getattr(settings, 'MAINTENANCE_COMPACT_AFTER_DAYS', DEFAULT_COMPACT_AFTER_DAYS)
+        cutoff = timezone.now() - timedelta(days=days)
+        # Videos without last_engaged_at haven't been watched since it was introduced
+        video_ids = list(
+            Video.objects.filter(Q(last_engaged_at__lt=cutoff) | Q(last_engaged_at__isnull=True))
+            .filter(heatmap_resolution__lt=resolution)
+            .values_list('video_id', flat=True)
+        )
+        compacted = 0
+        saved_keys = 0
+        skipped = 0
+        for chunk in self.chunks(video_ids, options):
+            rows = (
+                Video.objects.filter(video_id__in=chunk, heatmap_resolution__lt=resolution)
+                .values_list('video_id', 'engagement_data', 'engagement_version')
+            )
+            for video_id, engagement_data, version in rows:
+                engagement_data = dict(engagement_data or {})
+                heatmap = engagement_data.get('heatmap', {})
+                coarse = compact_heatmap(heatmap, resolution)
+                if options['dry_run']:
+                    saved_keys += len(heatmap) - len(coarse)
+                    compacted += 1
+                    continue
+                engagement_data['heatmap'] = coarse
+                # Written only if no engagement landed since the read; no row lock is held
+                # while compacting. Server processes see the new version and resolution on
+                # their next write and reload their cached entry (see live_cache.py).
+                if Video.objects.filter(video_id=video_id, engagement_version=version).update(
+                    engagement_data=engagement_data, heatmap_resolution=resolution, engagement_version=version + 1,
+                ):
+                    saved_keys += len(heatmap) - len(coarse)
+                    compacted += 1
+                else:
+                    skipped += 1  # Watched again after all; retried on the next run if it goes idle
+        self.stdout.write(
+            f"Heatmaps: compacted {compacted} videos to {resolution}s buckets ({saved_keys:,} fewer keys)"
+            + (f", skipped {skipped} written to meanwhile" if skipped else "")
+        )
+
+    def compact_sketches(self, options):
+        """Merges daily sketches older than MAINTENANCE_SKETCH_DAYS into one per video and month (on its 1st)."""
+        days = getattr(settings, 'MAINTENANCE_SKETCH_DAYS', DEFAULT_SKETCH_DAYS)
+        cutoff = timezone.localdate() - timedelta(days=days)
+        old = ViewerSketch.objects.filter(day__lt=cutoff.replace(day=1)).exclude(day__day=1)
+        video_ids = list(old.values_list('video_id', flat=True).distinct())
+        merged = 0
+        for chunk in self.chunks(video_ids, options):
+            with transaction.atomic():
+                months = {}
+                for sketch in old.select_for_update().filter(video_id__in=chunk):
+                    months.setdefault((sketch.video_id, sketch.day.replace(day=1)), []).append(sketch)
+                for (video_id, month), sketches in months.items():
+                    merged += len(sketches)
+                    if options['dry_run']:
+                        continue
+                    monthly, _ = ViewerSketch.objects.select_for_update().get_or_create(
+                        video_id=video_id, day=month, defaults={'registers': hll.empty()}
+                    )
+                    registers = bytearray(monthly.registers)
+                    for sketch in sketches:
+                        hll.merge_into(registers, sketch.registers)
+                    monthly.registers = bytes(registers)
+                    monthly.save(update_fields=['registers'])
+                    ViewerSketch.objects.filter(pk__in=[sketch.pk for sketch in sketches]).delete()
+        self.stdout.write(f"Viewer sketches: folded {merged} daily sketches into monthly ones")
+
+    # --- Files ---
+
+    def prune_files(self, options):
+        grace = getattr(settings, 'MAINTENANCE_FILE_GRACE_SECONDS', DEFAULT_FILE_GRACE_SECONDS)
+        # Files are written before their Video row exists, so young files are left alone
+        cutoff = time.time() - grace
+        video_ids = set(Video.objects.values_list('video_id', flat=True))
+        paths = {
+            os.path.normpath(local_media_path(path))
+            for path in Video.objects.exclude(path__isnull=True).values_list('path', flat=True)
+        }
+        thumbnails = os.path.join(settings.MEDIA_ROOT, 'thumbnails')
+        uploads = os.path.join(settings.MEDIA_ROOT, 'videos')
+
+        removed = freed = 0
+        for directory, is_orphan in (
+            (thumbnails, lambda entry: os.path.splitext(entry.name)[0] not in video_ids),
+            (uploads, lambda entry: os.path.normpath(entry.path) not in paths),
+        ):
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff and is_orphan(entry):
+                        removed += 1
+                        freed += entry.stat().st_size
+                        if not options['dry_run']:
+                            os.remove(entry.path)
+
+        hls_root = os.path.join(settings.MEDIA_ROOT, 'hls')
+        if os.path.isdir(hls_root):
+            with os.scandir(hls_root) as entries:
+                for entry in entries:
+                    if entry.is_dir() and entry.name not in video_ids and entry.stat().st_mtime < cutoff:
+                        for root, _, files in os.walk(entry.path, topdown=False):
+                            for name in files:
+                                path = os.path.join(root, name)
+                                removed += 1
+                                freed += os.path.getsize(path)
+                                if not options['dry_run']:
+                                    os.remove(path)
+                            if not options['dry_run']:
+                                os.rmdir(root)
+        self.stdout.write(f"Files: removed {removed} orphaned files ({freed / 1024 / 1024:,.1f} MB)")
+
+    def prune_uploads(self, options):
+        """Drops unfinished chunked uploads idle for UPLOAD_SESSION_TTL_SECONDS, and part files without a session."""
+        ttl = getattr(settings, 'UPLOAD_SESSION_TTL_SECONDS', DEFAULT_UPLOAD_SESSION_TTL)
+        stale = list(UploadSession.objects.filter(
+            video__isnull=True,
+            updated_at__lt=timezone.now() - timedelta(seconds=ttl),
+            path__startswith=settings.UPLOAD_TEMP_DIR,  # Not in the middle of being completed
+        ))
+        removed = freed = 0
+        for chunk in self.chunks(stale, options):
+            for session in chunk:
+                removed += 1
+                if os.path.exists(session.path):
+                    freed += os.path.getsize(session.path)
+                    if not options['dry_run']:
+                        os.remove(session.path)
+            if not options['dry_run']:
+                UploadSession.objects.filter(pk__in=[session.pk for session in chunk]).delete()
+
+        if os.path.isdir(settings.UPLOAD_TEMP_DIR):
+            cutoff = time.time() - ttl
+            known = {os.path.normpath(path) for path in UploadSession.objects.values_list('path', flat=True)}
+            with os.scandir(settings.UPLOAD_TEMP_DIR) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff and os.path.normpath(entry.path) not in known:
+                        removed += 1
+                        freed += entry.stat().st_size
+                        if not options['dry_run']:
+                            os.remove(entry.path)
+        self.stdout.write(f"Uploads: removed {removed} abandoned uploads ({freed / 1024 / 1024:,.1f} MB)")
+
+    # --- Database ---
+
+    def vacuum(self, options):
+        if options['dry_run']:
+            return
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA auto_vacuum")
+                incremental = cursor.fetchone()[0] == 2
+                if not incremental and options.get('enable_incremental_vacuum'):
+                    # The mode only takes effect on an existing database after a full VACUUM,
+                    # which rewrites the file and holds the write lock until it finishes
+                    started = time.monotonic()
+                    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    cursor.execute("VACUUM")
+                    cursor.execute("PRAGMA auto_vacuum")
+                    incremental = cursor.fetchone()[0] == 2
+                    if incremental:
+                            self.stdout.write(
+                            f"Database: switched to incremental auto_vacuum in {time.monotonic() - started:.1f}s"
+                        )
+                if not incremental:
+                    self.stdout.write(self.style.WARNING(
+                        "SQLite auto_vacuum is not INCREMENTAL; free pages are not reclaimed. Run maintain "
+                        "once with --enable-incremental-vacuum during a quiet period to switch it."
+                    ))
+                else:
+                    cursor.execute("PRAGMA freelist_count")
+                    before = cursor.fetchone()[0]
+                    free_pages = before
+                    # Small steps keep each write lock short
+                    while free_pages:
+                        cursor.execute(f"PRAGMA incremental_vacuum({max(1, options['vacuum_pages'])})")
+                        cursor.fetchall()
+                        cursor.execute("PRAGMA freelist_count")
+                        remaining = cursor.fetchone()[0]
+                        if remaining >= free_pages:
+                            break
+                        free_pages = remaining
+                        time.sleep(options['pause'])
+                    self.stdout.write(f"Database: reclaimed {before - free_pages:,} free pages")
+                cursor.execute("ANALYZE")
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        self.stdout.write("Database: statistics refreshed")
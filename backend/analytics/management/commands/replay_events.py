@@ -0,0 +1,93 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from backend.analytics.counters import reset_shards
+from backend.analytics.engagement import update_retention_profile
+from backend.analytics.event_log import aggregate_segment, list_segments, merge_aggregates
+from backend.analytics.models import Video, ViewerSketch
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds engagement aggregates (counters, heatmaps, retention profiles and "
+        "unique-viewer sketches) from the raw event log. Segments are scanned in "
+        "parallel worker processes. Dry run unless --write is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=None, help="Event log directory (defaults to EVENT_LOG_DIR)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+        parser.add_argument('--batch-size', type=int, default=200, help="Videos written per transaction")
+        parser.add_argument(
+            '--write', action='store_true',
+            help="Replace the stored aggregates of every video in the log. Events from before "
+                 "the log existed are not in it, so only use this when the log covers all history.",
+        )
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or settings.EVENT_LOG_DIR
+        segments = list_segments(directory)
+        if not segments:
+            self.stdout.write(f"No event log segments in {directory}")
+            return
+
+        started = time.monotonic()
+        # Day boundaries for the viewer sketches follow the configured time zone
+        tz_offset = int(timezone.localtime().utcoffset().total_seconds())
+        totals = {}
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for done, part in enumerate(pool.map(aggregate_segment, segments, repeat(tz_offset)), start=1):
+                merge_aggregates(totals, part)
+                if done % 10 == 0 or done == len(segments):
+                    self.stdout.write(f"  scanned {done}/{len(segments)} segments")
+
+        elapsed = time.monotonic() - started
+        event_count = sum(sum(stats['event_counts'].values()) for stats in totals.values())
+        self.stdout.write(
+            f"Scanned {event_count:,} events for {len(totals):,} videos from {len(segments)} segments "
+            f"in {elapsed:.1f}s ({event_count / max(elapsed, 1e-9):,.0f} events/s)"
+        )
+
+        if not options['write']:
+            self.stdout.write("Dry run: nothing written. Pass --write to replace the stored aggregates.")
+            return
+
+        video_ids = sorted(totals)
+        batch_size = max(1, options['batch_size'])
+        for start in range(0, len(video_ids), batch_size):
+            with transaction.atomic():
+                for video_id in video_ids[start:start + batch_size]:
+                    self.write_video(video_id, totals[video_id])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt aggregates for {len(video_ids):,} videos"))
+
+    def write_video(self, video_id, stats):
+        video, _ = Video.objects.select_for_update().get_or_create(video_id=video_id)
+        if video.duration is None and stats['duration'] > 0:
+            video.duration = stats['duration']
+        video.play_count = stats['plays']
+        video.total_watch_time = stats['watch_time']
+        video.engagement_event_count = stats['events']
+        video.engagement_data = dict(video.engagement_data or {})
+        video.engagement_data['heatmap'] = {str(second): views for second, views in sorted(stats['heatmap'].items())}
+        # The log has every second, so a heatmap compacted by `maintain` is back at full resolution
+        video.heatmap_resolution = 1
+        video.engagement_version += 1
+        video.save(update_fields=[
+            'duration', 'play_count', 'total_watch_time', 'engagement_event_count',
+            'engagement_data', 'heatmap_resolution', 'engagement_version',
+        ])
+        reset_shards(video.video_id)
+        update_retention_profile(video, {}, rebuild=True)
+
+        ViewerSketch.objects.filter(video=video, day__in=list(stats['sketches'])).delete()
+        ViewerSketch.objects.bulk_create([
+            ViewerSketch(video=video, day=day, registers=registers)
+            for day, registers in stats['sketches'].items()
+        ])
@@ -0,0 +1,190 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from backend.analytics.engagement import update_retention_profile
+from backend.analytics.media import extract_thumbnail, probe, probe_duration
+from backend.analytics.models import Video
+from backend.analytics.streaming import local_media_path
+from backend.analytics.transcoding import transcode_video
+
+DEFAULT_CHECKPOINT = 'reprocess.checkpoint'
+
+
+def reprocess(video_id, source, thumbnail_path, want_duration, want_thumbnail, timeout, thumbnail_timeout):
+    """
+    Runs in a worker process: probes the file and/or extracts its thumbnail.
+    Both are killed once they run past their timeout, so a stuck file can't
+    hold a worker.
+
+    Returns:
+        tuple: (video_id, duration or None, thumbnail written, error message or None)
+    """
+    duration = None
+    error = None
+    if want_duration:
+        try:
+            duration = probe_duration(probe(source, timeout))
+        except Exception as e:
+            error = f"probe failed: {e}"
+    thumbnail_ok = want_thumbnail and extract_thumbnail(source, thumbnail_path, timeout=thumbnail_timeout)
+    if want_thumbnail and not thumbnail_ok:
+        error = error or "thumbnail extraction failed"
+    return video_id, duration, thumbnail_ok, error
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-runs ffprobe and thumbnail extraction for uploaded and direct-link videos in a "
+        "process pool. By default only videos missing a duration or thumbnail are selected; "
+        "use --all after changing thumbnail settings. Progress is checkpointed after every "
+        "batch, so an interrupted run continues where it stopped. With --hls it runs HLS "
+        "transcodes instead: those a server restart left 'pending' or 'processing' (run it "
+        "once no server can still be transcoding them, e.g. on deploy), or every local "
+        "file with --all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Reprocess every video with a file, not just incomplete ones")
+        parser.add_argument('--missing', choices=['duration', 'thumbnail'], help="Only videos missing this")
+        parser.add_argument('--source', action='append', help="Limit to a source (repeatable; default upload and direct)")
+        parser.add_argument('--video-id', action='append', help="Limit to specific videos (repeatable)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+        parser.add_argument('--batch-size', type=int, default=100, help="Videos written to the DB per batch")
+        parser.add_argument('--timeout', type=float, default=None, help="ffprobe timeout per file (defaults to FFPROBE_TIMEOUT)")
+        parser.add_argument(
+            '--thumbnail-timeout', type=float, default=None,
+            help="ffmpeg thumbnail timeout per file (defaults to THUMBNAIL_TIMEOUT)",
+        )
+        parser.add_argument(
+            '--base-url', default='http://localhost:8000',
+            help="Public server URL that thumbnail URLs are built on (views use the request's host)",
+        )
+        parser.add_argument('--checkpoint', default=None, help=f"Checkpoint file (defaults to {DEFAULT_CHECKPOINT} in BASE_DIR)")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+        parser.add_argument('--hls', action='store_true', help="Run interrupted HLS transcodes (all of them with --all)")
+
+    def handle(self, *args, **options):
+        videos = Video.objects.filter(source__in=options['source'] or ['upload', 'direct']).exclude(path__isnull=True).exclude(path='')
+        if options['video_id']:
+            videos = videos.filter(video_id__in=options['video_id'])
+        if options['hls']:
+            self.transcode(videos, options)
+            return
+        if options['missing'] == 'duration':
+            videos = videos.filter(duration__isnull=True)
+        elif options['missing'] == 'thumbnail':
+            videos = videos.filter(Q(thumbnail__isnull=True) | Q(thumbnail=''))
+        elif not options['all']:
+            videos = videos.filter(Q(duration__isnull=True) | Q(thumbnail__isnull=True) | Q(thumbnail=''))
+
+        checkpoint = options['checkpoint'] or os.path.join(settings.BASE_DIR, DEFAULT_CHECKPOINT)
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        done = set()
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = {line.strip() for line in f if line.strip()}
+            self.stdout.write(f"Resuming: {len(done):,} videos already processed according to {checkpoint}")
+
+        jobs = [
+            video for video in videos.only('video_id', 'path', 'duration', 'thumbnail').order_by('pk')
+            if video.video_id not in done
+        ]
+        if not jobs:
+            self.stdout.write("Nothing to reprocess.")
+            return
+
+        thumbnail_dir = os.path.join(settings.MEDIA_ROOT, 'thumbnails')
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        thumbnail_base = options['base_url'].rstrip('/') + settings.MEDIA_URL + 'thumbnails/'
+
+        started = time.monotonic()
+        processed = failed = 0
+        pending = []
+        self.stdout.write(f"Reprocessing {len(jobs):,} videos with {options['workers']} workers")
+        # Workers re-initialise Django so this also works where processes are spawned, not forked
+        with ProcessPoolExecutor(max_workers=max(1, options['workers']), initializer=django.setup) as pool, \
+                open(checkpoint, 'a') as checkpoint_file:
+            futures = [
+                pool.submit(
+                    reprocess,
+                    video.video_id,
+                    video.path if video.path.startswith(('http://', 'https://')) else local_media_path(video.path),
+                    os.path.join(thumbnail_dir, f"{video.video_id}.jpg"),
+                    options['all'] or video.duration is None,
+                    options['all'] or not video.thumbnail,
+                    options['timeout'],
+                    options['thumbnail_timeout'],
+                )
+                for video in jobs
+            ]
+            for future in as_completed(futures):
+                video_id, duration, thumbnail_ok, error = future.result()
+                processed += 1
+                if error:
+                    failed += 1
+                    self.stderr.write(f"  {video_id}: {error}")
+                pending.append((video_id, duration, thumbnail_base + f"{video_id}.jpg" if thumbnail_ok else None))
+
+                if len(pending) >= options['batch_size'] or processed == len(jobs):
+                    self.write_batch(pending)
+                    # Only committed work is checkpointed
+                    checkpoint_file.write(''.join(f"{video_id}\n" for video_id, _, _ in pending))
+                    checkpoint_file.flush()
+                    pending = []
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f"  {processed:,}/{len(jobs):,} videos ({processed / max(elapsed, 1e-9):.1f}/s), {failed} failed"
+                    )
+
+        os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Reprocessed {processed:,} videos in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.1f}/s), {failed} failed"
+        ))
+
+    def transcode(self, videos, options):
+        """Transcodes in the worker pool; transcode_video records each outcome in hls_status."""
+        videos = videos.exclude(path__startswith='http://').exclude(path__startswith='https://')
+        if not options['all']:
+            videos = videos.filter(hls_status__in=['pending', 'processing'])
+        video_ids = list(videos.order_by('pk').values_list('video_id', flat=True))
+        if not video_ids:
+            self.stdout.write("No transcodes to run.")
+            return
+
+        Video.objects.filter(video_id__in=video_ids).update(hls_status='pending')
+        started = time.monotonic()
+        self.stdout.write(f"Transcoding {len(video_ids):,} videos with {options['workers']} workers")
+        with ProcessPoolExecutor(max_workers=max(1, options['workers']), initializer=django.setup) as pool:
+            futures = [pool.submit(transcode_video, video_id) for video_id in video_ids]
+            for done, _ in enumerate(as_completed(futures), start=1):
+                self.stdout.write(f"  {done:,}/{len(video_ids):,} videos")
+
+        failed = Video.objects.filter(video_id__in=video_ids, hls_status='failed').count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Transcoded {len(video_ids) - failed:,} videos in {time.monotonic() - started:.1f}s, {failed} failed"
+        ))
+
+    def write_batch(self, results):
+        """Saves (video_id, duration, thumbnail URL) results; None means unchanged."""
+        durations = [Video(video_id=video_id, duration=duration) for video_id, duration, _ in results if duration is not None]
+        thumbnails = [Video(video_id=video_id, thumbnail=thumbnail) for video_id, _, thumbnail in results if thumbnail]
+        with transaction.atomic():
+            # Lay out retention profiles for videos that only now have a duration
+            gained_duration = set(
+                Video.objects.filter(video_id__in=[video.video_id for video in durations], duration__isnull=True)
+                .values_list('video_id', flat=True)
+            )
+            # Separate updates so a field that wasn't reprocessed is never written
+            Video.objects.bulk_update(durations, ['duration'])
+            Video.objects.bulk_update(thumbnails, ['thumbnail'])
+            for video in Video.objects.filter(video_id__in=gained_duration):
+                update_retention_profile(video, {}, rebuild=True)
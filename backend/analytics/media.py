@@ -0,0 +1,124 @@
+# ffprobe / ffmpeg helpers.
+# The sync versions are for background threads and worker processes. The
+# async versions run ffmpeg through asyncio.create_subprocess_exec with a
+# per-call timeout and a shared concurrency limit, so async views never
+# block a thread (or the event loop) on a slow file or remote URL.
+
+import asyncio
+import json
+import subprocess
+import weakref
+
+import ffmpeg
+from django.conf import settings
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_PROBE_TIMEOUT = 30
+DEFAULT_THUMBNAIL_TIMEOUT = 60
+
+# One semaphore per event loop (asyncio primitives are bound to a loop)
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def thumbnail_command(video_path, thumbnail_path, time_offset=1):
+    """The ffmpeg pipeline that grabs one frame as a gallery thumbnail."""
+    # Thumbnails are only shown small in the gallery, so scale them down at extraction time
+    width = getattr(settings, 'THUMBNAIL_WIDTH', 320)
+    return (
+        ffmpeg
+        .input(video_path, ss=time_offset)
+        .filter('scale', width, -2)
+        .output(thumbnail_path, vframes=1)
+        .overwrite_output()
+    )
+
+
+# Helper function to extract a thumbnail from a video file
+def extract_thumbnail(video_path, thumbnail_path, time_offset=1, timeout=None):
+    """Runs thumbnail_command; ffmpeg is killed after `timeout` seconds (THUMBNAIL_TIMEOUT by default)."""
+    timeout = timeout or getattr(settings, 'THUMBNAIL_TIMEOUT', DEFAULT_THUMBNAIL_TIMEOUT)
+    args = thumbnail_command(video_path, thumbnail_path, time_offset).compile()
+    try:
+        result = subprocess.run(args, stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout)
+        if result.returncode != 0:
+            raise ffmpeg.Error('ffmpeg', result.stdout, result.stderr)
+        return True
+    except subprocess.TimeoutExpired:
+        print(f"Timed out extracting thumbnail from {video_path}")
+        return False
+    except Exception as e:
+        print(f"Failed to extract thumbnail: {e}")
+        return False
+
+
+def probe(path, timeout=None):
+    """ffmpeg.probe() with a timeout, after which ffprobe is killed (subprocess.TimeoutExpired)."""
+    timeout = timeout or getattr(settings, 'FFPROBE_TIMEOUT', DEFAULT_PROBE_TIMEOUT)
+    args = ['ffprobe', '-show_format', '-show_streams', '-of', 'json', path]
+    result = subprocess.run(args, stdin=subprocess.DEVNULL, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        raise ffmpeg.Error('ffprobe', result.stdout, result.stderr)
+    return json.loads(result.stdout.decode('utf-8'))
+
+
+def probe_duration(meta):
+    """Duration in seconds from ffprobe output, or None if it isn't known."""
+    try:
+        return float(meta['format']['duration'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# --- Async versions ---
+
+def _semaphore():
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(getattr(settings, 'FFMPEG_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+    return _semaphores[loop]
+
+
+async def run_async(args, timeout):
+    """
+    Runs an ffmpeg/ffprobe command line without blocking.
+
+    Raises:
+        asyncio.TimeoutError: if it takes longer than `timeout`; the process is killed.
+        ffmpeg.Error: if it exits with a non-zero status.
+    """
+    async with _semaphore():
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise ffmpeg.Error(args[0], stdout, stderr)
+        return stdout
+
+
+async def probe_async(path, timeout=None):
+    """Async equivalent of ffmpeg.probe()."""
+    timeout = timeout or getattr(settings, 'FFPROBE_TIMEOUT', DEFAULT_PROBE_TIMEOUT)
+    stdout = await run_async(['ffprobe', '-show_format', '-show_streams', '-of', 'json', path], timeout)
+    return json.loads(stdout.decode('utf-8'))
+
+
+async def extract_thumbnail_async(video_path, thumbnail_path, time_offset=1, timeout=None):
+    timeout = timeout or getattr(settings, 'THUMBNAIL_TIMEOUT', DEFAULT_THUMBNAIL_TIMEOUT)
+    try:
+        await run_async(thumbnail_command(video_path, thumbnail_path, time_offset).compile(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        print(f"Timed out extracting thumbnail from {video_path}")
+        return False
+    except Exception as e:
+        print(f"Failed to extract thumbnail: {e}")
+        return False
@@ -0,0 +1,120 @@
+import gzip
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .profiling import profile, profiler
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli
+    brotli = None
+
+DEFAULT_COMPRESSION_MIN_BYTES = 1024
+DEFAULT_COMPRESSION_TYPES = ['application/json']
+DEFAULT_GZIP_LEVEL = 4
+DEFAULT_BROTLI_QUALITY = 5
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests selected by the profiler (see profiling.py), tagged with
+    the URL name and video_id. Works in both sync and async stacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not profiler.enabled:
+            return self.get_response(request)
+        with profile(*self.route(request), request=request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not profiler.enabled:
+            return await self.get_response(request)
+        with profile(*self.route(request), request=request):
+            return await self.get_response(request)
+
+    def route(self, request):
+        """(handler, video_id) for a request; URL resolution only happens when profiling is on."""
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unresolved', None
+        return match.url_name or match.view_name, match.kwargs.get('video_id')
+
+
+def accepted_encodings(header):
+    """Content codings from an Accept-Encoding header -> q-value (refused ones are left out)."""
+    encodings = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if name and quality > 0:
+            encodings[name] = quality
+    return encodings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Brotli- (when the brotli package is installed) or gzip-compresses API
+    responses of COMPRESSION_TYPES over COMPRESSION_MIN_BYTES, whichever the
+    client prefers. Streamed media responses are left alone; video is
+    compressed already and Range requests must see the original bytes.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        types = getattr(settings, 'COMPRESSION_TYPES', DEFAULT_COMPRESSION_TYPES)
+        if not any(content_type.startswith(prefix) for prefix in types):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_BYTES', DEFAULT_COMPRESSION_MIN_BYTES):
+            return response
+
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        candidates = [name for name in ('br', 'gzip') if name in encodings and (name != 'br' or brotli)]
+        if not candidates:
+            return response
+        # Highest q-value wins; brotli on a tie, as it compresses JSON better
+        encoding = max(candidates, key=lambda name: (encodings[name], name == 'br'))
+        if encoding == 'br':
+            compressed = brotli.compress(
+                response.content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)
+            )
+        else:
+            compressed = gzip.compress(
+                response.content, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', DEFAULT_GZIP_LEVEL), mtime=0
+            )
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The body differs from the uncompressed one, so a strong ETag would be wrong
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_video_engagement_event_count_video_play_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='hls_playlist',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='hls_status',
+            field=models.CharField(choices=[('none', 'None'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_video_hls_playlist_video_hls_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionProfile',
+            fields=[
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='retention', serialize=False, to='analytics.video')),
+                ('duration', models.FloatField()),
+                ('buckets', models.JSONField(default=list)),
+                ('curve', models.JSONField(default=list)),
+                ('drop_offs', models.JSONField(default=list)),
+                ('rewatches', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_retentionprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('registers', models.BinaryField()),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='viewer_sketches', to='analytics.video')),
+            ],
+            options={
+                'unique_together': {('video', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_viewersketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingCheckpoint',
+            fields=[
+                ('window', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('landmark', models.FloatField()),
+                ('scores', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
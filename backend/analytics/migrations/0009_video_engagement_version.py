@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_trendingcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='engagement_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0009_video_engagement_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='heatmap_resolution',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='last_engaged_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
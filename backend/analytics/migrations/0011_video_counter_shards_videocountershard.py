@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0010_video_heatmap_resolution_video_last_engaged_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='VideoCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('play_count', models.PositiveIntegerField(default=0)),
+                ('total_watch_time', models.FloatField(default=0.0)),
+                ('engagement_event_count', models.PositiveIntegerField(default=0)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='analytics.video')),
+            ],
+            options={
+                'unique_together': {('video', 'shard')},
+            },
+        ),
+    ]
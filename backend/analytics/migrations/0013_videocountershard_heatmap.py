@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0012_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videocountershard',
+            name='heatmap',
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -1,5 +1,13 @@
 from django.db import models
 
+HLS_STATUS_CHOICES = [
+    ('none', 'None'),
+    ('pending', 'Pending'),
+    ('processing', 'Processing'),
+    ('ready', 'Ready'),
+    ('failed', 'Failed'),
+]
+
 class Video(models.Model):
     # Existing fields for all video types
     video_id = models.CharField(max_length=100, primary_key=True)
@@ -23,5 +31,99 @@ class Video(models.Model):
     play_count = models.PositiveIntegerField(default=0)  # Number of times the video was played
     engagement_event_count = models.PositiveIntegerField(default=0)  # Number of engagement events (play, pause, etc.)
 
+    # Adaptive streaming renditions produced in the background for uploads
+    hls_status = models.CharField(max_length=10, choices=HLS_STATUS_CHOICES, default='none')
+    hls_playlist = models.TextField(null=True, blank=True)  # Path of the master playlist
+
+    # Bumped whenever engagement aggregates change, so derived caches can key on it
+    engagement_version = models.PositiveIntegerField(default=0)
+    last_engaged_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    heatmap_resolution = models.PositiveSmallIntegerField(default=1)  # Seconds per heatmap key; raised by `maintain`
+    counter_shards = models.PositiveSmallIntegerField(default=0)  # Counter shard rows in use; 0 = counters live on this row
+
+    def __str__(self):
+        return self.title or self.video_id
+
+class VideoCounterShard(models.Model):
+    """
+    One slice of a hot video's counters. Increments go to a random shard so
+    concurrent writers don't queue on the Video row; a video's totals are its
+    own counters plus the sum of its shards (see counters.py). Heatmap views
+    are also collected here and periodically folded into the Video row.
+    """
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    play_count = models.PositiveIntegerField(default=0)
+    total_watch_time = models.FloatField(default=0.0)
+    engagement_event_count = models.PositiveIntegerField(default=0)
+    heatmap = models.JSONField(default=dict)  # Views not yet folded into the video's heatmap: second -> views
+
+    class Meta:
+        unique_together = ('video', 'shard')
+
+    def __str__(self):
+        return f"Counter shard {self.shard} of {self.video_id}"
+
+class UploadSession(models.Model):
+    """
+    A resumable chunked upload in progress. Parts are appended to `path`
+    (under UPLOAD_TEMP_DIR) at `offset`; completing it moves the file into
+    media/videos and creates the Video.
+    """
+    upload_id = models.CharField(max_length=36, primary_key=True)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()  # Declared total size in bytes
+    offset = models.BigIntegerField(default=0)  # Bytes received and verified so far
+    path = models.TextField()
+    video = models.ForeignKey(Video, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')  # Set once complete
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.upload_id} ({self.offset}/{self.size} bytes)"
+
+class RetentionProfile(models.Model):
+    """
+    Audience retention of a video, bucketed by relative position so its size
+    is fixed however long the video is. Maintained on write by
+    engagement.apply_engagement_batch and read as-is by the retention endpoint.
+    """
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, primary_key=True, related_name='retention')
+    duration = models.FloatField()  # Duration the buckets were laid out against
+    buckets = models.JSONField(default=list)  # Summed heatmap views per bucket
+    curve = models.JSONField(default=list)  # Audience per bucket relative to the start
+    drop_offs = models.JSONField(default=list)  # Largest falls between neighbouring buckets
+    rewatches = models.JSONField(default=list)  # Largest rises between neighbouring buckets
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Retention for {self.video_id}"
+
+class ViewerSketch(models.Model):
+    """
+    HyperLogLog sketch of the client sessions that watched a video on one day.
+    Fixed size (see hll.py) and mergeable across days and videos.
+    """
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='viewer_sketches')
+    day = models.DateField()
+    registers = models.BinaryField()
+
+    class Meta:
+        unique_together = ('video', 'day')
+
+    def __str__(self):
+        return f"Viewers of {self.video_id} on {self.day}"
+
+class TrendingCheckpoint(models.Model):
+    """
+    One trending leaderboard window, merged from every server process's
+    in-memory board at its periodic checkpoints (see trending.py) and reloaded
+    on startup.
+    """
+    window = models.CharField(max_length=10, primary_key=True)  # e.g. '5m', '1h', '24h'
+    landmark = models.FloatField()  # Forward-decay reference time (Unix seconds)
+    scores = models.JSONField(default=dict)  # video_id -> forward-decayed score
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return self.title or self.video_id
\ No newline at end of file
+        return f"Trending checkpoint ({self.window})"
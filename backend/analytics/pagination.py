@@ -0,0 +1,10 @@
+from rest_framework.pagination import PageNumberPagination
+
+class VideoPagination(PageNumberPagination):
+    """
+    Page-at-a-time listing for the gallery. Clients can ask for a different
+    page size with ?page_size=, capped so one request stays cheap.
+    """
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,204 @@
+# Opt-in sampling profiler for views and WebSocket handlers.
+# A profiled request or message registers a session; one background thread
+# samples the threads running active sessions with sys._current_frames()
+# every PROFILING_INTERVAL seconds and, when the session ends, writes the
+# samples as collapsed stacks (one "frame;frame;... count" line per stack) that
+# flamegraph.pl, speedscope and similar tools read directly.
+#
+# Stacks are cut at the outermost frame handling the profiled request (or, for
+# WebSocket messages, the frame that opened the session), so concurrent work
+# in the same process doesn't leak into a profile. Time a coroutine spends
+# suspended, waiting on I/O or other tasks, is not sampled.
+#
+# When profiling is off, profile() returns a shared no-op context manager after
+# one attribute check, so the hooks can stay in place permanently.
+
+import contextlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_DIR = 'profiles'
+
+_NOT_PROFILING = contextlib.nullcontext()
+
+
+def _label(value):
+    return re.sub(r'[^\w.-]', '_', str(value))[:100]
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """
+    Samples collected for one request or message. Request sessions follow the
+    request object into whichever thread handles it (sync views under ASGI run
+    in a worker thread); other sessions follow the block that opened them.
+    """
+
+    def __init__(self, profiler, handler, video_id, request=None):
+        self.profiler = profiler
+        self.handler = handler
+        self.video_id = video_id
+        self.request = request
+        self.samples = Counter()
+        self.thread_id = None
+        self.anchor = None
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        self.anchor = sys._getframe(1)
+        self.profiler.start(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.finish(self)
+        self.anchor = self.request = None
+        return False
+
+    def sample(self, frames):
+        """Records the session's current stack from a sys._current_frames() snapshot."""
+        if self.request is None:
+            stacks = [self._stack_to_anchor(frames.get(self.thread_id))]
+        else:
+            stacks = [self._stack_to_request(frame) for frame in frames.values()]
+        # Tagging the root lets profiles from many files be merged without losing context
+        root = [self.handler, f"video:{self.video_id}"] if self.video_id else [self.handler]
+        for stack in stacks:
+            if stack:
+                self.samples[';'.join(root + [_frame_name(frame) for frame in reversed(stack)])] += 1
+
+    def _stack_to_anchor(self, frame):
+        stack = []
+        while frame is not None and frame is not self.anchor:
+            stack.append(frame)
+            frame = frame.f_back
+        if frame is None:
+            return None  # The block isn't on its thread's stack right now (e.g. awaiting)
+        stack.append(frame)
+        return stack
+
+    def _stack_to_request(self, frame):
+        stack = []
+        root = 0
+        while frame is not None:
+            stack.append(frame)
+            if 'request' in frame.f_code.co_varnames and frame.f_locals.get('request') is self.request:
+                root = len(stack)  # Keep walking: the outermost frame handling the request wins
+            frame = frame.f_back
+        return stack[:root]
+
+
+class Profiler:
+    """
+    Process-wide profiler state. Starts from the PROFILING_* settings and can
+    be changed at runtime (see ProfilingView); changes apply to this process only.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.active = set()
+        self.finished = []
+        self.thread = None
+        self.enabled = getattr(settings, 'PROFILING_ENABLED', False)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        self.routes = set(getattr(settings, 'PROFILING_ROUTES', []))
+        self.interval = getattr(settings, 'PROFILING_INTERVAL', DEFAULT_INTERVAL)
+        self.output_dir = getattr(settings, 'PROFILING_DIR', DEFAULT_DIR)
+
+    def configure(self, enabled=None, sample_rate=None, routes=None, interval=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if routes is not None:
+            self.routes = set(routes)
+        if interval is not None:
+            self.interval = max(float(interval), 0.001)
+
+    def state(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'routes': sorted(self.routes),
+            'interval': self.interval,
+            'output_dir': self.output_dir,
+            'active_sessions': len(self.active),
+        }
+
+    def should_profile(self, handler):
+        """Whether to profile this call: always for listed routes, else by sample rate."""
+        if not self.enabled:
+            return False
+        return handler in self.routes or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self, session):
+        with self.lock:
+            self.active.add(session)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+                self.thread.start()
+            self.wake.set()
+
+    def finish(self, session):
+        with self.lock:
+            self.active.discard(session)
+            self.finished.append(session)
+            self.wake.set()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self.wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            frames.pop(own_id, None)
+            with self.lock:
+                active = list(self.active)
+                finished, self.finished = self.finished, []
+                if not active and not finished:
+                    self.wake.clear()
+            for session in active:
+                session.sample(frames)
+            del frames
+            # Files are written here so profiled requests don't pay for the I/O
+            for session in finished:
+                self._write(session)
+
+    def _write(self, session):
+        if not session.samples:
+            return  # Finished within one interval
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = time.strftime('%Y%m%dT%H%M%S')
+            name = f"{_label(session.handler)}.{_label(session.video_id or '-')}.{stamp}.{os.getpid()}.{id(session):x}.folded"
+            with open(os.path.join(self.output_dir, name), 'w') as f:
+                for stack, count in session.samples.items():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            print(f"Failed to write profile: {e}")
+
+
+profiler = Profiler()
+
+
+def profile(handler, video_id=None, request=None):
+    """
+    Context manager that profiles the enclosed block if profiling is on and
+    the call is selected. `handler` is a URL name or consumer method name;
+    pass `request` to follow an HTTP request across threads.
+    """
+    if not profiler.enabled or not profiler.should_profile(handler):
+        return _NOT_PROFILING
+    return ProfileSession(profiler, handler, video_id, request)
@@ -0,0 +1,148 @@
+# Fast JSON rendering for the analytics API.
+# FastJSONRenderer encodes with orjson when it is installed (several times
+# faster than the json module on big nested heatmaps) and falls back to DRF's
+# encoder otherwise. Either way it can splice in RawJSON values: fragments that
+# were encoded earlier and are copied into the output as-is. Serializers use
+# them for engagement_data, whose encoded bytes are cached per video and
+# engagement_version, so an unchanged heatmap is neither loaded from the DB
+# nor re-encoded.
+
+import json
+import re
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Video
+
+try:
+    import orjson
+except ImportError:  # Optional: pip install orjson
+    orjson = None
+
+DEFAULT_ENGAGEMENT_JSON_CACHE_SECONDS = 3600
+
+# Escaped so the output stays a strict JavaScript subset, as DRF does
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class RawJSON:
+    """An already encoded JSON value, rendered verbatim by FastJSONRenderer."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def tolist(self):
+        # DRF's encoder calls tolist() on objects it doesn't know, so other
+        # renderers still work, they just decode the fragment first
+        return json.loads(self.data)
+
+
+def encode(value):
+    """Compact JSON bytes for a plain value."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except (orjson.JSONEncodeError, TypeError):
+            pass  # e.g. integers over 64 bits
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer that uses orjson when available and copies RawJSON
+    fragments into the output. Indented output (the browsable API, or
+    `Accept: application/json; indent=4`) goes through the json module.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+
+        # RawJSON values are first encoded as unique placeholder strings
+        fragments = []
+        marker = f"rawjson-{secrets.token_hex(8)}-"
+        encoder = self.encoder_class()
+
+        def default(obj):
+            if isinstance(obj, RawJSON):
+                fragments.append(obj.data)
+                return f"{marker}{len(fragments) - 1}"
+            return encoder.default(obj)
+
+        output = None
+        if orjson is not None and indent is None:
+            try:
+                output = orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS)
+            except (orjson.JSONEncodeError, TypeError):
+                fragments.clear()
+        if output is None:
+            if indent is None:
+                separators = (',', ':') if self.compact else (', ', ': ')
+            else:
+                separators = (',', ': ')
+            output = json.dumps(
+                data, cls=self.encoder_class, default=default,
+                indent=indent, ensure_ascii=self.ensure_ascii,
+                allow_nan=not self.strict, separators=separators,
+            ).encode()
+
+        if fragments:
+            output = re.sub(
+                b'"' + marker.encode() + rb'(\d+)"',
+                lambda match: fragments[int(match.group(1))],
+                output,
+            )
+        for char, escaped in LINE_SEPARATORS:
+            if char in output:
+                output = output.replace(char, escaped)
+        return output
+
+
+# --- Pre-encoded engagement data ---
+
+def engagement_json_enabled():
+    return bool(getattr(settings, 'ENGAGEMENT_JSON_CACHE_SECONDS', DEFAULT_ENGAGEMENT_JSON_CACHE_SECONDS))
+
+
+def engagement_json_key(video_id, version):
+    return f"engagement_json:{video_id}:{version}"
+
+
+def engagement_json_many(videos):
+    """
+    Encoded engagement_data for the given videos, from the cache where their
+    engagement_version is cached and with one query for the rest. The videos
+    may have engagement_data deferred.
+
+    Returns:
+        dict: video_id -> RawJSON
+    """
+    keys = {engagement_json_key(video.video_id, video.engagement_version): video.video_id for video in videos}
+    cached = cache.get_many(keys)
+    result = {keys[key]: RawJSON(data) for key, data in cached.items()}
+
+    missing = [video_id for key, video_id in keys.items() if key not in cached]
+    if missing:
+        timeout = getattr(settings, 'ENGAGEMENT_JSON_CACHE_SECONDS', DEFAULT_ENGAGEMENT_JSON_CACHE_SECONDS)
+        encoded = {}
+        # Data and version are read together, so an entry never holds older data than its key says
+        rows = Video.objects.filter(video_id__in=missing).values_list('video_id', 'engagement_version', 'engagement_data')
+        for video_id, version, data in rows:
+            data = encode(data)
+            encoded[engagement_json_key(video_id, version)] = data
+            result[video_id] = RawJSON(data)
+        cache.set_many(encoded, timeout)
+    return result
+
+
+def engagement_json(video):
+    """Encoded engagement_data of one video (see engagement_json_many)."""
+    return engagement_json_many([video]).get(video.video_id) or RawJSON(b'{}')
+
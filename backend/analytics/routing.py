@@ -4,4 +4,6 @@ from . import consumers
 websocket_urlpatterns = [
     # This pattern correctly captures UUIDs with hyphens
     re_path(r'ws/engage/(?P<video_id>[\w-]+)/$', consumers.EngagementConsumer.as_asgi()),
+    # Read-only multi-video live stats for dashboards
+    re_path(r'ws/dashboard/$', consumers.DashboardConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -1,7 +1,63 @@
 from rest_framework import serializers
 from .models import Video
+from .counters import COUNTER_FIELDS, combined_totals, shard_totals
+from .renderers import engagement_json, engagement_json_enabled, engagement_json_many
+
+class VideoListSerializer(serializers.ListSerializer):
+    """
+    Fetches the counter shards of every sharded video on the page, and the
+    encoded engagement data of every video, with one query each.
+    """
+    def to_representation(self, data):
+        videos = list(data.all() if hasattr(data, 'all') else data)
+        self.child.shard_totals = shard_totals([video.video_id for video in videos if video.counter_shards])
+        if 'engagement_data' in self.child.fields and self.child.pre_encoded_engagement():
+            self.child.engagement_json = engagement_json_many(videos)
+        return super().to_representation(videos)
+
+class EngagementDataField(serializers.JSONField):
+    """
+    Renders engagement_data from its pre-encoded bytes (see renderers.py)
+    when the serializer says so, without touching the model attribute, so
+    views can defer the column.
+    """
+    def get_attribute(self, instance):
+        if not self.parent.pre_encoded_engagement():
+            return super().get_attribute(instance)
+        if self.parent.engagement_json is not None and instance.video_id in self.parent.engagement_json:
+            return self.parent.engagement_json[instance.video_id]
+        return engagement_json(instance)
 
 class VideoSerializer(serializers.ModelSerializer):
+    """
+    Takes an optional `fields` argument to limit the output to a subset of
+    fields, so list clients don't pay for data they don't display.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    engagement_data = EngagementDataField(read_only=True)
+
+    shard_totals = None
+    engagement_json = None
+
+    def pre_encoded_engagement(self):
+        """API views render through FastJSONRenderer; plain JsonResponse callers get a dict."""
+        return 'request' in self.context and engagement_json_enabled()
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Hot videos keep part of their counters in shard rows
+        fields = [field for field in COUNTER_FIELDS if field in data]
+        if fields and instance.counter_shards:
+            data.update(combined_totals(instance, self.shard_totals, fields))
+        return data
+
     class Meta:
         model = Video
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        list_serializer_class = VideoListSerializer
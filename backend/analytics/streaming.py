@@ -0,0 +1,172 @@
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+# Used when VIDEO_STREAM_CHUNK_SIZE is not configured
+DEFAULT_CHUNK_SIZE = 512 * 1024
+
+# Only a single "bytes=start-end" range is supported. Multi-range requests
+# fall back to a full 200 response, which RFC 9110 allows.
+RANGE_RE = re.compile(r'^\s*bytes=(\d*)-(\d*)\s*$')
+
+
+def local_media_path(path):
+    """Resolves a stored (possibly project-relative) media path to an absolute one."""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(settings.BASE_DIR, path)
+
+
+def file_etag(stat):
+    """An ETag built from size and mtime, the same validator nginx uses for static files."""
+    return quote_etag(f"{stat.st_size:x}-{int(stat.st_mtime_ns):x}")
+
+
+def parse_range(header, size):
+    """
+    Parses a Range header against a file of `size` bytes.
+
+    Returns an inclusive (start, end) tuple, or None when the header is absent
+    or unsupported. Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes of the file
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    """True when the Range header should be honoured according to If-Range."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/"')):
+        # Weak validators never match for If-Range
+        return not etag.startswith('W/') and etag in parse_etags(if_range)
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class FileRange:
+    """
+    A read-only window over a file, used as the body of a ranged response.
+
+    It exposes fileno() so WSGI servers with a wsgi.file_wrapper (gunicorn,
+    uWSGI) can hand the range to os.sendfile() instead of copying it through
+    Python; the read() fallback never returns more than the range.
+    """
+
+    def __init__(self, path, start, length):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+async def iter_file_range(path, start, length, chunk_size):
+    """Async chunk iterator for ASGI servers, reading off the event loop."""
+    fd = await sync_to_async(os.open, thread_sensitive=False)(path, os.O_RDONLY)
+    try:
+        offset = start
+        end = start + length
+        while offset < end:
+            chunk = await sync_to_async(os.pread, thread_sensitive=False)(
+                fd, min(chunk_size, end - offset), offset
+            )
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+    finally:
+        os.close(fd)
+
+
+def serve_file(request, path, content_type=None):
+    """
+    Serves a local file with Range, If-Range and conditional GET support.
+
+    Under WSGI the body is a file object so the server can use os.sendfile();
+    under ASGI it is streamed as an async iterator of VIDEO_STREAM_CHUNK_SIZE
+    chunks, since Django would otherwise buffer a sync iterator in memory.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return HttpResponse(status=404)
+
+    size = stat.st_size
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    status = 200
+    start, end = 0, size - 1
+    if size and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            response['Accept-Ranges'] = 'bytes'
+            return response
+        if byte_range:
+            status = 206
+            start, end = byte_range
+    length = end - start + 1 if size else 0
+
+    chunk_size = getattr(settings, 'VIDEO_STREAM_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    if request.method == 'HEAD':
+        response = HttpResponse(status=status, content_type=content_type)
+    elif request.META.get('wsgi.file_wrapper'):
+        response = FileResponse(FileRange(path, start, length), status=status, content_type=content_type)
+        response.block_size = chunk_size
+    else:
+        response = StreamingHttpResponse(
+            iter_file_range(path, start, length, chunk_size),
+            status=status,
+            content_type=content_type,
+        )
+
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if status == 206:
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    return response
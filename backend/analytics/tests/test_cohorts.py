@@ -0,0 +1,82 @@
+import numpy as np
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from backend.analytics import cohorts
+from backend.analytics.models import RetentionProfile, Video
+
+
+class ResampleTests(SimpleTestCase):
+    def test_same_size_is_unchanged(self):
+        np.testing.assert_array_equal(cohorts.resample([1.0, 0.5], 2), [1.0, 0.5])
+
+    def test_bucket_centres_line_up(self):
+        # Two buckets with centres at 0.25 and 0.75, sampled at 0.125, 0.375, 0.625 and 0.875
+        np.testing.assert_allclose(cohorts.resample([1.0, 0.0], 4), [1.0, 0.75, 0.25, 0.0])
+
+    def test_percentile_rank_counts_ties_half(self):
+        matrix = np.array([[0.1], [0.2], [0.3], [0.4]])
+        np.testing.assert_array_equal(cohorts.percentile_rank(matrix, np.array([0.3])), [62.5])
+
+
+@override_settings(COHORT_POSITIONS=4, COHORT_DURATION_BUCKETS=[60, 300])
+class CohortTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Five 30s uploads whose audience settles at 10% to 50% of the start
+        for index, level in enumerate([0.1, 0.2, 0.3, 0.4, 0.5]):
+            self.add(f"u{index}", 30, [1.0, level, level, level])
+
+    def add(self, video_id, duration, curve, source='upload'):
+        video = Video.objects.create(video_id=video_id, source=source, duration=duration, engagement_version=1)
+        RetentionProfile.objects.create(video=video, duration=duration, buckets=[], curve=curve)
+
+    def test_bands_and_median(self):
+        cohort = cohorts.get_cohorts()['cohorts']['upload:0-60s']
+        self.assertEqual(cohort['videos'], 5)
+        self.assertEqual(cohort['median'], [1.0, 0.3, 0.3, 0.3])
+        bands = {name: band[1] for name, band in cohort['bands'].items()}
+        self.assertEqual(bands, {'p10': 0.14, 'p25': 0.2, 'p50': 0.3, 'p75': 0.4, 'p90': 0.46})
+        self.assertEqual(cohort['outliers'], [])
+
+    def test_duration_bucket_edges(self):
+        self.add('edge', 60, [1.0, 1.0, 1.0, 1.0])
+        self.add('over', 61, [1.0, 1.0, 1.0, 1.0])
+        self.add('long', 5000, [1.0, 1.0, 1.0, 1.0], source='direct')
+        result = cohorts.get_cohorts()
+        self.assertEqual(result['cohorts']['upload:0-60s']['videos'], 6)
+        self.assertEqual(result['cohorts']['upload:60-300s']['videos'], 1)
+        self.assertEqual(result['cohorts']['direct:300s+']['videos'], 1)
+
+    def test_outliers(self):
+        self.add('viral', 30, [1.0, 5.0, 5.0, 5.0])
+        [outlier] = cohorts.get_cohorts()['cohorts']['upload:0-60s']['outliers']
+        self.assertEqual((outlier['video_id'], outlier['direction']), ('viral', 'above'))
+
+    def test_video_ranking(self):
+        ranking = cohorts.video_ranking('u2', second=15)
+        self.assertEqual((ranking['cohort'], ranking['cohort_videos']), ('upload:0-60s', 5))
+        self.assertEqual(ranking['percentile'], [50.0, 50.0, 50.0, 50.0])
+        self.assertEqual(ranking['at_second'], {
+            'second': 15, 'position': 2, 'retention': 0.3, 'percentile': 50.0, 'cohort_median': 0.3,
+        })
+        self.assertIsNone(cohorts.video_ranking('nope'))
+
+    def test_new_engagement_invalidates_the_cache(self):
+        self.assertEqual(cohorts.get_cohorts()['cohorts']['upload:0-60s']['videos'], 5)
+        # A profile change alone is served from the cache...
+        RetentionProfile.objects.filter(video_id='u0').update(curve=[1.0, 0.9, 0.9, 0.9])
+        self.assertEqual(cohorts.get_cohorts()['cohorts']['upload:0-60s']['median'][1], 0.3)
+        # ...until engagement_version moves, as every engagement write does
+        Video.objects.filter(video_id='u0').update(engagement_version=2)
+        self.assertEqual(cohorts.get_cohorts()['cohorts']['upload:0-60s']['median'][1], 0.4)
+
+    def test_views(self):
+        self.add('long', 5000, [1.0, 1.0, 1.0, 1.0], source='direct')
+        response = self.client.get('/api/cohorts/', {'source': 'direct'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['cohorts']), ['direct:300s+'])
+
+        self.assertEqual(self.client.get('/api/video/u2/cohort/', {'second': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/video/nope/cohort/').status_code, 404)
+        self.assertEqual(self.client.get('/api/video/u2/cohort/', {'second': 15}).json()['at_second']['position'], 2)
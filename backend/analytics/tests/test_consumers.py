@@ -0,0 +1,116 @@
+import json
+from unittest import mock
+
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+
+from backend.analytics.live_cache import live_cache
+from backend.analytics.models import Video, ViewerSketch
+from backend.asgi import application
+
+
+class ConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        # Raw events are recorded here instead of the on-disk event log
+        self.logged = []
+
+        async def write_async(video_id, events):
+            self.logged.extend((video_id, *event) for event in events)
+
+        patcher = mock.patch('backend.analytics.consumers.write_async', write_async)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self, path):
+        communicator = WebsocketCommunicator(application, path)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+
+class EngagementConsumerTests(ConsumerTestCase):
+    def tearDown(self):
+        live_cache.invalidate('mixed')
+
+    async def test_invalid_events_are_dropped_alone(self):
+        communicator = await self.connect('/ws/engage/mixed/')
+        await communicator.receive_json_from()  # heatmap_snapshot
+        for current_time, duration in ((1.5, 10), ("abc", 10), (None, 10), (2.5, 10), (3.5, "NaN"), (4.0, 10)):
+            await communicator.send_json_to({
+                'event': 'timeupdate', 'currentTime': current_time, 'duration': duration, 'sessionId': 's1',
+            })
+        # Disconnecting flushes the buffered batch
+        await communicator.disconnect()
+
+        video = await Video.objects.aget(video_id='mixed')
+        self.assertEqual(video.engagement_data['heatmap'], {'1': 1, '2': 1, '4': 1})
+        self.assertEqual(video.total_watch_time, 3)
+        self.assertTrue(await ViewerSketch.objects.filter(video_id='mixed').aexists())
+
+    async def test_only_valid_events_are_logged(self):
+        communicator = await self.connect('/ws/engage/mixed/')
+        await communicator.receive_json_from()
+        # Browsers report a NaN (null) duration until the video's metadata has loaded
+        await communicator.send_json_to({'event': 'play', 'currentTime': 0, 'duration': None, 'sessionId': 's1'})
+        await communicator.send_json_to({'event': 'timeupdate', 'currentTime': 'abc', 'duration': 10, 'sessionId': 's1'})
+        await communicator.send_json_to({'event': 'timeupdate', 'currentTime': 1.5, 'duration': 10, 'sessionId': 's1'})
+        await communicator.disconnect()
+
+        self.assertEqual(
+            [(video_id, name, current_time, duration, session_id)
+             for video_id, _, name, current_time, duration, session_id in self.logged],
+            [('mixed', 'connect', 0, 0, 's1'), ('mixed', 'play', 0.0, 0.0, 's1'), ('mixed', 'timeupdate', 1.5, 10.0, 's1')],
+        )
+
+
+class DashboardConsumerTests(ConsumerTestCase):
+    def setUp(self):
+        super().setUp()
+        for video_id in ('d1', 'd2', 'd3'):
+            Video.objects.create(video_id=video_id, total_watch_time=10)
+
+    def tearDown(self):
+        for video_id in ('d1', 'd2', 'd3'):
+            live_cache.invalidate(video_id)
+
+    async def test_subscribe_and_unsubscribe(self):
+        communicator = await self.connect('/ws/dashboard/')
+        await communicator.send_json_to({'action': 'subscribe', 'video_ids': ['d1', 'd2', 'd1', 'nope']})
+        self.assertEqual(await communicator.receive_json_from(), {
+            'type': 'subscribed', 'video_ids': ['d1', 'd2'], 'not_found': ['nope'], 'over_limit': [],
+        })
+        # The first tick sends every subscribed video in full
+        update = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(update['type'], 'live_update')
+        self.assertEqual(set(update['videos']), {'d1', 'd2'})
+        self.assertEqual(update['videos']['d1']['total_watch_time'], 10)
+
+        await communicator.send_json_to({'action': 'unsubscribe', 'video_ids': ['d1']})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'unsubscribed', 'video_ids': ['d1']})
+        await communicator.disconnect()
+
+    @override_settings(DASHBOARD_MAX_SUBSCRIPTIONS=2)
+    async def test_subscriptions_are_capped(self):
+        communicator = await self.connect('/ws/dashboard/')
+        await communicator.send_json_to({'action': 'subscribe', 'video_ids': ['d1']})
+        await communicator.receive_json_from()
+        await communicator.send_json_to({'action': 'subscribe', 'video_ids': ['d2', 'd3']})
+        self.assertEqual(await communicator.receive_json_from(), {
+            'type': 'subscribed', 'video_ids': ['d2'], 'not_found': [], 'over_limit': ['d3'],
+        })
+        await communicator.disconnect()
+
+    async def test_malformed_messages(self):
+        communicator = await self.connect('/ws/dashboard/')
+        for text_data in (
+            'not json',
+            json.dumps(['d1']),
+            json.dumps({'action': 'subscribe', 'video_ids': 'd1'}),
+            json.dumps({'action': 'subscribe', 'video_ids': {'d1': True}}),
+        ):
+            with self.subTest(text_data=text_data):
+                await communicator.send_to(text_data=text_data)
+                self.assertEqual(await communicator.receive_json_from(), {'type': 'error', 'error': 'Malformed message'})
+        # Nothing was subscribed, so no tick has anything to send
+        self.assertTrue(await communicator.receive_nothing(timeout=2.5))
+        await communicator.disconnect()
@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from backend.analytics import engagement
+from backend.analytics.counters import combined_totals, promote
+from backend.analytics.engagement import apply_engagement_batch, fold_shards
+from backend.analytics.live_cache import LiveStatsCache
+from backend.analytics.models import RetentionProfile, Video, VideoCounterShard
+
+EVENTS = [(0.5, 10.0), (1.5, 10.0), (1.7, 10.0), (6.2, 10.0)]
+
+
+def video_updates(queries):
+    return [query['sql'] for query in queries if query['sql'].startswith('UPDATE "analytics_video" ')]
+
+
+class UnshardedBatchTests(TestCase):
+    def test_only_the_fields_it_changes_are_written(self):
+        Video.objects.create(video_id='v', duration=10)
+        with CaptureQueriesContext(connection) as queries:
+            apply_engagement_batch('v', EVENTS)
+        [update] = video_updates(queries)
+        # A stale copy of these would undo concurrent add_play calls, promotion or transcoding
+        for field in ('play_count', 'counter_shards', 'hls_status'):
+            self.assertNotIn(f'"{field}"', update)
+        video = Video.objects.get(video_id='v')
+        self.assertEqual(video.engagement_data['heatmap'], {'0': 1, '1': 2, '6': 1})
+        self.assertEqual((video.total_watch_time, video.engagement_version), (4, 1))
+
+
+class ShardedBatchTests(TestCase):
+    def setUp(self):
+        Video.objects.create(video_id='v', duration=10, engagement_data={'heatmap': {'0': 5}}, engagement_version=2)
+        promote('v', shards=2)
+        # Folding is tested on its own
+        patcher = mock.patch.object(engagement.fold_timer, 'due', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_the_video_row_is_left_alone(self):
+        with CaptureQueriesContext(connection) as queries:
+            apply_engagement_batch('v', EVENTS)
+            apply_engagement_batch('v', EVENTS)
+        self.assertEqual(video_updates(queries), [])
+        video = Video.objects.get(video_id='v')
+        self.assertEqual((video.engagement_data['heatmap'], video.engagement_version), ({'0': 5}, 2))
+        self.assertFalse(RetentionProfile.objects.exists())
+        self.assertEqual(combined_totals(video)['total_watch_time'], 8)
+
+    def test_folding_moves_shard_views_onto_the_row(self):
+        apply_engagement_batch('v', EVENTS)
+        apply_engagement_batch('v', EVENTS)
+        self.assertEqual(fold_shards('v'), 8)
+        video = Video.objects.get(video_id='v')
+        self.assertEqual(video.engagement_data['heatmap'], {'0': 7, '1': 4, '6': 2})
+        self.assertEqual(video.engagement_version, 3)
+        self.assertIsNotNone(video.last_engaged_at)
+        # The first profile is laid out from the whole heatmap
+        self.assertEqual(sum(RetentionProfile.objects.get(video=video).buckets), 13)
+        self.assertFalse(VideoCounterShard.objects.exclude(heatmap={}).exists())
+        # Counters stay on the shards
+        self.assertEqual(combined_totals(video)['total_watch_time'], 8)
+        self.assertEqual(fold_shards('v'), 0)
+
+    def test_folding_uses_the_current_resolution(self):
+        apply_engagement_batch('v', EVENTS)
+        Video.objects.filter(video_id='v').update(heatmap_resolution=5)
+        fold_shards('v')
+        self.assertEqual(Video.objects.get(video_id='v').engagement_data['heatmap'], {'0': 8, '5': 1})
+
+    def test_live_stats_include_views_waiting_on_shards(self):
+        cache = LiveStatsCache()
+        cache.load('v')
+        with mock.patch.object(engagement, 'live_cache', cache):
+            apply_engagement_batch('v', EVENTS)
+        self.assertEqual(cache.snapshot('v')['heatmap'], {'0': 6, '1': 2, '6': 1})
+
+        fresh = LiveStatsCache()
+        fresh.load('v')
+        self.assertEqual(fresh.snapshot('v')['heatmap'], cache.snapshot('v')['heatmap'])
+        self.assertEqual(fresh.stats('v')['total_watch_time'], 4)
+
+        # A fold made by this process keeps the entry; its contents don't change
+        with mock.patch.object(engagement, 'live_cache', cache):
+            fold_shards('v')
+            apply_engagement_batch('v', EVENTS)
+        self.assertEqual(cache.snapshot('v')['heatmap'], {'0': 7, '1': 4, '6': 2})
@@ -0,0 +1,140 @@
+import math
+import os
+import shutil
+import struct
+import tempfile
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from backend.analytics import event_log
+from backend.analytics.engagement import apply_engagement_batch
+from backend.analytics.event_log import EventLogWriter, aggregate_segment, list_segments, merge_aggregates, read_segment
+from backend.analytics.models import Video, ViewerSketch
+
+# 2.9999999 rounds to 3.0 as a float32, so it would land in the wrong second
+EVENTS = [
+    (1_700_000_000.0, 'connect', 0, 0, 'session-a'),
+    (1_700_000_001.0, 'play', 0.0, 120.5, 'session-a'),
+    (1_700_000_002.0, 'timeupdate', 2.9999999, 120.5, 'session-a'),
+    (1_700_000_003.0, 'timeupdate', 3.25, 120.5, 'session-b'),
+    (1_700_000_004.0, 'pause', 3.5, 120.5, None),
+]
+
+
+class EventLogTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, video_id, events):
+        """Writes one segment (in its own directory, as segment names only differ per second)."""
+        directory = tempfile.mkdtemp(dir=self.directory)
+        writer = EventLogWriter(directory)
+        writer.append(video_id, events)
+        writer.close()
+        return list_segments(directory)[0]
+
+
+class RoundTripTests(EventLogTestCase):
+    def test_events_read_back_exactly(self):
+        path = self.write('video-1', EVENTS)
+        self.assertEqual(
+            list(read_segment(path)),
+            [(name, timestamp, current_time, duration, 'video-1', session_id)
+             for timestamp, name, current_time, duration, session_id in EVENTS],
+        )
+
+    def test_malformed_records_are_skipped_alone(self):
+        directory = tempfile.mkdtemp(dir=self.directory)
+        writer = EventLogWriter(directory)
+        bad = [
+            (1_700_000_005.0, 'timeupdate', 'abc', 120.5, 'session-a'),
+            (1_700_000_006.0, 'rewind', 1.0, 120.5, 'session-a'),
+        ]
+        self.assertEqual(writer.append('video-1', EVENTS[:2] + bad + EVENTS[2:]), 2)
+        writer.close()
+        self.assertEqual(len(list(read_segment(list_segments(directory)[0]))), len(EVENTS))
+
+    def test_truncated_tail_is_ignored(self):
+        path = self.write('video-1', EVENTS)
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 3)
+        self.assertEqual(len(list(read_segment(path))), len(EVENTS) - 1)
+
+    def test_version_1_segments_are_still_read(self):
+        old_event = struct.Struct('<BdffII')
+        path = os.path.join(self.directory, 'events-20240101T000000-1-0001.log')
+        with open(path, 'wb') as f:
+            f.write(b'VAEL\x01')
+            f.write(event_log.STRING.pack(event_log.STRING_RECORD, 1, 1) + b'v')
+            f.write(old_event.pack(event_log.EVENT_TYPES['timeupdate'], 1.0, 2.5, 10.0, 1, 0))
+        self.assertEqual(list(read_segment(path)), [('timeupdate', 1.0, 2.5, 10.0, 'v', None)])
+
+    def test_other_files_are_rejected(self):
+        path = os.path.join(self.directory, 'events-20240101T000000-1-0001.log')
+        with open(path, 'wb') as f:
+            f.write(b'NOTALOG' * 4)
+        with self.assertRaises(ValueError):
+            list(read_segment(path))
+
+
+class AggregateTests(EventLogTestCase):
+    def test_aggregates_mirror_the_live_definitions(self):
+        stats = aggregate_segment(self.write('video-1', EVENTS))['video-1']
+        self.assertEqual(stats['plays'], 1)
+        self.assertEqual(stats['watch_time'], 2)
+        self.assertEqual(stats['duration'], 120.5)
+        self.assertEqual(dict(stats['heatmap']), {2: 1, 3: 1})
+        self.assertEqual(stats['event_counts']['pause'], 1)
+        self.assertEqual(len(stats['sketches']), 1)
+
+    def test_merge_adds_segments(self):
+        first = aggregate_segment(self.write('video-1', EVENTS))
+        second = aggregate_segment(self.write('video-1', EVENTS))
+        total = merge_aggregates({}, first)
+        merge_aggregates(total, second)
+        self.assertEqual(total['video-1']['plays'], 2)
+        self.assertEqual(dict(total['video-1']['heatmap']), {2: 2, 3: 2})
+
+
+class ReplayTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_replay_rebuilds_what_the_live_path_wrote(self):
+        writer = EventLogWriter(self.directory)
+        writer.append('replayed', EVENTS)
+        writer.close()
+        apply_engagement_batch('live', [
+            (current_time, duration) for _, name, current_time, duration, _ in EVENTS if name == 'timeupdate'
+        ])
+
+        call_command('replay_events', directory=self.directory, write=True, workers=1, stdout=open(os.devnull, 'w'))
+
+        replayed = Video.objects.get(video_id='replayed')
+        live = Video.objects.get(video_id='live')
+        self.assertEqual(replayed.engagement_data['heatmap'], live.engagement_data['heatmap'])
+        self.assertEqual(replayed.engagement_data['heatmap'], {str(math.floor(2.9999999)): 1, '3': 1})
+        self.assertEqual(replayed.total_watch_time, live.total_watch_time)
+        self.assertEqual(replayed.play_count, 1)
+        self.assertEqual(replayed.duration, 120.5)
+        self.assertEqual(ViewerSketch.objects.filter(video=replayed).count(), 1)
+
+    def test_replay_restores_full_resolution(self):
+        Video.objects.create(video_id='replayed', engagement_data={'heatmap': {'0': 2}}, heatmap_resolution=5)
+        writer = EventLogWriter(self.directory)
+        writer.append('replayed', EVENTS)
+        writer.close()
+        call_command('replay_events', directory=self.directory, write=True, workers=1, stdout=open(os.devnull, 'w'))
+        replayed = Video.objects.get(video_id='replayed')
+        self.assertEqual(replayed.heatmap_resolution, 1)
+        self.assertEqual(replayed.engagement_data['heatmap'], {'2': 1, '3': 1})
+
+    def test_dry_run_writes_nothing(self):
+        writer = EventLogWriter(self.directory)
+        writer.append('replayed', EVENTS)
+        writer.close()
+        call_command('replay_events', directory=self.directory, workers=1, stdout=open(os.devnull, 'w'))
+        self.assertFalse(Video.objects.filter(video_id='replayed').exists())
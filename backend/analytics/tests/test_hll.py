@@ -0,0 +1,73 @@
+from datetime import date
+
+from django.test import SimpleTestCase, TestCase
+
+from backend.analytics import hll
+from backend.analytics.engagement import record_viewers, unique_viewers
+from backend.analytics.models import Video
+
+
+def sketch_of(items):
+    registers = bytearray(hll.empty())
+    for item in items:
+        hll.add(registers, item)
+    return bytes(registers)
+
+
+class HyperLogLogTests(SimpleTestCase):
+    def test_empty_sketch(self):
+        self.assertEqual(len(hll.empty()), hll.REGISTERS)
+        self.assertEqual(hll.estimate(hll.empty()), 0)
+
+    def test_adding_a_seen_item_changes_nothing(self):
+        registers = bytearray(hll.empty())
+        self.assertTrue(hll.add(registers, 'session-1'))
+        self.assertFalse(hll.add(registers, 'session-1'))
+
+    def test_small_counts_are_exact_enough(self):
+        self.assertEqual(hll.estimate(sketch_of(f"session-{i}" for i in range(10))), 10)
+
+    def test_estimate_error(self):
+        # ~1.6% standard error; 5% is over three standard errors
+        for count in (1_000, 20_000, 100_000):
+            with self.subTest(count=count):
+                estimate = hll.estimate(sketch_of(f"session-{i}" for i in range(count)))
+                self.assertLess(abs(estimate - count) / count, 0.05)
+
+    def test_merge_is_the_union(self):
+        a = sketch_of(f"session-{i}" for i in range(0, 6000))
+        b = sketch_of(f"session-{i}" for i in range(4000, 10000))
+        merged = hll.merge(a, b)
+        self.assertEqual(merged, sketch_of(f"session-{i}" for i in range(10000)))
+        self.assertEqual(merged, hll.merge(b, a))
+        self.assertEqual(hll.merge(merged, a), merged)
+
+    def test_merging_in_place(self):
+        sketches = [sketch_of(f"session-{i}" for i in range(start, start + 3000)) for start in (0, 2000, 9000)]
+        merged = bytearray(hll.empty())
+        for sketch in sketches:
+            hll.merge_into(merged, memoryview(sketch))
+        self.assertEqual(bytes(merged), hll.merge(hll.merge(sketches[0], sketches[1]), sketches[2]))
+        self.assertEqual(bytes(merged), sketch_of([f"session-{i}" for i in range(5000)] + [f"session-{i}" for i in range(9000, 12000)]))
+
+    def test_duplicates_do_not_inflate_the_estimate(self):
+        once = sketch_of(f"session-{i}" for i in range(5000))
+        twice = sketch_of([f"session-{i}" for i in range(5000)] * 2)
+        self.assertEqual(once, twice)
+
+
+class UniqueViewersTests(TestCase):
+    def test_sessions_are_counted_once_across_days_and_videos(self):
+        Video.objects.create(video_id='a')
+        Video.objects.create(video_id='b')
+        record_viewers('a', {f"session-{i}" for i in range(100)}, day=date(2024, 1, 1))
+        record_viewers('a', {f"session-{i}" for i in range(50, 150)}, day=date(2024, 1, 2))
+        record_viewers('b', {f"session-{i}" for i in range(100, 200)}, day=date(2024, 1, 2))
+
+        # Estimates, but linear counting is close to exact at these sizes
+        self.assertAlmostEqual(unique_viewers(['a'])['unique_viewers'], 150, delta=3)
+        self.assertAlmostEqual(unique_viewers(['a', 'b'])['unique_viewers'], 200, delta=4)
+        result = unique_viewers(['a'], start=date(2024, 1, 2), daily=True)
+        self.assertEqual(list(result['daily']), ['2024-01-02'])
+        self.assertEqual(result['daily']['2024-01-02'], result['unique_viewers'])
+        self.assertAlmostEqual(result['unique_viewers'], 100, delta=2)
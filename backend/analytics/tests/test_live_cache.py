@@ -0,0 +1,95 @@
+from django.test import TestCase
+
+from backend.analytics import live_cache as live_cache_module
+from backend.analytics.live_cache import LiveStatsCache
+from backend.analytics.models import Video
+
+
+class ChangesTests(TestCase):
+    def setUp(self):
+        Video.objects.create(video_id='v', total_watch_time=3, engagement_data={'heatmap': {'0': 1, '1': 1, '2': 1}})
+        self.cache = LiveStatsCache()
+        self.cache.load('v')
+        self.engagement_version = 0
+
+    def write(self, watch_time, heatmap_views):
+        self.engagement_version += 1
+        self.cache.apply('v', watch_time, heatmap_views, self.engagement_version - 1, self.engagement_version, 1)
+
+    def test_delta_holds_only_seconds_changed_after_the_baseline(self):
+        baseline = self.cache.snapshot('v')['version']
+        self.write(1, {'1': 1})
+        middle = self.cache.stats('v')['version']
+        self.write(2, {'2': 1, '3': 1})
+
+        self.assertEqual(self.cache.changes('v', baseline)['heatmap_delta'], {'1': 2, '2': 2, '3': 1})
+        self.assertEqual(self.cache.changes('v', middle)['heatmap_delta'], {'2': 2, '3': 1})
+        self.assertEqual(self.cache.stats('v')['total_watch_time'], 6)
+        latest = self.cache.changes('v', middle)['version']
+        self.assertEqual(self.cache.changes('v', latest)['heatmap_delta'], {})
+
+    def test_baselines_older_than_the_trimmed_log_need_a_snapshot(self):
+        baseline = self.cache.snapshot('v')['version']
+        for _ in range(live_cache_module.MIN_CHANGE_LOG * live_cache_module.CHANGE_LOG_FACTOR + 1):
+            self.write(0, {'0': 1})
+        self.assertIsNone(self.cache.changes('v', baseline)['heatmap_delta'])
+        recent = self.cache.stats('v')['version']
+        self.write(0, {'1': 4})
+        self.assertEqual(self.cache.changes('v', recent)['heatmap_delta'], {'1': 5})
+
+
+class LoadRaceTests(TestCase):
+    def test_a_write_during_a_load_is_not_lost(self):
+        video = Video.objects.create(video_id='v', engagement_data={'heatmap': {'0': 1}})
+
+        class RacingCache(LiveStatsCache):
+            raced = False
+
+            def _snapshot_of(self, video, totals=None, pending=None):
+                snapshot = super()._snapshot_of(video, totals, pending)
+                if not self.raced:
+                    # A batch commits after the row was read but before the entry is cached
+                    self.raced = True
+                    Video.objects.filter(pk='v').update(engagement_data={'heatmap': {'0': 2}}, engagement_version=1)
+                    self.apply('v', 0, {'0': 1}, 0, 1, 1)
+                return snapshot
+
+        cache = RacingCache()
+        self.assertTrue(cache.load(video.video_id))
+        self.assertEqual(cache.snapshot('v')['heatmap'], {'0': 2})
+        self.assertEqual(cache.loading, {})
+        self.assertEqual(cache.missed, set())
+
+    def test_missing_videos(self):
+        cache = LiveStatsCache()
+        Video.objects.create(video_id='a')
+        self.assertEqual(cache.load_many(['a', 'nope']), {'a'})
+        self.assertFalse(cache.load('nope'))
+
+
+class StalenessTests(TestCase):
+    def setUp(self):
+        Video.objects.create(video_id='v', engagement_data={'heatmap': {'0': 1, '7': 1}}, engagement_version=3)
+        self.cache = LiveStatsCache()
+        self.cache.load('v')
+
+    def test_a_write_made_elsewhere_drops_the_entry(self):
+        # Version 4 was written by another process, so this write found 4 and made it 5
+        self.cache.apply('v', 1, {'0': 1}, 4, 5, 1)
+        self.assertIsNone(self.cache.stats('v'))
+
+    def test_a_compacted_heatmap_is_reloaded(self):
+        # The maintain command compacts to 5s buckets (version 4); the next write is keyed at 5s
+        Video.objects.filter(pk='v').update(
+            engagement_data={'heatmap': {'0': 1, '5': 2}}, heatmap_resolution=5, engagement_version=5,
+        )
+        self.cache.apply('v', 1, {'5': 1}, 4, 5, 5)
+        self.assertIsNone(self.cache.stats('v'))
+        self.cache.load('v')
+        snapshot = self.cache.snapshot('v')
+        self.assertEqual((snapshot['heatmap'], snapshot['resolution']), ({'0': 1, '5': 2}, 5))
+
+    def test_the_next_write_is_applied(self):
+        self.cache.apply('v', 1, {'0': 1}, 3, 4, 1)
+        self.assertEqual(self.cache.snapshot('v')['heatmap'], {'0': 2, '7': 1})
+        self.assertEqual(self.cache.stats('v')['total_watch_time'], 1)
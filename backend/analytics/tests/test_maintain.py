@@ -0,0 +1,78 @@
+import io
+import os
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from backend.analytics.management.commands import maintain
+from backend.analytics.models import Video
+
+
+class CompactHeatmapTests(SimpleTestCase):
+    def test_seconds_are_summed_into_buckets(self):
+        heatmap = {'0': 1, '1': 2, '4': 3, '5': 4, '12': 5}
+        self.assertEqual(maintain.compact_heatmap(heatmap, 5), {'0': 6, '5': 4, '10': 5})
+
+    def test_totals_are_kept(self):
+        heatmap = {str(second): second % 7 + 1 for second in range(100)}
+        self.assertEqual(sum(maintain.compact_heatmap(heatmap, 10).values()), sum(heatmap.values()))
+
+    def test_recompacting_at_a_coarser_resolution(self):
+        self.assertEqual(maintain.compact_heatmap({'0': 6, '5': 4, '10': 5}, 10), {'0': 10, '10': 5})
+
+
+class CompactHeatmapsTests(TestCase):
+    options = {'chunk_size': 200, 'pause': 0, 'dry_run': False}
+
+    def compact(self):
+        command = maintain.Command(stdout=open(os.devnull, 'w'))
+        command.compact_heatmaps(self.options)
+
+    def test_idle_videos_are_compacted(self):
+        Video.objects.create(video_id='v', engagement_data={'heatmap': {'0': 1, '3': 1, '7': 2}}, engagement_version=4)
+        self.compact()
+        video = Video.objects.get(video_id='v')
+        self.assertEqual(video.engagement_data['heatmap'], {'0': 2, '5': 2})
+        self.assertEqual((video.heatmap_resolution, video.engagement_version), (5, 5))
+
+    def test_a_video_written_during_compaction_is_left_alone(self):
+        Video.objects.create(video_id='v', engagement_data={'heatmap': {'0': 1, '3': 1}}, engagement_version=4)
+        compact_heatmap = maintain.compact_heatmap
+
+        def concurrent_write(heatmap, resolution):
+            # A batch lands between the read and the conditional update
+            Video.objects.filter(pk='v').update(engagement_data={'heatmap': {'0': 1, '3': 2}}, engagement_version=5)
+            return compact_heatmap(heatmap, resolution)
+
+        with mock.patch.object(maintain, 'compact_heatmap', concurrent_write):
+            self.compact()
+        video = Video.objects.get(video_id='v')
+        self.assertEqual(video.engagement_data['heatmap'], {'0': 1, '3': 2})
+        self.assertEqual((video.heatmap_resolution, video.engagement_version), (1, 5))
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite auto_vacuum")
+class VacuumTests(TransactionTestCase):
+    # VACUUM can't run inside the transaction a TestCase wraps each test in
+
+    def vacuum(self, **options):
+        output = io.StringIO()
+        maintain.Command(stdout=output).vacuum({'dry_run': False, 'vacuum_pages': 1000, 'pause': 0, **options})
+        return output.getvalue()
+
+    def auto_vacuum(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA auto_vacuum")
+            return cursor.fetchone()[0]
+
+    def test_incremental_vacuum_is_opt_in(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA auto_vacuum = NONE")
+            cursor.execute("VACUUM")
+        self.assertIn("--enable-incremental-vacuum", self.vacuum())
+        self.assertEqual(self.auto_vacuum(), 0)
+
+        self.assertIn("switched to incremental auto_vacuum", self.vacuum(enable_incremental_vacuum=True))
+        self.assertEqual(self.auto_vacuum(), 2)
+        self.assertIn("reclaimed", self.vacuum())
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from backend.analytics.profiling import profiler
+
+
+class ProfilingViewTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        previous = profiler.state()
+        self.addCleanup(profiler.configure, enabled=previous['enabled'])
+
+    def post(self, data):
+        return self.client.post('/api/profiling/', data, content_type='application/json')
+
+    def test_enabled_strings_are_parsed(self):
+        for value, expected in (("true", True), ("false", False), ("1", True), ("0", False), (True, True), (False, False)):
+            with self.subTest(value=value):
+                response = self.post({'enabled': value})
+                self.assertEqual(response.status_code, 200)
+                self.assertIs(response.json()['enabled'], expected)
+
+    def test_unrecognised_values_are_rejected(self):
+        profiler.configure(enabled=False)
+        response = self.post({'enabled': "maybe"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(profiler.enabled)
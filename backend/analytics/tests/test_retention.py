@@ -0,0 +1,68 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from backend.analytics.engagement import (
+    apply_engagement_batch, bucket_count, bucket_views, retention_curve, top_segments, update_retention_profile,
+)
+from backend.analytics.models import RetentionProfile, Video
+
+
+@override_settings(RETENTION_BUCKETS=100)
+class BucketTests(SimpleTestCase):
+    def test_bucket_count(self):
+        self.assertEqual(bucket_count(1000), 100)
+        # Never narrower than one second
+        self.assertEqual(bucket_count(30), 30)
+        self.assertEqual(bucket_count(30.5), 31)
+        self.assertEqual(bucket_count(0.4), 1)
+
+    def test_edges(self):
+        buckets = bucket_views(1000, {'0': 1, '9': 2, '10': 4, '999': 8})
+        self.assertEqual(len(buckets), 100)
+        self.assertEqual((buckets[0], buckets[1], buckets[99]), (3, 4, 8))
+
+    def test_short_videos_get_one_bucket_per_second(self):
+        buckets = bucket_views(30, {'0': 1, '29': 2})
+        self.assertEqual(len(buckets), 30)
+        self.assertEqual((buckets[0], buckets[29]), (1, 2))
+
+    def test_seconds_past_the_end_are_clamped(self):
+        # Players report the final frame, and durations are rounded
+        buckets = bucket_views(30, {'30': 1, '31': 2, '-1': 4})
+        self.assertEqual((buckets[0], buckets[29], sum(buckets)), (4, 3, 7))
+
+
+class CurveTests(SimpleTestCase):
+    def test_relative_to_the_start(self):
+        self.assertEqual(retention_curve([10, 5, 0, 12]), [1.0, 0.5, 0.0, 1.2])
+
+    def test_no_start_audience(self):
+        self.assertEqual(retention_curve([0, 4, 2]), [0.0, 1.0, 0.5])
+        self.assertEqual(retention_curve([0, 0]), [0.0, 0.0])
+
+    @override_settings(RETENTION_TOP_SEGMENTS=2)
+    def test_top_segments(self):
+        curve = [1.0, 0.5, 0.6, 0.2, 0.1]
+        self.assertEqual(top_segments(curve, 10, rising=False), [
+            {'start': 10, 'end': 20, 'change': 0.5},
+            {'start': 30, 'end': 40, 'change': 0.4},
+        ])
+        self.assertEqual(top_segments(curve, 10, rising=True), [{'start': 20, 'end': 30, 'change': 0.1}])
+
+
+class RetentionProfileTests(TestCase):
+    def test_incremental_updates_match_a_rebuild(self):
+        Video.objects.create(video_id='v', duration=20)
+        for batch in ([(0.5, 20), (1.5, 20), (2.5, 20)], [(0.2, 20), (15.0, 20)], [(19.9, 20), (7.0, 20)]):
+            apply_engagement_batch('v', batch)
+        incremental = RetentionProfile.objects.get(video_id='v')
+        rebuilt = update_retention_profile(Video.objects.get(video_id='v'), {}, rebuild=True)
+        self.assertEqual(incremental.buckets, rebuilt.buckets)
+        self.assertEqual(incremental.curve, rebuilt.curve)
+        self.assertEqual(incremental.curve[:3], [1.0, 0.5, 0.5])
+
+    def test_a_new_duration_lays_the_profile_out_again(self):
+        Video.objects.create(video_id='v', duration=10, engagement_data={'heatmap': {'0': 2, '9': 1}})
+        update_retention_profile(Video.objects.get(video_id='v'), {}, rebuild=True)
+        Video.objects.filter(video_id='v').update(duration=20)
+        profile = update_retention_profile(Video.objects.get(video_id='v'), {'15': 1})
+        self.assertEqual((profile.duration, len(profile.buckets), sum(profile.buckets)), (20, 20, 3))
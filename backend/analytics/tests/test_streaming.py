@@ -0,0 +1,86 @@
+import os
+import tempfile
+
+from django.test import RequestFactory, SimpleTestCase
+from django.utils.http import http_date
+
+from backend.analytics.streaming import file_etag, if_range_matches, parse_range, serve_file
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_absent_or_unsupported_headers_are_ignored(self):
+        for header in (None, '', 'bytes=-', 'items=0-10', 'bytes=0-1,5-9'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 100))
+
+    def test_closed_range(self):
+        self.assertEqual(parse_range('bytes=10-19', 100), (10, 19))
+
+    def test_open_range_runs_to_the_end(self):
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+
+    def test_end_is_clamped_to_the_file(self):
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=100-', 'bytes=20-10', 'bytes=-0'):
+            with self.subTest(header=header):
+                with self.assertRaises(ValueError):
+                    parse_range(header, 100)
+
+
+class IfRangeTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_without_if_range_the_range_is_honoured(self):
+        self.assertTrue(if_range_matches(self.factory.get('/'), '"abc"', 1000))
+
+    def test_matching_and_stale_etags(self):
+        self.assertTrue(if_range_matches(self.factory.get('/', HTTP_IF_RANGE='"abc"'), '"abc"', 1000))
+        self.assertFalse(if_range_matches(self.factory.get('/', HTTP_IF_RANGE='"old"'), '"abc"', 1000))
+
+    def test_weak_etags_never_match(self):
+        self.assertFalse(if_range_matches(self.factory.get('/', HTTP_IF_RANGE='W/"abc"'), 'W/"abc"', 1000))
+
+    def test_dates(self):
+        self.assertTrue(if_range_matches(self.factory.get('/', HTTP_IF_RANGE=http_date(1000)), '"abc"', 1000))
+        self.assertFalse(if_range_matches(self.factory.get('/', HTTP_IF_RANGE=http_date(999)), '"abc"', 1000))
+
+
+class ServeFileTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        handle, self.path = tempfile.mkstemp(suffix='.mp4')
+        os.write(handle, bytes(range(100)))
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.etag = file_etag(os.stat(self.path))
+
+    def test_range_request(self):
+        response = serve_file(self.factory.head('/', HTTP_RANGE='bytes=10-19'), self.path)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+
+    def test_unsatisfiable_range(self):
+        response = serve_file(self.factory.head('/', HTTP_RANGE='bytes=200-'), self.path)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_stale_if_range_gets_the_whole_file(self):
+        response = serve_file(self.factory.head('/', HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"'), self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '100')
+
+    def test_current_if_range_gets_the_range(self):
+        response = serve_file(self.factory.head('/', HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=self.etag), self.path)
+        self.assertEqual(response.status_code, 206)
+
+    def test_if_none_match(self):
+        response = serve_file(self.factory.get('/', HTTP_IF_NONE_MATCH=self.etag), self.path)
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,26 @@
+from django.test import SimpleTestCase, override_settings
+
+from backend.analytics.transcoding import DEFAULT_RENDITIONS, select_renditions, transcode_command
+
+
+class SelectRenditionsTests(SimpleTestCase):
+    @override_settings(HLS_RENDITIONS=DEFAULT_RENDITIONS)
+    def test_rungs_above_the_source_are_dropped(self):
+        self.assertEqual([r['name'] for r in select_renditions(1080)], ['720p', '480p', '360p'])
+        self.assertEqual([r['name'] for r in select_renditions(480)], ['480p', '360p'])
+
+    @override_settings(HLS_RENDITIONS=DEFAULT_RENDITIONS)
+    def test_small_sources_keep_their_height(self):
+        [rendition] = select_renditions(241)
+        self.assertEqual((rendition['name'], rendition['height']), ('360p', 240))
+
+
+class TranscodeCommandTests(SimpleTestCase):
+    def test_the_source_is_decoded_once_for_every_rendition(self):
+        args = transcode_command('in.mp4', 'out', DEFAULT_RENDITIONS, True, 6).compile()
+        self.assertEqual(args.count('-i'), 1)
+        self.assertIn('split=3', args[args.index('-filter_complex') + 1])
+        self.assertEqual([arg for arg in args if arg.endswith('index.m3u8')],
+                         ['out/720p/index.m3u8', 'out/480p/index.m3u8', 'out/360p/index.m3u8'])
+        # Each rendition gets its own bitrate
+        self.assertEqual([args[i + 1] for i, arg in enumerate(args) if arg == '-b:v'], ['2800k', '1400k', '800k'])
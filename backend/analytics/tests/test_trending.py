@@ -0,0 +1,88 @@
+import math
+import time
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from backend.analytics import trending
+from backend.analytics.models import TrendingCheckpoint
+from backend.analytics.trending import DecayedTopK, TrendingLeaderboard
+
+WINDOW = 100.0
+
+
+class DecayedTopKTests(SimpleTestCase):
+    def test_orders_by_decayed_score(self):
+        board = DecayedTopK(WINDOW, capacity=10, landmark=0)
+        board.add('old', 10, now=0)
+        board.add('new', 5, now=100)
+        # 'old' has decayed to 10/e (~3.7) by now, below the 5 'new' was given
+        top = board.top(2, now=100)
+        self.assertEqual([key for key, _ in top], ['new', 'old'])
+        self.assertAlmostEqual(top[0][1], 5)
+        self.assertAlmostEqual(top[1][1], 10 / math.e)
+
+    def test_weight_accumulates(self):
+        board = DecayedTopK(WINDOW, capacity=10, landmark=0)
+        board.add('a', 3, now=0)
+        board.add('b', 4, now=0)
+        board.add('a', 2, now=0)
+        self.assertEqual(board.top(2, now=0), [('a', 5.0), ('b', 4.0)])
+
+    def test_top_is_limited_to_k(self):
+        board = DecayedTopK(WINDOW, capacity=10, landmark=0)
+        for weight, key in enumerate('abcde', start=1):
+            board.add(key, weight, now=0)
+        self.assertEqual([key for key, _ in board.top(3, now=0)], ['e', 'd', 'c'])
+
+    def test_capacity_evicts_the_weakest(self):
+        board = DecayedTopK(WINDOW, capacity=2, landmark=0)
+        board.add('a', 1, now=0)
+        board.add('b', 5, now=0)
+        board.add('c', 3, now=0)
+        self.assertEqual(set(board.scores), {'b', 'c'})
+
+    def test_rebase_keeps_scores(self):
+        board = DecayedTopK(WINDOW, capacity=10, landmark=0)
+        board.add('a', 10, now=0)
+        late = WINDOW * (trending.MAX_EXPONENT + 1)
+        board.add('b', 1, now=late)
+        self.assertEqual(board.landmark, late)
+        self.assertEqual([key for key, _ in board.top(2, now=late)], ['b', 'a'])
+        self.assertAlmostEqual(board.top(1, now=late)[0][1], 1)
+
+    def test_merge_matches_adding_everything_to_one_board(self):
+        single = DecayedTopK(WINDOW, capacity=10, landmark=0)
+        first = DecayedTopK(WINDOW, capacity=10, landmark=0)
+        second = DecayedTopK(WINDOW, capacity=10, landmark=50)
+        for board, key, weight, now in ((first, 'a', 4, 10), (second, 'a', 2, 60), (second, 'b', 5, 70)):
+            board.add(key, weight, now)
+            single.add(key, weight, now)
+        first.merge(second)
+        self.assertEqual(first.landmark, 50)
+        for (key, score), (expected_key, expected) in zip(first.top(2, now=80), single.top(2, now=80)):
+            self.assertEqual(key, expected_key)
+            self.assertAlmostEqual(score, expected)
+
+
+@override_settings(TRENDING_WINDOWS={'test': WINDOW}, TRENDING_CHECKPOINT_SECONDS=3600)
+class CheckpointTests(TestCase):
+    def test_processes_add_to_the_stored_board(self):
+        # Two server processes, each with part of the engagement
+        now = time.time()
+        first, second = TrendingLeaderboard(), TrendingLeaderboard()
+        first.record('a', 10, now=now)
+        second.record('b', 6, now=now)
+        second.record('a', 1, now=now)
+        first.checkpoint()
+        second.checkpoint()
+        # Checkpointing again without new weight must not count anything twice
+        first.checkpoint()
+
+        restarted = TrendingLeaderboard()
+        top = dict(restarted.top('test', now=now))
+        self.assertAlmostEqual(top['a'], 11)
+        self.assertAlmostEqual(top['b'], 6)
+        self.assertEqual(TrendingCheckpoint.objects.count(), 1)
+
+        # The second process adopted the first one's weight at its checkpoint
+        self.assertAlmostEqual(dict(second.top('test', now=now))['a'], 11)
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.http import JsonResponse
+from django.test import TestCase, override_settings
+
+from backend.analytics.models import UploadSession, Video
+
+
+class UploadSessionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(UPLOAD_TEMP_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        response = self.client.post('/api/uploads/', {'filename': 'clip.mp4', 'size': 10}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.json()['upload_id']
+        self.url = f"/api/uploads/{self.upload_id}/"
+
+    def put(self, data, offset, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum:
+            headers['HTTP_UPLOAD_CHECKSUM'] = checksum
+        return self.client.put(self.url, data, content_type='application/offset+octet-stream', **headers)
+
+    def session(self):
+        return UploadSession.objects.get(pk=self.upload_id)
+
+    def test_parts_advance_the_offset(self):
+        response = self.put(b'01234', 0, checksum=f"sha256 {hashlib.sha256(b'01234').hexdigest()}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], '5')
+        self.assertEqual(self.put(b'56789', 5).status_code, 200)
+        with open(self.session().path, 'rb') as part:
+            self.assertEqual(part.read(), b'0123456789')
+
+    def test_offset_mismatch_is_a_conflict(self):
+        self.put(b'01234', 0)
+        # e.g. a retry of the part that already landed
+        response = self.put(b'01234', 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 5)
+        self.assertEqual(self.put(b'99', 7).status_code, 409)
+        self.assertEqual(self.session().offset, 5)
+
+    def test_checksum_mismatch_drops_the_part(self):
+        self.put(b'01234', 0)
+        response = self.put(b'56789', 5, checksum=f"sha256 {hashlib.sha256(b'other').hexdigest()}")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], "Checksum mismatch.")
+        session = self.session()
+        self.assertEqual(session.offset, 5)
+        # The bad bytes are truncated away, so the retried part starts clean
+        self.assertEqual(os.path.getsize(session.path), 5)
+
+    def test_unsupported_checksums_are_rejected(self):
+        self.assertEqual(self.put(b'01234', 0, checksum="md5 abc").status_code, 400)
+        self.assertEqual(self.session().offset, 0)
+
+    def test_parts_past_the_declared_size_are_rejected(self):
+        self.assertEqual(self.put(b'0123456789a', 0).status_code, 400)
+        self.assertEqual(self.session().offset, 0)
+
+    def test_a_failed_completion_can_be_retried(self):
+        self.put(b'0123456789', 0)
+        temp_path = self.session().path
+
+        async def crash(request, vid, save_path):
+            raise RuntimeError("ffprobe crashed")
+
+        with mock.patch('backend.analytics.views.finalize_upload', crash):
+            response = self.client.post(f"{self.url}complete/")
+        self.assertEqual(response.status_code, 500)
+        # The claim is released: the part file and its path are back where they were
+        session = self.session()
+        self.assertEqual((session.path, session.video_id), (temp_path, None))
+        with open(temp_path, 'rb') as part:
+            self.assertEqual(part.read(), b'0123456789')
+
+        completed = []
+
+        async def finalize(request, vid, save_path):
+            completed.append(save_path)
+            self.addCleanup(os.remove, save_path)
+            await Video.objects.acreate(video_id=vid, path=save_path, source='upload')
+            return JsonResponse({"video_id": vid})
+
+        with mock.patch('backend.analytics.views.finalize_upload', finalize):
+            response = self.client.post(f"{self.url}complete/")
+        self.assertEqual(response.status_code, 200)
+        with open(completed[0], 'rb') as video:
+            self.assertEqual(video.read(), b'0123456789')
@@ -0,0 +1,141 @@
+# Background HLS transcoding for uploaded videos.
+# Each upload is encoded into a ladder of renditions (see HLS_RENDITIONS in
+# settings) with segmented output and a master playlist, so players can start
+# quickly and switch bitrate instead of downloading the original file.
+# The queue lives in process memory: videos left 'pending' or 'processing' by
+# a restart are queued again with `manage.py reprocess_videos --hls`.
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Video
+from .streaming import local_media_path
+
+DEFAULT_RENDITIONS = [
+    {'name': '720p', 'height': 720, 'video_bitrate': '2800k', 'audio_bitrate': '128k'},
+    {'name': '480p', 'height': 480, 'video_bitrate': '1400k', 'audio_bitrate': '128k'},
+    {'name': '360p', 'height': 360, 'video_bitrate': '800k', 'audio_bitrate': '96k'},
+]
+
+MASTER_PLAYLIST = 'master.m3u8'
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'HLS_MAX_WORKERS', 1),
+    thread_name_prefix='hls-transcode',
+)
+
+
+def hls_dir(video_id):
+    """Directory holding the playlists and segments of one video."""
+    return os.path.join(settings.MEDIA_ROOT, 'hls', video_id)
+
+
+def _bits(rate):
+    """Converts an ffmpeg bitrate string such as '2800k' to bits per second."""
+    rate = str(rate).lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(rate[-1], 1)
+    return int(float(rate.rstrip('km')) * multiplier)
+
+
+def select_renditions(source_height):
+    """Keeps the rungs of the ladder that don't upscale the source."""
+    ladder = sorted(
+        getattr(settings, 'HLS_RENDITIONS', DEFAULT_RENDITIONS),
+        key=lambda r: r['height'],
+        reverse=True,
+    )
+    selected = [r for r in ladder if r['height'] <= source_height]
+    return selected or [dict(ladder[-1], height=source_height - source_height % 2)]
+
+
+def transcode_command(source, out_dir, renditions, has_audio, segment_seconds):
+    """
+    One ffmpeg pipeline for the whole ladder: the source is decoded once and
+    split into a scaled stream per rendition, each encoded into
+    out_dir/<name>/index.m3u8 plus .ts segments.
+    """
+    stream = ffmpeg.input(source)
+    branches = stream.video.filter_multi_output('split', len(renditions))
+    outputs = []
+    for index, rendition in enumerate(renditions):
+        rendition_dir = os.path.join(out_dir, rendition['name'])
+        streams = [branches.stream(index).filter('scale', -2, rendition['height'])]
+        output_args = {
+            'c:v': 'libx264',
+            'preset': 'veryfast',
+            'b:v': rendition['video_bitrate'],
+            'maxrate': rendition['video_bitrate'],
+            'bufsize': f"{_bits(rendition['video_bitrate']) * 2 // 1000}k",
+            # Keyframes on segment boundaries so every rendition switches cleanly
+            'force_key_frames': f"expr:gte(t,n_forced*{segment_seconds})",
+            'f': 'hls',
+            'hls_time': segment_seconds,
+            'hls_playlist_type': 'vod',
+            'hls_segment_filename': os.path.join(rendition_dir, 'seg_%05d.ts'),
+        }
+        if has_audio:
+            streams.append(stream.audio)
+            output_args.update({'c:a': 'aac', 'b:a': rendition['audio_bitrate']})
+        outputs.append(ffmpeg.output(*streams, os.path.join(rendition_dir, 'index.m3u8'), **output_args))
+    return ffmpeg.merge_outputs(*outputs).overwrite_output()
+
+
+def write_master_playlist(out_dir, renditions, source_width, source_height, has_audio):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for rendition in renditions:
+        height = rendition['height']
+        width = int(round(source_width * height / source_height / 2)) * 2
+        bandwidth = _bits(rendition['video_bitrate'])
+        if has_audio:
+            bandwidth += _bits(rendition['audio_bitrate'])
+        # Peak rate allowance on top of the average bitrate
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={int(bandwidth * 1.1)},RESOLUTION={width}x{height}")
+        lines.append(f"{rendition['name']}/index.m3u8")
+    with open(os.path.join(out_dir, MASTER_PLAYLIST), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def transcode_video(video_id):
+    """Builds the full HLS ladder for one video and records the outcome on the Video row."""
+    close_old_connections()
+    try:
+        video = Video.objects.get(video_id=video_id)
+        Video.objects.filter(video_id=video_id).update(hls_status='processing')
+
+        source = local_media_path(video.path)
+        meta = ffmpeg.probe(source)
+        video_stream = next(s for s in meta['streams'] if s.get('codec_type') == 'video')
+        has_audio = any(s.get('codec_type') == 'audio' for s in meta['streams'])
+        width, height = int(video_stream['width']), int(video_stream['height'])
+
+        out_dir = hls_dir(video_id)
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.makedirs(out_dir, exist_ok=True)
+
+        segment_seconds = getattr(settings, 'HLS_SEGMENT_SECONDS', 6)
+        renditions = select_renditions(height)
+        for rendition in renditions:
+            os.makedirs(os.path.join(out_dir, rendition['name']), exist_ok=True)
+        transcode_command(source, out_dir, renditions, has_audio, segment_seconds).run(quiet=True)
+        write_master_playlist(out_dir, renditions, width, height, has_audio)
+
+        Video.objects.filter(video_id=video_id).update(
+            hls_status='ready',
+            hls_playlist=os.path.join('media', 'hls', video_id, MASTER_PLAYLIST),
+        )
+    except Exception as e:
+        print(f"HLS transcoding failed for {video_id}: {e}")
+        Video.objects.filter(video_id=video_id).update(hls_status='failed')
+    finally:
+        close_old_connections()
+
+
+def enqueue_transcode(video_id):
+    """Marks the video as pending and schedules its transcode on the background pool."""
+    Video.objects.filter(video_id=video_id).update(hls_status='pending')
+    return _executor.submit(transcode_video, video_id)
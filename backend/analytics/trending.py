@@ -0,0 +1,189 @@
+# In-memory trending leaderboard.
+# Every window keeps exponentially time-decayed scores for a bounded set of
+# candidate videos, updated as engagement batches are applied. Scores use
+# forward decay: new weight is scaled *up* by exp((t - landmark) / window)
+# instead of decaying every stored score as time passes, so an update is O(1)
+# and relative order never needs recomputing. Reads cost O(capacity), which
+# depends on TRENDING_K and not on the size of the library.
+
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import TrendingCheckpoint
+
+DEFAULT_WINDOWS = {'5m': 300, '1h': 3600, '24h': 86400}
+DEFAULT_K = 50
+DEFAULT_CHECKPOINT_SECONDS = 60
+
+# Candidates kept per window, as a multiple of K, so videos just outside the
+# top K can still climb into it
+CAPACITY_FACTOR = 4
+
+# Compare-and-set attempts per window and checkpoint before giving up until the next one
+CHECKPOINT_ATTEMPTS = 5
+
+# Rebase the landmark before the forward-decay multiplier gets large enough
+# to lose precision
+MAX_EXPONENT = 300
+
+
+class DecayedTopK:
+    """Time-decayed scores for the top candidates of one window."""
+
+    def __init__(self, window_seconds, capacity, landmark=None, scores=None):
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.landmark = landmark if landmark is not None else time.time()
+        self.scores = dict(scores or {})
+
+    def _rebase(self, now):
+        factor = math.exp(-(now - self.landmark) / self.window_seconds)
+        self.scores = {key: score * factor for key, score in self.scores.items()}
+        self.landmark = now
+
+    def add(self, key, weight, now):
+        exponent = (now - self.landmark) / self.window_seconds
+        if exponent > MAX_EXPONENT:
+            self._rebase(now)
+            exponent = 0
+        self.scores[key] = self.scores.get(key, 0.0) + weight * math.exp(exponent)
+        if len(self.scores) > self.capacity:
+            # Evict the weakest candidate to keep the structure bounded
+            weakest = min(self.scores, key=self.scores.get)
+            del self.scores[weakest]
+
+    def merge(self, other):
+        """Adds another board's scores (moved onto the later landmark), keeping the top `capacity`."""
+        if other.landmark > self.landmark:
+            self._rebase(other.landmark)
+        factor = math.exp((other.landmark - self.landmark) / self.window_seconds)
+        for key, score in other.scores.items():
+            self.scores[key] = self.scores.get(key, 0.0) + score * factor
+        if len(self.scores) > self.capacity:
+            self.scores = dict(sorted(self.scores.items(), key=lambda item: item[1], reverse=True)[:self.capacity])
+
+    def top(self, k, now):
+        """The k highest (key, decayed score) pairs as of `now`."""
+        factor = math.exp(-(now - self.landmark) / self.window_seconds)
+        ranked = sorted(self.scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(key, score * factor) for key, score in ranked]
+
+
+class TrendingLeaderboard:
+    """
+    Per-process leaderboards for every configured window, loaded lazily from
+    the last checkpoint and written back every TRENDING_CHECKPOINT_SECONDS.
+
+    Several server processes share the checkpoint rows, so each process also
+    keeps the weight it recorded since its last checkpoint and adds only that
+    to the stored board (a compare-and-set on updated_at), then adopts the
+    result, picking up the other processes' engagement as it goes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.windows = None
+        self.pending = None  # Window name -> weight recorded since the last checkpoint
+        self.last_checkpoint = time.time()
+
+    @property
+    def k(self):
+        return getattr(settings, 'TRENDING_K', DEFAULT_K)
+
+    def window_names(self):
+        return list(getattr(settings, 'TRENDING_WINDOWS', DEFAULT_WINDOWS))
+
+    def _empty_boards(self):
+        configured = getattr(settings, 'TRENDING_WINDOWS', DEFAULT_WINDOWS)
+        return {name: DecayedTopK(seconds, self.k * CAPACITY_FACTOR) for name, seconds in configured.items()}
+
+    def _load(self):
+        configured = getattr(settings, 'TRENDING_WINDOWS', DEFAULT_WINDOWS)
+        checkpoints = {c.window: c for c in TrendingCheckpoint.objects.filter(window__in=configured)}
+        self.windows = {}
+        for name, seconds in configured.items():
+            checkpoint = checkpoints.get(name)
+            self.windows[name] = DecayedTopK(
+                seconds,
+                self.k * CAPACITY_FACTOR,
+                landmark=checkpoint.landmark if checkpoint else None,
+                scores=checkpoint.scores if checkpoint else None,
+            )
+        self.pending = self._empty_boards()
+
+    def record(self, video_id, weight, now=None):
+        """Adds engagement weight (watch seconds) for a video to every window."""
+        now = now or time.time()
+        with self.lock:
+            if self.windows is None:
+                self._load()
+            for name, board in self.windows.items():
+                board.add(video_id, weight, now)
+                self.pending[name].add(video_id, weight, now)
+            due = now - self.last_checkpoint >= getattr(settings, 'TRENDING_CHECKPOINT_SECONDS', DEFAULT_CHECKPOINT_SECONDS)
+        if due:
+            self.checkpoint(now)
+
+    def top(self, window, k=None, now=None):
+        """The top k (video_id, score) pairs for a window. Raises KeyError for unknown windows."""
+        with self.lock:
+            if self.windows is None:
+                self._load()
+            return self.windows[window].top(min(k or self.k, self.k), now or time.time())
+
+    def checkpoint(self, now=None):
+        """Adds this process's new weight to the stored boards, so the leaderboard survives restarts."""
+        with self.lock:
+            if self.windows is None:
+                return
+            self.last_checkpoint = now or time.time()
+            pending, self.pending = self.pending, self._empty_boards()
+
+        saved = {}
+        for name, additions in pending.items():
+            board = self._save(name, additions)
+            if board is None:
+                print(f"Could not save the {name} trending checkpoint; retrying at the next checkpoint")
+            saved[name] = board
+
+        with self.lock:
+            for name, board in saved.items():
+                if board is None:
+                    self.pending[name].merge(pending[name])
+                else:
+                    # Weight recorded while the checkpoint was being written isn't in the stored board yet
+                    board.merge(self.pending[name])
+                    self.windows[name] = board
+
+    def _save(self, name, additions):
+        """
+        Adds `additions` to the stored board of one window.
+
+        Returns:
+            DecayedTopK: The board as saved, or None if other writers kept winning.
+        """
+        for _ in range(CHECKPOINT_ATTEMPTS):
+            checkpoint = TrendingCheckpoint.objects.filter(window=name).first()
+            if checkpoint is None:
+                board = DecayedTopK(additions.window_seconds, additions.capacity, additions.landmark, additions.scores)
+                _, created = TrendingCheckpoint.objects.get_or_create(
+                    window=name, defaults={'landmark': board.landmark, 'scores': board.scores}
+                )
+                if created:
+                    return board
+                continue
+            board = DecayedTopK(additions.window_seconds, additions.capacity, checkpoint.landmark, checkpoint.scores)
+            board.merge(additions)
+            updated = TrendingCheckpoint.objects.filter(window=name, updated_at=checkpoint.updated_at).update(
+                landmark=board.landmark, scores=board.scores, updated_at=timezone.now()
+            )
+            if updated:
+                return board
+        return None
+
+
+leaderboard = TrendingLeaderboard()
@@ -1,10 +1,21 @@
 from django.urls import path
-from .views import VideoUploadView, YouTubeAnalysisView, RegisterVideoView, VideoDetailView, VideoListView # Add YouTubeAnalysisView
+from .views import VideoUploadView, YouTubeAnalysisView, RegisterVideoView, VideoDetailView, VideoListView, VideoStreamView, HLSFileView, RetentionView, UniqueViewersView, TrendingView, ProfilingView, CohortsView, VideoCohortView, UploadSessionCreateView, UploadSessionView, UploadSessionCompleteView # Add YouTubeAnalysisView
 
 urlpatterns = [
     path('videos/', VideoListView.as_view(), name='video-list'),
     path('upload/', VideoUploadView.as_view(), name='video-upload'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-create'),
+    path('uploads/<str:upload_id>/', UploadSessionView.as_view(), name='upload-session'),
+    path('uploads/<str:upload_id>/complete/', UploadSessionCompleteView.as_view(), name='upload-complete'),
     path('analyze-youtube/', YouTubeAnalysisView.as_view(), name='youtube-analyze'), # Add this line
     path('register-video/', RegisterVideoView.as_view(), name='video-register'),
     path('video/<str:video_id>/', VideoDetailView.as_view(), name='video-detail'),
+    path('video/<str:video_id>/retention/', RetentionView.as_view(), name='video-retention'),
+    path('video/<str:video_id>/cohort/', VideoCohortView.as_view(), name='video-cohort'),
+    path('trending/', TrendingView.as_view(), name='trending'),
+    path('cohorts/', CohortsView.as_view(), name='cohorts'),
+    path('metrics/unique-viewers/', UniqueViewersView.as_view(), name='unique-viewers'),
+    path('stream/<str:video_id>/', VideoStreamView.as_view(), name='video-stream'),
+    path('hls/<str:video_id>/<path:name>', HLSFileView.as_view(), name='video-hls'),
+    path('profiling/', ProfilingView.as_view(), name='profiling'),
 ]
\ No newline at end of file
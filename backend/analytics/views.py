@@ -1,37 +1,65 @@
 # --- Imports for BOTH views ---
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Video
+from .models import Video, RetentionProfile, UploadSession
 from .serializers import VideoSerializer
-import ffmpeg
+from .pagination import VideoPagination
+import asyncio
+import hashlib
+import json
+import shutil
 import uuid
 import os
 from googleapiclient.discovery import build
 from django.conf import settings
-import uuid
 from rest_framework.generics import RetrieveAPIView, ListAPIView
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .streaming import local_media_path, serve_file
+from .engagement import unique_viewers
+from .trending import leaderboard
+from .transcoding import enqueue_transcode, hls_dir
+from .media import extract_thumbnail_async, probe_async, probe_duration
+from .profiling import profiler
+from .cohorts import get_cohorts, video_ranking
+from .renderers import engagement_json_enabled
+from rest_framework.permissions import IsAdminUser
+from rest_framework import serializers
+
+# The upload, register and YouTube views are async: ffmpeg runs as non-blocking
+# subprocesses and remote calls run off the shared sync thread, so a slow file or
+# URL can't starve the thread that database_sync_to_async uses for WebSocket writes.
+# They are plain Django views (DRF's APIView is sync only) and exempt from CSRF
+# like DRF's unauthenticated views.
 
-# Helper function to extract a thumbnail from a video file
-def extract_thumbnail(video_path, thumbnail_path, time_offset=1):
+def parse_json_body(request):
     try:
-        (
-            ffmpeg
-            .input(video_path, ss=time_offset)
-            .output(thumbnail_path, vframes=1)
-            .overwrite_output()
-            .run(quiet=True)
-        )
-        return True
-    except Exception as e:
-        print(f"Failed to extract thumbnail: {e}")
-        return False
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+
+
+def save_uploaded_file(file, save_path):
+    with open(save_path, 'wb') as f:
+        for chunk in file.chunks():
+            f.write(chunk)
+
 
 # --- View 1: For User Uploads (Your original code) ---
-class VideoUploadView(APIView):
-    def post(self, request):
-        file = request.FILES['video']
+@method_decorator(csrf_exempt, name='dispatch')
+class VideoUploadView(View):
+    async def post(self, request):
+        # Multipart parsing may spool to disk, so keep it off the event loop
+        files = await sync_to_async(lambda: request.FILES, thread_sensitive=False)()
+        file = files.get('video')
+        if file is None:
+            return JsonResponse({"error": "video file is required"}, status=400)
         file_extension = os.path.splitext(file.name)[1]
         if not file_extension: file_extension = ".mp4" # default to mp4
         # We'll use the file name as a unique identifier for path check
@@ -39,10 +67,10 @@ class VideoUploadView(APIView):
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
         # Check for existing video with the same path
-        existing_video = Video.objects.filter(path=save_path, source='upload').first()
+        existing_video = await Video.objects.filter(path=save_path, source='upload').afirst()
         if existing_video:
             video_url = request.build_absolute_uri(settings.MEDIA_URL + 'videos/' + f"{file.name}")
-            return Response({
+            return JsonResponse({
                 "video_id": existing_video.video_id,
                 "video_url": video_url,
                 "thumbnail": existing_video.thumbnail
@@ -50,52 +78,256 @@ class VideoUploadView(APIView):
 
         vid = str(uuid.uuid4())
         save_path = os.path.join('media', 'videos', f"{vid}{file_extension}")
-        with open(save_path, 'wb') as f:
-            for chunk in file.chunks():
-                f.write(chunk)
-        meta = ffmpeg.probe(save_path)
-        duration = float(meta['format']['duration'])
-        thumbnail_dir = os.path.join('media', 'thumbnails')
-        os.makedirs(thumbnail_dir, exist_ok=True)
-        thumbnail_path = os.path.join(thumbnail_dir, f"{vid}.jpg")
-        thumbnail_url = None
-        if extract_thumbnail(save_path, thumbnail_path):
-            thumbnail_url = request.build_absolute_uri(settings.MEDIA_URL + f"thumbnails/{vid}.jpg")
-        video = Video.objects.create(
-            video_id=vid,
-            path=save_path,
-            duration=duration,
-            source='upload',
-            thumbnail=thumbnail_url
+        await sync_to_async(save_uploaded_file, thread_sensitive=False)(file, save_path)
+        return await finalize_upload(request, vid, save_path)
+
+
+async def finalize_upload(request, vid, save_path):
+    """
+    Probes an upload saved at media/videos/<vid><ext>, extracts its thumbnail,
+    creates the Video and queues HLS transcoding. The file is removed if it
+    can't be read as a video.
+    """
+    try:
+        meta = await probe_async(save_path)
+    except Exception as e:
+        print(f"Failed to probe upload {save_path}: {e!r}")
+        os.remove(save_path)
+        return JsonResponse({"error": "Could not read the uploaded video."}, status=400)
+    duration = probe_duration(meta)
+    thumbnail_dir = os.path.join('media', 'thumbnails')
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    thumbnail_path = os.path.join(thumbnail_dir, f"{vid}.jpg")
+    thumbnail_url = None
+    if await extract_thumbnail_async(save_path, thumbnail_path):
+        thumbnail_url = request.build_absolute_uri(settings.MEDIA_URL + f"thumbnails/{vid}.jpg")
+    await Video.objects.acreate(
+        video_id=vid,
+        path=save_path,
+        duration=duration,
+        source='upload',
+        thumbnail=thumbnail_url
+    )
+    await sync_to_async(enqueue_transcode)(vid)
+    video_url = request.build_absolute_uri(settings.MEDIA_URL + 'videos/' + os.path.basename(save_path))
+    return JsonResponse({
+        "video_id": vid,
+        "video_url": video_url,
+        "thumbnail": thumbnail_url
+    })
+
+
+# --- Resumable chunked uploads ---
+# Clients create a session, PUT the file in parts with an Upload-Offset header
+# (and optionally `Upload-Checksum: sha256 <hex>`), ask for the offset to
+# resume after a failure, then POST .../complete/. Parts are streamed straight
+# to disk, so neither side ever holds the whole file in memory.
+
+UPLOAD_READ_BYTES = 1024 * 1024
+
+
+def write_upload_part(path, offset, stream, length):
+    """
+    Streams `length` bytes from `stream` into the file at `offset`, first
+    dropping anything past `offset` left behind by an earlier failed part.
+
+    Returns:
+        tuple: (bytes written, sha256 hex digest of them)
+    """
+    digest = hashlib.sha256()
+    written = 0
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.ftruncate(fd, offset)
+        while written < length:
+            data = stream.read(min(length - written, UPLOAD_READ_BYTES))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + written)
+            digest.update(data)
+            written += len(data)
+        # The offset is only advanced once the part is durable
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return written, digest.hexdigest()
+
+
+def upload_response(session, status=200, **extra):
+    response = JsonResponse({
+        "upload_id": session.upload_id,
+        "offset": session.offset,
+        "size": session.size,
+        "chunk_size": getattr(settings, 'UPLOAD_CHUNK_BYTES', 8 * 1024 * 1024),
+        "video_id": session.video_id,
+        **extra,
+    }, status=status)
+    response['Upload-Offset'] = str(session.offset)
+    response['Upload-Length'] = str(session.size)
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadSessionCreateView(View):
+    """Starts a resumable upload. Body: {"filename": ..., "size": bytes}."""
+    async def post(self, request):
+        data = parse_json_body(request)
+        if not isinstance(data, dict) or not data.get('filename'):
+            return JsonResponse({"error": "filename is required"}, status=400)
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return JsonResponse({"error": "size must be an integer"}, status=400)
+        if size <= 0 or size > getattr(settings, 'UPLOAD_MAX_BYTES', size):
+            return JsonResponse({"error": "size is out of range"}, status=413 if size > 0 else 400)
+
+        upload_id = str(uuid.uuid4())
+        os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+        path = os.path.join(settings.UPLOAD_TEMP_DIR, f"{upload_id}.part")
+        open(path, 'wb').close()
+        session = await UploadSession.objects.acreate(
+            upload_id=upload_id, filename=os.path.basename(str(data['filename']))[:255], size=size, path=path
         )
-        video_url = request.build_absolute_uri(settings.MEDIA_URL + 'videos/' + f"{vid}{file_extension}")
-        return Response({
-            "video_id": vid,
-            "video_url": video_url,
-            "thumbnail": thumbnail_url
-        })
+        return upload_response(session, status=201)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadSessionView(View):
+    """GET/HEAD: current offset (to resume). PUT: the next part. DELETE: cancel."""
+    async def get(self, request, upload_id):
+        session = await UploadSession.objects.filter(pk=upload_id).afirst()
+        if session is None:
+            return JsonResponse({"error": "Unknown upload."}, status=404)
+        return upload_response(session)
+
+    async def put(self, request, upload_id):
+        session = await UploadSession.objects.filter(pk=upload_id).afirst()
+        if session is None:
+            return JsonResponse({"error": "Unknown upload."}, status=404)
+        if session.video_id:
+            return upload_response(session, status=409, error="Upload is already complete.")
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({"error": "Upload-Offset and Content-Length headers are required"}, status=400)
+        if offset != session.offset:
+            # Usually a retry of a part that did land; the client resumes from our offset
+            return upload_response(session, status=409, error="Upload-Offset does not match.")
+        if length <= 0 or offset + length > session.size:
+            return upload_response(session, status=400, error="Part is empty or runs past the declared size.")
+        if length > getattr(settings, 'UPLOAD_MAX_CHUNK_BYTES', length):
+            return upload_response(session, status=413, error="Part is too large.")
+
+        expected = None
+        checksum = request.headers.get('Upload-Checksum')
+        if checksum:
+            algorithm, _, expected = checksum.partition(' ')
+            if algorithm.lower() != 'sha256' or not expected:
+                return upload_response(session, status=400, error="Only 'sha256 <hex>' checksums are supported.")
+
+        written, digest = await sync_to_async(write_upload_part, thread_sensitive=False)(session.path, offset, request, length)
+        if written != length or (expected and digest != expected.strip().lower()):
+            await sync_to_async(os.truncate, thread_sensitive=False)(session.path, offset)
+            error = "Part was incomplete." if written != length else "Checksum mismatch."
+            return upload_response(session, status=400, error=error)
+
+        # Compare-and-set, so concurrent parts for the same offset can't both count
+        if not await UploadSession.objects.filter(pk=upload_id, offset=offset).aupdate(offset=offset + written):
+            session = await UploadSession.objects.aget(pk=upload_id)
+            return upload_response(session, status=409, error="Upload-Offset does not match.")
+        session.offset = offset + written
+        return upload_response(session)
+
+    async def delete(self, request, upload_id):
+        # Only unfinished uploads, whose part file is still in UPLOAD_TEMP_DIR
+        session = await UploadSession.objects.filter(
+            pk=upload_id, video__isnull=True, path__startswith=settings.UPLOAD_TEMP_DIR
+        ).afirst()
+        if session is None:
+            return JsonResponse({"error": "Unknown upload."}, status=404)
+        if os.path.exists(session.path):
+            os.remove(session.path)
+        await session.adelete()
+        return HttpResponse(status=204)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadSessionCompleteView(View):
+    """Finishes an upload once every byte has arrived: probe, thumbnail, Video, transcode."""
+    async def post(self, request, upload_id):
+        session = await UploadSession.objects.filter(pk=upload_id).afirst()
+        if session is None:
+            return JsonResponse({"error": "Unknown upload."}, status=404)
+        if session.video_id:
+            # Completing twice is harmless (e.g. the client retried after a timeout)
+            video = await Video.objects.aget(pk=session.video_id)
+            return JsonResponse({
+                "video_id": video.video_id,
+                "video_url": request.build_absolute_uri(settings.MEDIA_URL + 'videos/' + os.path.basename(video.path)),
+                "thumbnail": video.thumbnail,
+            })
+        if session.offset != session.size:
+            return upload_response(session, status=409, error="Upload is not finished.")
+
+        file_extension = os.path.splitext(session.filename)[1] or ".mp4"
+        vid = str(uuid.uuid4())
+        save_path = os.path.join('media', 'videos', f"{vid}{file_extension}")
+        # Claim the session so a concurrent completion can't move the file twice
+        if not await UploadSession.objects.filter(pk=upload_id, path=session.path).aupdate(path=save_path):
+            return upload_response(session, status=409, error="Upload is already being completed.")
+        try:
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            await sync_to_async(shutil.move, thread_sensitive=False)(session.path, save_path)
+            response = await finalize_upload(request, vid, save_path)
+        except Exception as e:
+            # Unexpected (ffprobe crash, DB error): release the claim, or the session would
+            # answer 409 forever and never be pruned (its path is no longer a temp file)
+            print(f"Failed to complete upload {upload_id}: {e!r}")
+            if await Video.objects.filter(pk=vid).aexists():
+                # Only a step after creating the Video failed; a retry returns it
+                await UploadSession.objects.filter(pk=upload_id).aupdate(video_id=vid)
+            else:
+                if os.path.exists(save_path):
+                    await sync_to_async(shutil.move, thread_sensitive=False)(save_path, session.path)
+                await UploadSession.objects.filter(pk=upload_id).aupdate(path=session.path)
+            return upload_response(session, status=500, error="Could not complete the upload; try again.")
+        if response.status_code == 200:
+            await UploadSession.objects.filter(pk=upload_id).aupdate(video_id=vid)
+        else:
+            await UploadSession.objects.filter(pk=upload_id).adelete()
+        return response
+
+
+def fetch_youtube_video(youtube_video_id, api_key):
+    youtube = build('youtube', 'v3', developerKey=api_key)
+    return youtube.videos().list(
+        part='snippet,statistics',
+        id=youtube_video_id
+    ).execute()
 
 
 # --- View 2: For YouTube Analysis (The new code) ---
-class YouTubeAnalysisView(APIView):
-    def post(self, request):
-        youtube_video_id = request.data.get('video_id')
+@method_decorator(csrf_exempt, name='dispatch')
+class YouTubeAnalysisView(View):
+    async def post(self, request):
+        data = parse_json_body(request)
+        youtube_video_id = data.get('video_id') if isinstance(data, dict) else None
         if not youtube_video_id:
-            return Response({"error": "video_id is required"}, status=400)
+            return JsonResponse({"error": "video_id is required"}, status=400)
 
         # IMPORTANT: Replace with your actual YouTube Data API Key
         # For security, load this from an environment variable in a real application
         YOUTUBE_API_KEY = 'API-KEY' 
 
         try:
-            youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-            video_response = youtube.videos().list(
-                part='snippet,statistics',
-                id=youtube_video_id
-            ).execute()
+            video_response = await asyncio.wait_for(
+                sync_to_async(fetch_youtube_video, thread_sensitive=False)(youtube_video_id, YOUTUBE_API_KEY),
+                getattr(settings, 'REMOTE_API_TIMEOUT', 15),
+            )
 
             if not video_response['items']:
-                return Response({"error": "YouTube video not found"}, status=404)
+                return JsonResponse({"error": "YouTube video not found"}, status=404)
 
             video_data = video_response['items'][0]
             snippet = video_data['snippet']
@@ -105,7 +337,7 @@ class YouTubeAnalysisView(APIView):
             youtube_thumbnail_url = f"https://img.youtube.com/vi/{youtube_video_id}/hqdefault.jpg"
 
             # Create or update the video record in the database
-            video, created = Video.objects.update_or_create(
+            video, created = await Video.objects.aupdate_or_create(
                 video_id=youtube_video_id,
                 defaults={
                     'source': 'youtube',
@@ -116,24 +348,28 @@ class YouTubeAnalysisView(APIView):
                     'thumbnail': youtube_thumbnail_url
                 }
             )
-            
+
             serializer = VideoSerializer(video)
-            return Response(serializer.data)
+            return JsonResponse(serializer.data)
 
+        except asyncio.TimeoutError:
+            return JsonResponse({"error": "Timed out contacting YouTube."}, status=504)
         except Exception as e:
             # It's good practice to log the error here
             print(f"An error occurred: {e}")
-            return Response({"error": "An internal error occurred. See server logs for details."}, status=500)
+            return JsonResponse({"error": "An internal error occurred. See server logs for details."}, status=500)
 
-class RegisterVideoView(APIView):
-    def post(self, request):
-        video_url = request.data.get('video_url')
+@method_decorator(csrf_exempt, name='dispatch')
+class RegisterVideoView(View):
+    async def post(self, request):
+        data = parse_json_body(request)
+        video_url = data.get('video_url') if isinstance(data, dict) else None
         if not video_url:
-            return Response({"error": "video_url is required"}, status=400)
+            return JsonResponse({"error": "video_url is required"}, status=400)
         # Check for existing video with the same path (direct link)
-        existing_video = Video.objects.filter(path=video_url, source='direct').first()
+        existing_video = await Video.objects.filter(path=video_url, source='direct').afirst()
         if existing_video:
-            return Response({
+            return JsonResponse({
                 "video_id": existing_video.video_id,
                 "video_url": existing_video.path,
                 "thumbnail": existing_video.thumbnail
@@ -144,34 +380,246 @@ class RegisterVideoView(APIView):
             os.makedirs(thumbnail_dir, exist_ok=True)
             thumbnail_path = os.path.join(thumbnail_dir, f"{vid}.jpg")
             thumbnail_url = None
-            try:
-                if extract_thumbnail(video_url, thumbnail_path):
-                    thumbnail_url = request.build_absolute_uri(settings.MEDIA_URL + f"thumbnails/{vid}.jpg")
-            except Exception as e:
-                print(f"Failed to extract thumbnail from direct link: {e}")
-            video = Video.objects.create(
+            # Reads the remote URL, bounded by THUMBNAIL_TIMEOUT
+            if await extract_thumbnail_async(video_url, thumbnail_path):
+                thumbnail_url = request.build_absolute_uri(settings.MEDIA_URL + f"thumbnails/{vid}.jpg")
+            video = await Video.objects.acreate(
                 video_id=vid,
                 source='direct',
                 path=video_url,
                 title=video_url.split('/')[-1],
                 thumbnail=thumbnail_url
             )
-            return Response({"video_id": video.video_id, "video_url": video.path, "thumbnail": thumbnail_url})
+            return JsonResponse({"video_id": video.video_id, "video_url": video.path, "thumbnail": thumbnail_url})
         except Exception as e:
             print(f"Error registering video: {e}")
-            return Response({"error": "Failed to register video."}, status=500)
+            return JsonResponse({"error": "Failed to register video."}, status=500)
 
 class VideoListView(ListAPIView):
     """
-    Provides a list of all videos in the database.
+    Provides a paginated list of videos. Supports `search` (title or ID),
+    `source` filtering and a comma-separated `fields` list that also limits
+    the columns loaded from the database.
     """
-    queryset = Video.objects.all().order_by('-pk') # Order by most recent
     serializer_class = VideoSerializer
+    pagination_class = VideoPagination
+
+    def get_requested_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+        return [name.strip() for name in fields.split(',') if name.strip()]
+
+    def get_queryset(self):
+        queryset = Video.objects.all().order_by('-pk') # Order by most recent
+        search = self.request.query_params.get('search')
+        if search:
+            queryset = queryset.filter(Q(title__icontains=search) | Q(video_id__icontains=search))
+        source = self.request.query_params.get('source')
+        if source:
+            queryset = queryset.filter(source=source)
+
+        fields = self.get_requested_fields()
+        if fields:
+            model_fields = {f.name for f in Video._meta.concrete_fields}
+            if engagement_json_enabled():
+                # Served from its pre-encoded bytes; only the version is needed
+                model_fields.discard('engagement_data')
+                if 'engagement_data' in fields:
+                    fields = fields + ['engagement_version']
+            # counter_shards is needed to combine sharded counters
+            queryset = queryset.only('counter_shards', *[name for name in fields if name in model_fields])
+        elif engagement_json_enabled():
+            queryset = queryset.defer('engagement_data')
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
     
 class VideoDetailView(RetrieveAPIView):
     """
     Provides all stored data for a single video.
     """
-    queryset = Video.objects.all()
     serializer_class = VideoSerializer
     lookup_field = 'video_id' # Tells the view to find videos by their video_id
+
+    def get_queryset(self):
+        if engagement_json_enabled():
+            # The serializer serves engagement_data from its pre-encoded bytes
+            return Video.objects.defer('engagement_data')
+        return Video.objects.all()
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response.data['unique_viewers'] = unique_viewers([kwargs['video_id']])['unique_viewers']
+        return response
+
+class VideoStreamView(View):
+    """
+    Streams an uploaded video file with HTTP Range and conditional request support.
+    A plain Django view, so DRF content negotiation never rejects media requests.
+    """
+    def get(self, request, video_id):
+        video = get_object_or_404(Video, video_id=video_id)
+        if video.source != 'upload' or not video.path:
+            raise Http404("Only uploaded videos can be streamed.")
+        return serve_file(request, local_media_path(video.path))
+
+HLS_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
+
+class HLSFileView(View):
+    """
+    Serves the playlists and segments produced by the HLS transcoder.
+    """
+    def get(self, request, video_id, name):
+        base = os.path.realpath(hls_dir(video_id))
+        path = os.path.realpath(os.path.join(base, name))
+        extension = os.path.splitext(path)[1]
+        if not path.startswith(base + os.sep) or extension not in HLS_CONTENT_TYPES:
+            raise Http404("Unknown HLS file.")
+        response = serve_file(request, path, content_type=HLS_CONTENT_TYPES[extension])
+        # hls.js fetches with XHR from the Streamlit origin
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+
+class RetentionView(APIView):
+    """
+    Returns the precomputed retention curve and top drop-off / rewatch segments
+    for a video. A single row read, whatever the video's length or event count.
+    """
+    def get(self, request, video_id):
+        profile = RetentionProfile.objects.filter(video_id=video_id).first()
+        if profile is None:
+            return Response({"error": "No retention data for this video yet."}, status=404)
+        return Response({
+            "video_id": video_id,
+            "duration": profile.duration,
+            "bucket_seconds": profile.duration / len(profile.buckets),
+            "curve": profile.curve,
+            "drop_offs": profile.drop_offs,
+            "rewatches": profile.rewatches,
+        })
+
+class UniqueViewersView(APIView):
+    """
+    Approximate unique viewers across any set of videos (repeat `video_id`, or
+    omit for the whole library) and an optional inclusive `start`/`end` date
+    range. Pass `daily=true` for a per-day breakdown.
+    """
+    def get(self, request):
+        dates = {}
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            try:
+                dates[name] = parse_date(value) if value else None
+            except ValueError:
+                dates[name] = None
+            if value and dates[name] is None:
+                return Response({"error": f"{name} must be a YYYY-MM-DD date"}, status=400)
+
+        video_ids = request.query_params.getlist('video_id')
+        daily = request.query_params.get('daily', '').lower() in ('1', 'true', 'yes')
+        result = unique_viewers(video_ids, dates['start'], dates['end'], daily=daily)
+        result.update({
+            "video_ids": video_ids,
+            "start": request.query_params.get('start'),
+            "end": request.query_params.get('end'),
+        })
+        return Response(result)
+
+class CohortsView(APIView):
+    """
+    Retention percentile bands, median and outliers for every cohort of
+    videos (source and duration bucket), on a common relative-position axis.
+    Filter with `source` and/or `duration_bucket`.
+    """
+    def get(self, request):
+        result = get_cohorts()
+        source = request.query_params.get('source')
+        bucket = request.query_params.get('duration_bucket')
+        cohorts = {
+            key: cohort for key, cohort in result['cohorts'].items()
+            if (not source or cohort['source'] == source) and (not bucket or cohort['duration_bucket'] == bucket)
+        }
+        return Response({"positions": result['positions'], "cohorts": cohorts})
+
+class VideoCohortView(APIView):
+    """
+    A video's retention percentile within its cohort at every relative
+    position; pass `second` for the rank at one point of the video.
+    """
+    def get(self, request, video_id):
+        second = request.query_params.get('second')
+        try:
+            second = float(second) if second is not None else None
+        except ValueError:
+            return Response({"error": "second must be a number"}, status=400)
+        ranking = video_ranking(video_id, second)
+        if ranking is None:
+            return Response({"error": "No retention data for this video yet."}, status=404)
+        return Response({"video_id": video_id, **ranking})
+
+class TrendingView(APIView):
+    """
+    The hottest videos right now by time-decayed watch time. `window` picks
+    the decay window (see TRENDING_WINDOWS) and `limit` the number of results.
+    """
+    def get(self, request):
+        window = request.query_params.get('window', '1h')
+        if window not in leaderboard.window_names():
+            return Response({"error": f"window must be one of {', '.join(leaderboard.window_names())}"}, status=400)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+
+        top = leaderboard.top(window, max(limit, 1))
+        videos = Video.objects.filter(video_id__in=[video_id for video_id, _ in top]).only('video_id', 'title', 'source', 'thumbnail')
+        videos = {video.video_id: video for video in videos}
+        results = [
+            {
+                "video_id": video_id,
+                "score": round(score, 2),
+                "title": videos[video_id].title,
+                "source": videos[video_id].source,
+                "thumbnail": videos[video_id].thumbnail,
+            }
+            for video_id, score in top if video_id in videos
+        ]
+        return Response({"window": window, "results": results})
+
+class ProfilingView(APIView):
+    """
+    Shows and changes the sampling profiler's settings for this process.
+    POST any of `enabled`, `sample_rate`, `routes` (list) and `interval`.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(profiler.state())
+
+    def post(self, request):
+        routes = request.data.get('routes')
+        if routes is not None and not isinstance(routes, list):
+            return Response({"error": "routes must be a list"}, status=400)
+        enabled = request.data.get('enabled')
+        if enabled is not None:
+            # bool() would read the string "false" as True
+            try:
+                enabled = serializers.BooleanField().to_internal_value(enabled)
+            except serializers.ValidationError:
+                return Response({"error": "enabled must be a boolean"}, status=400)
+        try:
+            profiler.configure(
+                enabled=enabled,
+                sample_rate=request.data.get('sample_rate'),
+                routes=routes,
+                interval=request.data.get('interval'),
+            )
+        except (TypeError, ValueError):
+            return Response({"error": "sample_rate and interval must be numbers"}, status=400)
+        return Response(profiler.state())
@@ -22,12 +22,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend.analytics.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.analytics.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -80,9 +82,96 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Resumable chunked uploads (/api/uploads/)
+UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'upload_parts')  # Partial files, kept out of MEDIA_ROOT so they aren't served
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024  # Part size suggested to clients
+UPLOAD_MAX_CHUNK_BYTES = 64 * 1024 * 1024  # Largest part accepted
+UPLOAD_MAX_BYTES = 20 * 1024 * 1024 * 1024  # Largest file accepted
+UPLOAD_SESSION_TTL_SECONDS = 86400  # Unfinished uploads idle this long are removed by `maintain`
+
+# Bytes read per chunk when streaming videos through /api/stream/
+VIDEO_STREAM_CHUNK_SIZE = 512 * 1024
+
+# Width in pixels of extracted gallery thumbnails (height keeps the aspect ratio)
+THUMBNAIL_WIDTH = 320
+
+# Limits for the ffmpeg/ffprobe subprocesses and remote calls made by the async views
+FFMPEG_MAX_CONCURRENCY = 4
+FFPROBE_TIMEOUT = 30  # seconds
+THUMBNAIL_TIMEOUT = 60  # seconds, includes reading remote URLs
+REMOTE_API_TIMEOUT = 15  # seconds, e.g. the YouTube Data API
+
+# HLS ladder built in the background for every upload. Rungs taller than the
+# source are skipped so nothing is upscaled.
+HLS_RENDITIONS = [
+    {'name': '1080p', 'height': 1080, 'video_bitrate': '5000k', 'audio_bitrate': '192k'},
+    {'name': '720p', 'height': 720, 'video_bitrate': '2800k', 'audio_bitrate': '128k'},
+    {'name': '480p', 'height': 480, 'video_bitrate': '1400k', 'audio_bitrate': '128k'},
+    {'name': '360p', 'height': 360, 'video_bitrate': '800k', 'audio_bitrate': '96k'},
+]
+HLS_SEGMENT_SECONDS = 6
+HLS_MAX_WORKERS = 1  # Concurrent ffmpeg transcodes
+
+# Retention curves are kept at a fixed number of relative-position buckets
+RETENTION_BUCKETS = 100
+RETENTION_TOP_SEGMENTS = 5  # Drop-off and rewatch segments kept per video
+COHORT_POSITIONS = 100  # Relative positions every retention curve is resampled to for cohort comparisons
+COHORT_DURATION_BUCKETS = [60, 300, 1200, 3600]  # Upper bounds (seconds) of the cohort duration buckets
+COHORT_CACHE_SECONDS = 3600  # Cohort results are also invalidated as soon as any engagement changes
+
+# API responses. FastJSONRenderer uses orjson if it is installed; the encoded
+# engagement_data of each video is cached (in the default cache) per engagement_version
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'backend.analytics.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+ENGAGEMENT_JSON_CACHE_SECONDS = 3600  # 0 turns the cache off
+COMPRESSION_MIN_BYTES = 1024  # Smaller responses aren't worth compressing
+COMPRESSION_TYPES = ['application/json']  # Content-type prefixes that are compressed (brotli if installed, else gzip)
+COMPRESSION_GZIP_LEVEL = 4  # 1-9; higher levels cost several times the CPU for a few % on heatmaps
+COMPRESSION_BROTLI_QUALITY = 5  # 0-11; higher is smaller but much slower
+
+# `manage.py maintain` (run it on a schedule, or with --interval). On SQLite, run it once with
+# --enable-incremental-vacuum so it can hand free pages back to the filesystem
+MAINTENANCE_COMPACT_AFTER_DAYS = 30  # Heatmaps of videos idle this long are compacted
+MAINTENANCE_HEATMAP_RESOLUTION = 5  # Seconds per heatmap key after compaction
+MAINTENANCE_SKETCH_DAYS = 90  # Daily unique-viewer sketches older than this are folded into monthly ones
+MAINTENANCE_FILE_GRACE_SECONDS = 3600  # Orphaned media files younger than this are kept (uploads in flight)
+
+# Trending leaderboard: decay window name -> seconds for an event's weight to fall to 1/e
+TRENDING_WINDOWS = {'5m': 300, '1h': 3600, '24h': 86400}
+TRENDING_K = 50  # Largest leaderboard served per window
+TRENDING_CHECKPOINT_SECONDS = 60  # How often the in-memory leaderboards are saved to the DB
+
+# Per-process cache of live stats pushed over WebSockets
+LIVE_CACHE_MAX_VIDEOS = 1000
+LIVE_CACHE_MAX_SECONDS = 2_000_000  # Total heatmap seconds held across all cached videos
+DASHBOARD_MAX_SUBSCRIPTIONS = 500  # Videos one ws/dashboard/ connection may follow
+COUNTER_SHARDS = 8  # Counter rows a hot video's increments are spread over (see analytics/counters.py)
+COUNTER_SHARD_THRESHOLD = 20  # Counter writes per second (per process) that promote a video to sharded counters
+COUNTER_RATE_WINDOW = 10  # Seconds the write rate is measured over
+COUNTER_FOLD_SECONDS = 5  # How often (per process) a hot video's shard heatmaps are folded into its row
+
+# Sampling profiler (analytics/profiling.py), off by default. These are the
+# startup values; admins can change them per process via /api/profiling/
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 0.0  # Fraction of requests and WebSocket messages to profile
+PROFILING_ROUTES = []  # URL names or consumer handlers (e.g. 'EngagementConsumer.receive') always profiled
+PROFILING_INTERVAL = 0.005  # Seconds between stack samples
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')  # Collapsed-stack (.folded) output
+
+# Append-only raw engagement event log, replayable with `manage.py replay_events`
+EVENT_LOG_DIR = os.path.join(BASE_DIR, 'eventlog')
+EVENT_LOG_SEGMENT_BYTES = 64 * 1024 * 1024  # Rotate segments at this size...
+EVENT_LOG_SEGMENT_SECONDS = 3600  # ...or after this long, whichever comes first
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
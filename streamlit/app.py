@@ -1,6 +1,11 @@
 import streamlit as st
 import requests
 import re
+import html
+import json
+import math
+import time
+import hashlib
 import pandas as pd
 import streamlit.components.v1 as components
 
@@ -8,12 +13,24 @@ import streamlit.components.v1 as components
 BACKEND_API_URL = "http://localhost:8000/api"
 BACKEND_WS_URL = "ws://localhost:8000/ws"
 
+# Gallery pagination and the only fields the gallery asks the API for
+GALLERY_PAGE_SIZE = 12
+GALLERY_FIELDS = ['video_id', 'title', 'source', 'thumbnail', 'play_count', 'total_watch_time', 'duration', 'engagement_event_count']
+GALLERY_SOURCES = {'All': None, 'Upload': 'upload', 'Direct link': 'direct', 'YouTube': 'youtube'}
+PLACEHOLDER_THUMBNAIL = "https://via.placeholder.com/200x112?text=No+Thumbnail"
+
+# Chunked uploads: seconds per request and attempts per part before giving up
+UPLOAD_TIMEOUT = 120
+UPLOAD_RETRIES = 5
+
 # --- Page Navigation State ---
 # This is a cleaner way to manage which page is currently viewed.
 if 'page' not in st.session_state:
     st.session_state.page = 'gallery'
 if 'selected_video_id' not in st.session_state:
     st.session_state.selected_video_id = None
+if 'gallery_page' not in st.session_state:
+    st.session_state.gallery_page = 1
 
 # --- Helper Functions ---
 def get_youtube_id(url):
@@ -26,6 +43,72 @@ def get_youtube_id(url):
             return match.group(1)
     return None
 
+def change_gallery_page(step):
+    """Callback for the gallery pager buttons."""
+    st.session_state.gallery_page = max(1, st.session_state.gallery_page + step)
+
+def upload_in_chunks(file, progress):
+    """
+    Sends a file through the resumable upload API one part at a time. The
+    upload ID is kept in the session, so retrying after a failure continues
+    from the server's offset instead of starting over.
+
+    Returns:
+        str: The new video's ID.
+    """
+    key = f"{file.name}:{file.size}"
+    uploads = st.session_state.setdefault('uploads', {})
+    upload = None
+    if key in uploads:
+        res = requests.get(f"{BACKEND_API_URL}/uploads/{uploads[key]}/", timeout=UPLOAD_TIMEOUT)
+        if res.status_code == 200:
+            upload = res.json()
+    if upload is None:
+        res = requests.post(f"{BACKEND_API_URL}/uploads/", json={"filename": file.name, "size": file.size}, timeout=UPLOAD_TIMEOUT)
+        res.raise_for_status()
+        upload = res.json()
+        uploads[key] = upload['upload_id']
+    if upload.get('video_id'):
+        # Completed earlier, but the response never arrived
+        uploads.pop(key, None)
+        return upload['video_id']
+
+    url = f"{BACKEND_API_URL}/uploads/{upload['upload_id']}/"
+    offset, retries = upload['offset'], 0
+    while offset < file.size:
+        file.seek(offset)
+        part = file.read(upload['chunk_size'])
+        headers = {
+            "Upload-Offset": str(offset),
+            "Upload-Checksum": f"sha256 {hashlib.sha256(part).hexdigest()}",
+            "Content-Type": "application/offset+octet-stream",
+        }
+        try:
+            res = requests.put(url, data=part, headers=headers, timeout=UPLOAD_TIMEOUT)
+        except requests.exceptions.RequestException:
+            res = None
+        if res is not None and res.status_code == 200:
+            offset, retries = res.json()['offset'], 0
+            progress.progress(offset / file.size, text=f"Uploading... {offset / file.size:.0%}")
+            continue
+        retries += 1
+        if retries > UPLOAD_RETRIES:
+            if res is None:
+                raise requests.exceptions.ConnectionError("the server stopped responding")
+            raise RuntimeError(res.json().get('error', res.status_code))
+        # Resume from wherever the server says it got to
+        time.sleep(retries)
+        state = requests.get(url, timeout=UPLOAD_TIMEOUT)
+        state.raise_for_status()
+        offset = state.json()['offset']
+
+    progress.progress(1.0, text="Processing...")
+    res = requests.post(f"{url}complete/", timeout=UPLOAD_TIMEOUT)
+    if res.status_code != 200:
+        raise RuntimeError(res.json().get('error', res.status_code))
+    uploads.pop(key, None)
+    return res.json()['video_id']
+
 def navigate_to(page, video_id=None):
     """Callback to change the page in session state. Streamlit reruns automatically."""
     st.session_state.page = page
@@ -43,24 +126,48 @@ def engagement_rate(engagement_event_count, play_count):
 
 # --- Page Rendering Functions ---
 
+def reset_gallery_page():
+    """Callback for the gallery filters: a new search starts from the first page."""
+    st.session_state.gallery_page = 1
+
+@st.cache_data(ttl=10, show_spinner=False)
+def fetch_gallery_page(page, search, source):
+    """Fetches one page of the gallery with only the fields the page displays."""
+    params = {'page': page, 'page_size': GALLERY_PAGE_SIZE, 'fields': ','.join(GALLERY_FIELDS)}
+    if search:
+        params['search'] = search
+    if source:
+        params['source'] = source
+    res = requests.get(f"{BACKEND_API_URL}/videos/", params=params)
+    res.raise_for_status()
+    return res.json()
+
 def render_gallery_page():
-    """Renders the main gallery page with a list of all videos."""
+    """Renders the main gallery page, one page of videos at a time."""
     st.header("🎬 Video Gallery & History")
 
+    filter_col1, filter_col2 = st.columns([3, 1])
+    search = filter_col1.text_input("Search by title or ID", key='gallery_search', on_change=reset_gallery_page)
+    source_label = filter_col2.selectbox("Source", list(GALLERY_SOURCES), key='gallery_source', on_change=reset_gallery_page)
+    source = GALLERY_SOURCES[source_label]
+
     # --- Fetch and Display Videos ---
     try:
-        res = requests.get(f"{BACKEND_API_URL}/videos/")
-        res.raise_for_status()
-        videos = res.json()
+        data = fetch_gallery_page(st.session_state.gallery_page, search, source)
+        videos = data.get('results', [])
+        total_pages = max(1, math.ceil(data.get('count', 0) / GALLERY_PAGE_SIZE))
 
         if not videos:
-            st.info("No videos analyzed yet. Add one using the sidebar!")
+            if search or source:
+                st.info("No videos match your filters.")
+            else:
+                st.info("No videos analyzed yet. Add one using the sidebar!")
             return
 
         st.subheader("📊 Video Performance Comparison")
         comp_data = [
             {
-                'Title': v.get('title', v.get('video_id')),
+                'Title': v.get('title') or v.get('video_id'),
                 'Source': v.get('source', 'N/A').capitalize(),
                 'Plays': v.get('play_count', 0),
                 'Avg. Duration (s)': round(average_watch_duration(v.get('total_watch_time', 0), v.get('play_count', 0)), 2),
@@ -69,18 +176,27 @@ def render_gallery_page():
             } for v in videos
         ]
         st.dataframe(pd.DataFrame(comp_data), use_container_width=True)
+        with st.expander("🔴 Live Monitor"):
+            live_dashboard_component(videos)
         st.divider()
 
         for video in videos:
             col1, col2 = st.columns([1, 4])
             with col1:
-                st.image(video.get("thumbnail") or "https://via.placeholder.com/200x112?text=No+Thumbnail", width=200)
+                # Plain <img> so the browser only loads thumbnails as they scroll into view
+                thumbnail = html.escape(video.get("thumbnail") or PLACEHOLDER_THUMBNAIL, quote=True)
+                st.markdown(f'<img src="{thumbnail}" loading="lazy" width="200" style="border-radius: 4px;">', unsafe_allow_html=True)
             with col2:
                 st.subheader(video.get('title') or video.get('video_id'))
                 st.caption(f"Source: {video.get('source', 'N/A').capitalize()} | ID: {video.get('video_id')}")
                 st.button("View Full Analysis", key=video['video_id'], on_click=navigate_to, args=('detail', video['video_id']))
             st.divider()
 
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        prev_col.button("← Previous", on_click=change_gallery_page, args=(-1,), disabled=st.session_state.gallery_page <= 1)
+        page_col.caption(f"Page {st.session_state.gallery_page} of {total_pages}")
+        next_col.button("Next →", on_click=change_gallery_page, args=(1,), disabled=not data.get('next'))
+
     except requests.exceptions.RequestException as e:
         st.error(f"Connection error: {e}")
 
@@ -123,9 +239,11 @@ def render_detail_page():
         col2.metric("Likes", f"{int(info.get('like_count', 0)):,}")
         col3.metric("Comments", f"{int(info.get('comment_count', 0)):,}")
     else:
-        # CORRECTED: Properly construct the URL for uploaded videos
-        video_url = info.get("path") if source == 'direct' else f"http://localhost:8000/{info.get('path')}"
-        video_player_component(video_url, video_id)
+        # Uploaded files go through the range-aware streaming endpoint so seeks only fetch what they need
+        video_url = info.get("path") if source == 'direct' else f"{BACKEND_API_URL}/stream/{video_id}/"
+        # Switch to adaptive playback once the background transcoder has finished
+        hls_url = f"{BACKEND_API_URL}/hls/{video_id}/master.m3u8" if info.get('hls_status') == 'ready' else None
+        video_player_component(video_url, video_id, hls_url)
         
         st.divider()
         st.subheader("📈 Historical Engagement Dashboard")
@@ -138,25 +256,59 @@ def render_detail_page():
             retention = retention_rate(avg_watch, info.get('duration', 0))
             engage_rate = engagement_rate(info.get('engagement_event_count', 0), play_count)
 
-            col1, col2, col3, col4 = st.columns(4)
+            col1, col2, col3, col4, col5 = st.columns(5)
             col1.metric("Avg. Watch Duration", f"{int(avg_watch)}s")
             col2.metric("Retention Rate", f"{int(retention)}%")
             col3.metric("Total Plays", play_count)
-            col4.metric("Interactions / Play", f"{engage_rate:.2f}")
+            col4.metric("Unique Viewers", f"~{info.get('unique_viewers', 0):,}")
+            col5.metric("Interactions / Play", f"{engage_rate:.2f}")
+            # The engagement chart itself lives in the player component and is kept
+            # current from the WebSocket's heatmap deltas, without rerunning this script
+            render_retention_section(video_id)
+
 
-            df = pd.DataFrame(heatmap_data.items(), columns=['Second', 'Views'])
-            df['Second'] = pd.to_numeric(df['Second'])
-            df = df.sort_values(by='Second').set_index('Second')
-            st.area_chart(df['Views'], use_container_width=True)
+def render_retention_section(video_id):
+    """Shows the backend's precomputed retention curve with its biggest drop-offs and rewatches."""
+    try:
+        res = requests.get(f"{BACKEND_API_URL}/video/{video_id}/retention/")
+        if res.status_code != 200:
+            return
+        retention = res.json()
+    except requests.exceptions.RequestException:
+        return
+
+    st.subheader("📉 Audience Retention")
+    bucket_seconds = retention['bucket_seconds']
+    df = pd.DataFrame({
+        'Second': [round(i * bucket_seconds, 1) for i in range(len(retention['curve']))],
+        'Retention (%)': [value * 100 for value in retention['curve']],
+    }).set_index('Second')
+    st.line_chart(df, use_container_width=True)
+
+    def segments_table(segments):
+        return pd.DataFrame([
+            {'From (s)': seg['start'], 'To (s)': seg['end'], 'Change (%)': round(seg['change'] * 100, 1)}
+            for seg in segments
+        ])
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("Biggest drop-offs")
+        st.dataframe(segments_table(retention['drop_offs']), use_container_width=True, hide_index=True)
+    with col2:
+        st.caption("Most rewatched")
+        st.dataframe(segments_table(retention['rewatches']), use_container_width=True, hide_index=True)
 
 
 # --- Reusable HTML/JS Components ---
-def video_player_component(video_url, video_id):
+def video_player_component(video_url, video_id, hls_url=None):
     websocket_url = f"{BACKEND_WS_URL}/engage/{video_id}/"
+    hls_script = '<script src="https://cdn.jsdelivr.net/npm/hls.js@1"></script>' if hls_url else ''
     component_html = f"""
     <!DOCTYPE html>
     <html>
     <head><title>Player</title>
+        {hls_script}
         <style>
             body {{ margin: 0; background-color: #000; font-family: sans-serif; }}
             .container {{ display: flex; flex-direction: column; gap: 16px; }}
@@ -169,6 +321,9 @@ def video_player_component(video_url, video_id):
             .status {{ font-size: 14px; text-align: center; padding: 8px; border-radius: 8px; color: #fff; }}
             .connected {{ background-color: #1c3b23; color: #d4edda; }}
             .disconnected {{ background-color: #4a2125; color: #f8d7da; }}
+            .heatmap-card {{ border: 1px solid #ffffff; border-radius: 8px; padding: 16px; }}
+            .heatmap-card h3 {{ margin: 0 0 8px 0; font-size: 16px; color: #fafafa; }}
+            #heatmap {{ width: 100%; height: 180px; display: block; }}
         </style>
     </head>
     <body>
@@ -186,35 +341,127 @@ def video_player_component(video_url, video_id):
                 </div>
             </div>
 
-            <div class="video-wrapper"><video id="videoPlayer" controls autoplay><source src="{video_url}" type="video/mp4"></video></div>
+            <div class="video-wrapper"><video id="videoPlayer" controls autoplay></video></div>
+
+            <div class="heatmap-card">
+                <h3>Engagement Heatmap (views per second)</h3>
+                <canvas id="heatmap"></canvas>
+            </div>
         </div>
         <script>
             const video = document.getElementById('videoPlayer');
             const statusDiv = document.getElementById('status');
             const watchTimeEl = document.getElementById('watch-time');
             const revenueEl = document.getElementById('revenue');
+            const heatmapCanvas = document.getElementById('heatmap');
             const websocketUrl = "{websocket_url}";
+            const sourceUrl = "{video_url}";
+            const hlsUrl = "{hls_url or ''}";
             let ws;
 
+            // Stable per-browser ID so the backend can count unique viewers across reconnects
+            const sessionId = (() => {{
+                const fallback = Date.now().toString(36) + Math.random().toString(36).slice(2);
+                try {{
+                    let id = localStorage.getItem('va_session_id');
+                    if (!id) {{ id = (crypto.randomUUID ? crypto.randomUUID() : fallback); localStorage.setItem('va_session_id', id); }}
+                    return id;
+                }} catch (e) {{
+                    return fallback;
+                }}
+            }})();
+
+            // Live heatmap state: a full snapshot arrives on connect, then each live_update
+            // carries only the changed seconds. A gap in seq triggers a resync.
+            const heatmap = new Map();
+            let resolution = 1;  // Seconds per heatmap key (older videos are compacted server-side)
+            let lastSeq = null;
+            let resyncPending = false;
+            let drawScheduled = false;
+
+            function drawHeatmap() {{
+                drawScheduled = false;
+                const width = heatmapCanvas.width = heatmapCanvas.clientWidth;
+                const height = heatmapCanvas.height = heatmapCanvas.clientHeight;
+                const ctx = heatmapCanvas.getContext('2d');
+                ctx.clearRect(0, 0, width, height);
+                let maxSecond = 0, maxViews = 0;
+                for (const [second, views] of heatmap) {{
+                    if (second > maxSecond) maxSecond = second;
+                    if (views > maxViews) maxViews = views;
+                }}
+                if (!maxViews) return;
+                ctx.beginPath();
+                ctx.moveTo(0, height);
+                for (let second = 0; second <= maxSecond; second += resolution) {{
+                    const x = maxSecond ? (second / maxSecond) * width : width;
+                    ctx.lineTo(x, height - ((heatmap.get(second) || 0) / maxViews) * (height - 4));
+                }}
+                ctx.lineTo(width, height);
+                ctx.closePath();
+                ctx.fillStyle = 'rgba(41, 176, 255, 0.6)';
+                ctx.fill();
+            }}
+
+            function scheduleDraw() {{
+                if (!drawScheduled) {{ drawScheduled = true; requestAnimationFrame(drawHeatmap); }}
+            }}
+
+            function applyHeatmap(entries) {{
+                for (const [second, views] of Object.entries(entries)) {{
+                    if (views) heatmap.set(Number(second), views); else heatmap.delete(Number(second));
+                }}
+                scheduleDraw();
+            }}
+
+            function requestResync() {{
+                if (resyncPending || !ws || ws.readyState !== WebSocket.OPEN) return;
+                resyncPending = true;
+                ws.send(JSON.stringify({{ "event": "resync" }}));
+            }}
+
+            // Prefer adaptive HLS (native on Safari, hls.js elsewhere), fall back to the original file
+            if (hlsUrl && video.canPlayType('application/vnd.apple.mpegurl')) {{
+                video.src = hlsUrl;
+            }} else if (hlsUrl && window.Hls && Hls.isSupported()) {{
+                const hls = new Hls();
+                hls.loadSource(hlsUrl);
+                hls.attachMedia(video);
+            }} else {{
+                video.src = sourceUrl;
+            }}
+
             function connect() {{
                 ws = new WebSocket(websocketUrl);
                 ws.onopen = () => {{ statusDiv.textContent = "🟢 Real-Time Connection Active"; statusDiv.className = "status connected"; }};
                 
                 ws.onmessage = (event) => {{
                     const data = JSON.parse(event.data);
-                    if (data.type === 'live_update') {{
+                    if (data.type === 'heatmap_snapshot') {{
+                        heatmap.clear();
+                        resolution = data.resolution || 1;
+                        applyHeatmap(data.heatmap);
+                        lastSeq = data.seq;
+                        resyncPending = false;
+                    }} else if (data.type === 'live_update') {{
                         watchTimeEl.textContent = data.total_watch_time + 's';
                         revenueEl.textContent = '$' + data.predicted_revenue.toFixed(2);
+                        if (lastSeq === null || data.seq !== lastSeq + 1) {{
+                            requestResync();
+                        }} else {{
+                            applyHeatmap(data.heatmap_delta);
+                            lastSeq = data.seq;
+                        }}
                     }}
                 }};
 
-                ws.onclose = () => {{ statusDiv.textContent = "🔴 Disconnected. Retrying..."; statusDiv.className = "status disconnected"; setTimeout(connect, 3000); }};
+                ws.onclose = () => {{ lastSeq = null; resyncPending = false; statusDiv.textContent = "🔴 Disconnected. Retrying..."; statusDiv.className = "status disconnected"; setTimeout(connect, 3000); }};
                 ws.onerror = (error) => {{ console.error("WebSocket Error:", error); ws.close(); }};
             }}
 
             function sendEvent(eventType) {{
                 if (ws && ws.readyState === WebSocket.OPEN) {{
-                    const eventData = {{ "event": eventType, "currentTime": video.currentTime, "duration": video.duration }};
+                    const eventData = {{ "event": eventType, "currentTime": video.currentTime, "duration": video.duration, "sessionId": sessionId }};
                     ws.send(JSON.stringify(eventData));
                     console.log("Sent event:", eventType);
                 }}
@@ -230,13 +477,14 @@ def video_player_component(video_url, video_id):
             video.addEventListener('play', () => sendEvent('play'));
             video.addEventListener('pause', () => sendEvent('pause'));
             video.addEventListener('seeked', () => sendEvent('seeked'));
+            window.addEventListener('resize', scheduleDraw);
 
             connect();
         </script>
     </body>
     </html>
     """
-    components.html(component_html, height=750)
+    components.html(component_html, height=1000)
 
 def youtube_player_component(youtube_id):
     websocket_url = f"{BACKEND_WS_URL}/engage/{youtube_id}/"
@@ -246,6 +494,18 @@ def youtube_player_component(youtube_id):
     <script>
       var player;
       var ws;
+
+      // Stable per-browser ID so the backend can count unique viewers across reconnects
+      const sessionId = (() => {{
+          const fallback = Date.now().toString(36) + Math.random().toString(36).slice(2);
+          try {{
+              let id = localStorage.getItem('va_session_id');
+              if (!id) {{ id = (crypto.randomUUID ? crypto.randomUUID() : fallback); localStorage.setItem('va_session_id', id); }}
+              return id;
+          }} catch (e) {{
+              return fallback;
+          }}
+      }})();
       
       function connectWebSocket() {{
           ws = new WebSocket('{websocket_url}');
@@ -259,7 +519,8 @@ def youtube_player_component(youtube_id):
           const eventData = {{
             "event": eventType,
             "currentTime": player.getCurrentTime(),
-            "duration": player.getDuration()
+            "duration": player.getDuration(),
+            "sessionId": sessionId
           }};
           ws.send(JSON.stringify(eventData));
           console.log("Sent YouTube Event:", eventType);
@@ -298,6 +559,50 @@ def youtube_player_component(youtube_id):
     '''
     components.html(component_html, height=400)
 
+def live_dashboard_component(videos):
+    """Live watch time and revenue for every video on the page over one shared socket."""
+    websocket_url = f"{BACKEND_WS_URL}/dashboard/"
+    tiles = {v['video_id']: v.get('title') or v['video_id'] for v in videos}
+    # Titles are user data, so keep them from closing the script tag
+    tiles_json = json.dumps(tiles).replace("</", "<\\/")
+    component_html = f'''
+    <div id="tiles" style="display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 8px; font-family: sans-serif;"></div>
+    <script>
+      const videos = {tiles_json};
+      const container = document.getElementById('tiles');
+      const cells = {{}};
+      for (const [videoId, title] of Object.entries(videos)) {{
+          const tile = document.createElement('div');
+          tile.style.cssText = 'border: 1px solid #ddd; border-radius: 4px; padding: 8px;';
+          tile.innerHTML = '<div style="font-weight: bold; overflow: hidden; text-overflow: ellipsis; white-space: nowrap;"></div>'
+              + '<div>Watch time: <span class="watch">–</span> s</div>'
+              + '<div>Predicted revenue: $<span class="revenue">–</span></div>';
+          tile.firstChild.textContent = title;
+          container.appendChild(tile);
+          cells[videoId] = tile;
+      }}
+
+      function connect() {{
+          const ws = new WebSocket('{websocket_url}');
+          // The server sends every subscribed video on the first tick, then only the ones that change
+          ws.onopen = () => ws.send(JSON.stringify({{action: 'subscribe', video_ids: Object.keys(videos)}}));
+          ws.onmessage = (event) => {{
+              const data = JSON.parse(event.data);
+              if (data.type !== 'live_update') return;
+              for (const [videoId, stats] of Object.entries(data.videos)) {{
+                  const tile = cells[videoId];
+                  if (!tile) continue;
+                  tile.querySelector('.watch').textContent = stats.total_watch_time;
+                  tile.querySelector('.revenue').textContent = stats.predicted_revenue.toFixed(2);
+              }}
+          }};
+          ws.onclose = () => setTimeout(connect, 3000);
+      }}
+      connect();
+    </script>
+    '''
+    components.html(component_html, height=120 * math.ceil(len(tiles) / 3) + 20)
+
 
 # --- Main App Router ---
 st.set_page_config(layout="wide")
@@ -313,13 +618,13 @@ with st.sidebar:
     with upload_expander:
         file = st.file_uploader("Upload a video file", type=["mp4", "mov", "avi"], label_visibility="collapsed")
         if file and st.button("Analyze Uploaded Video"):
-            with st.spinner("Uploading..."):
-                files = {"video": (file.name, file.getvalue(), file.type)}
-                res = requests.post(f"{BACKEND_API_URL}/upload/", files=files)
-                if res.status_code == 200:
-                    navigate_to('detail', res.json()['video_id'])
-                else:
-                    st.error("Upload failed.")
+            try:
+                video_id = upload_in_chunks(file, st.progress(0.0, text="Uploading..."))
+                navigate_to('detail', video_id)
+            except requests.exceptions.RequestException as e:
+                st.error(f"Upload failed: {e}. Click again to resume.")
+            except RuntimeError as e:
+                st.error(f"Upload failed: {e}")
 
     direct_link_expander = st.expander("Analyze by Direct Link")
     with direct_link_expander: